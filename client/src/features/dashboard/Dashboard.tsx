@@ -243,7 +243,7 @@ export default function Dashboard() {
                     Toggle fetching
                   </Label>
                   <InfoIcon
-                    tooltipContent="Collects new article data from feeds every 5 minutes."
+                    tooltipContent="Collects new article data from each feed as often as it publishes, between 2 minutes and 6 hours."
                     ariaLabel="Fetcher info"
                   />
                   <div className="mx-2 h-6 w-px bg-gray-200 dark:bg-gray-700" />
@@ -19,8 +19,9 @@ export default function InfoAccordion({
           <AccordionTrigger>How does the collector work?</AccordionTrigger>
           <AccordionContent>
             The news feed article collector automatically gathers articles from
-            the RSS feeds you've added to the list, checking for new content
-            every 5 minutes once activated. You can view statistics of the
+            the RSS feeds you've added to the list once activated, checking
+            busy feeds every few minutes and quiet feeds less often. You can
+            view statistics of the
             article data and also export the data as a{' '}
             <a
               className="opacity-50 hover:underline hover:opacity-100"
@@ -62,8 +63,9 @@ export default function InfoAccordion({
               </li>
               <li>
                 <strong>Toggle fetching:</strong> Activate fetching of articles
-                in the added feeds. The backend will check for new articles every
-                5 minutes, even when not using the site.
+                in the added feeds. The backend will keep checking each feed for
+                new articles at a pace matching how often it publishes, even when
+                not using the site.
               </li>
               <li>
                 <strong>Results:</strong> After fetching, you can:
@@ -119,8 +121,9 @@ export default function InfoAccordion({
               URL and time.
             </p>
             <p className="mt-2">
-              Advanced search overrides general search. In the advanced search,
-              the inputs are split for each data type, also enabling HTML searches.
+              Advanced search is combined with general search, so articles have
+              to match both. In the advanced search, the inputs are split for each
+              data type, also enabling HTML searches.
               Time is split into start and end time, and inputs for these need to
               be in the format YYYY-MM-DD HH:MM:SS, also allowing the input of
               partial values like YYYY-MM or YYYY-MM-DD HH.
@@ -129,12 +132,19 @@ export default function InfoAccordion({
               You can use the AND, OR and NOT boolean operators to refine your
               search, although spaces between words are automatically treated as
               AND. Queries for specific phrases happen by encasing them in
-              quotation marks.
+              quotation marks, and parentheses group terms.
             </p>
             <p className="mt-2">
-              You can do wildcard searches with _ (matches any character) and %
-              (matches any sequence of 0+ characters). You can escape % and _
-              with ESC: ESC%.
+              Words in the full text and general searches are matched from
+              their start, not anywhere inside other words: sota finds Sota and
+              Sotaveteraani but not Maailmansota. URL searches and terms with
+              other characters than letters and numbers, like blabla.com/news,
+              still match anywhere. When the server has substring search turned
+              on, all terms of three or more characters match anywhere in the
+              text, so sota also finds Maailmansota. You can do wildcard
+              searches with _ (matches any character) and % (matches any
+              sequence of 0+ characters), for example %kirjoit% for parts of
+              words. You can escape % and _ with ESC: ESC%.
             </p>
             <p className="mt-2">
               Additionally, sometimes the full texts of the articles aren't
@@ -156,6 +166,7 @@ export default function InfoAccordion({
               <li>forest fire smoke</li>
               <li>forest fire OR forest smoke</li>
               <li>fire smoke NOT game</li>
+              <li>forest (fire OR smoke) NOT (game OR movie)</li>
               <li>"forest fire"</li>
               <li>NOT NOTEXT</li>
               <li>" oulu" OR oulu NOT koulu NOT joulu</li>
@@ -19,6 +19,7 @@ interface SearchResponse {
   data: Article[];
   total_count: number;
   page: number;
+  result: string | null;
 }
 
 export default function Search() {
@@ -53,7 +54,7 @@ export default function Search() {
       };
       const response: SearchResponse = await sendSearchQuery(updatedParams);
       setSearchState(
-        updatedParams,
+        { ...updatedParams, result: response.result ?? undefined },
         response.data,
         response.total_count,
         response.page
@@ -80,7 +81,7 @@ export default function Search() {
 
   // Download function
   const handleDownload = (format: 'json' | 'csv' | 'parquet') => {
-    handleArticleDownload(format, true, setIsDisabled);
+    handleArticleDownload(format, true, setIsDisabled, searchParams.result);
   };
 
   // Clear function
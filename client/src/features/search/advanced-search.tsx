@@ -27,6 +27,8 @@ export interface SearchParams {
   per_page?: number;
   sort_by?: string;
   sort_order?: 'asc' | 'desc';
+  // handle of the search's result set on the server
+  result?: string;
 }
 
 interface AdvancedSearchProps {
@@ -24,8 +24,11 @@ import {
 } from '@/services/database-queries';
 import { DomainData } from '@/components/ui/drawer';
 import StatisticsDrawers from './statistics-drawers';
+import { useSearchContext } from '@/features/search/use-search-context';
 
 export default function Statistics() {
+  // filtered statistics are those of the latest search's result set
+  const { searchParams } = useSearchContext();
   const [filteredStatisticData, setFilteredStatisticsData] = useState<
     DomainData[][]
   >([]);
@@ -39,7 +42,7 @@ export default function Statistics() {
   const handleFetchStatistics = async () => {
     setIsDisabled(true);
     try {
-      const data = await sendStatisticsQuery(true);
+      const data = await sendStatisticsQuery(true, searchParams.result);
       setFilteredStatisticsData(data);
     } catch (error) {
       console.error('Failed to fetch filtered statistics:', error);
@@ -53,7 +56,7 @@ export default function Statistics() {
     setIsDisabled(true);
     setIsWordCloudLoading(true);
     try {
-      const data = await sendTextQuery(true);
+      const data = await sendTextQuery(true, searchParams.result);
       setFilteredTextData(
         data.map((x: Map<string, string>) => Object.values(x)[0])
       );
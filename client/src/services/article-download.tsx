@@ -12,7 +12,8 @@ function formatFileSize(bytes: number): string {
 export const handleArticleDownload = async (
   format: 'json' | 'csv' | 'parquet',
   isQuery: boolean = false,
-  setIsDisabled: (value: boolean) => void
+  setIsDisabled: (value: boolean) => void,
+  result?: string
 ) => {
   toast.dismiss();
   setIsDisabled(true);
@@ -23,7 +24,9 @@ export const handleArticleDownload = async (
 
   try {
     const endpoint = isQuery ? '/api/articles/export_query' : '/api/articles/export';
-    const response = await authClient.get(`${endpoint}?format=${format}`, {
+    // a query export has the articles of the search's result set
+    const resultParam = isQuery && result ? `&result=${encodeURIComponent(result)}` : '';
+    const response = await authClient.get(`${endpoint}?format=${format}${resultParam}`, {
       responseType: 'blob',
       onDownloadProgress: (progressEvent) => {
         if (progressEvent.loaded < 100) {
@@ -11,6 +11,8 @@ export interface SearchParams {
   per_page?: number;
   sort_by?: string;
   sort_order?: 'asc' | 'desc';
+  // handle of the search's result set on the server
+  result?: string;
 }
 
 export const sendSearchQuery = async (params: Partial<SearchParams>) => {
@@ -23,10 +25,10 @@ export const sendSearchQuery = async (params: Partial<SearchParams>) => {
   }
 };
 
-export const sendStatisticsQuery = async (filtered: boolean) => {
+export const sendStatisticsQuery = async (filtered: boolean, result?: string) => {
   try {
     const response = await authClient.get('/api/articles/statistics', {
-      params: { filtered: filtered }
+      params: { filtered: filtered, result: result }
     });
     return response.data;
   } catch (error) {
@@ -35,10 +37,10 @@ export const sendStatisticsQuery = async (filtered: boolean) => {
   }
 };
 
-export const sendTextQuery = async (filtered: boolean) => {
+export const sendTextQuery = async (filtered: boolean, result?: string) => {
   try {
     const response = await authClient.get('/api/articles/full_text', {
-      params: { filtered: filtered }
+      params: { filtered: filtered, result: result }
     });
     return response.data;
   } catch (error) {
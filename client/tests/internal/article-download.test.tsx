@@ -64,4 +64,13 @@ describe('handleArticleDownload', () => {
     expect(toast.loading).toHaveBeenCalled();
     expect(authClient.get).toHaveBeenCalledWith('/api/articles/export_query?format=json', expect.any(Object));
   });
+
+  it('should export the result set of a search', async () => {
+    await handleArticleDownload('csv', true, mockSetIsDisabled, 'abc-123');
+
+    expect(authClient.get).toHaveBeenCalledWith(
+      '/api/articles/export_query?format=csv&result=abc-123',
+      expect.any(Object)
+    );
+  });
 });
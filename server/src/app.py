@@ -10,6 +10,7 @@ from src.config import Config, TestConfig
 from src.utils import resource_management
 from src.utils.log_config import setup_logging
 from src.routes import init_routes
+from src.views.data_acquisition.feed_manager import init_feed_registry
 
 def create_app(testing=False):
     """
@@ -40,6 +41,10 @@ def create_app(testing=False):
     # db engine
     with app.app_context():
         resource_management.init_db_engine(app)
+        resource_management.init_db_schema(app)
+        init_feed_registry(app)
+        resource_management.init_db_coordinator(app)
+        resource_management.init_search_cache(app)
 
     # routes
     init_routes(app)
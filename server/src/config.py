@@ -1,8 +1,9 @@
 """
 Sets basic or testing config for the app.
 """
-# pylint: disable=invalid-name
+# pylint: disable=invalid-name, too-many-instance-attributes
 import os
+import socket
 import secrets
 from datetime import timedelta
 from dataclasses import dataclass
@@ -19,6 +20,46 @@ class Config:
     REREGISTER_SECRET_KEY: str = secrets.token_hex(32)
     REREGISTER_TOKEN_EXPIRES: int = 3600
     SMTP_SENDER = os.environ.get('SMTP_SENDER')
+    FETCH_MAX_WORKERS: int = int(os.environ.get('FETCH_MAX_WORKERS', 16))
+    FETCH_PER_HOST_LIMIT: int = int(os.environ.get('FETCH_PER_HOST_LIMIT', 2))
+    FETCH_TIMEOUT: int = int(os.environ.get('FETCH_TIMEOUT', 15))
+    POLL_TICK_SECONDS: int = int(os.environ.get('POLL_TICK_SECONDS', 60))
+    POLL_MIN_INTERVAL: int = int(os.environ.get('POLL_MIN_INTERVAL', 120))
+    POLL_MAX_INTERVAL: int = int(os.environ.get('POLL_MAX_INTERVAL', 6 * 60 * 60))
+    POLL_DEFAULT_INTERVAL: int = int(os.environ.get('POLL_DEFAULT_INTERVAL', 300))
+    # 0 sizes the extraction process pool by the container's CPU quota
+    EXTRACT_WORKERS: int = int(os.environ.get('EXTRACT_WORKERS', 0))
+    EXTRACT_BATCH_SIZE: int = int(os.environ.get('EXTRACT_BATCH_SIZE', 50))
+    FETCH_HISTORY_KEEP_RUNS: int = int(os.environ.get('FETCH_HISTORY_KEEP_RUNS', 2000))
+    # wall-clock budgets in seconds, a cycle overrunning its budget by the grace is killed
+    CYCLE_TIME_BUDGET: int = int(os.environ.get('CYCLE_TIME_BUDGET', 15 * 60))
+    CYCLE_KILL_GRACE: int = int(os.environ.get('CYCLE_KILL_GRACE', 60))
+    # exports queue for at most the timeout when the database isn't in WAL mode
+    EXPORT_WAIT_TIMEOUT: int = int(os.environ.get('EXPORT_WAIT_TIMEOUT', 30 * 60))
+    EXPORT_LEASE_SECONDS: int = int(os.environ.get('EXPORT_LEASE_SECONDS', 60 * 60))
+    # search result sets that statistics and exports refer to are kept this long after last use
+    SEARCH_RESULT_SECONDS: int = int(os.environ.get('SEARCH_RESULT_SECONDS', 24 * 60 * 60))
+    # entries of the search and statistics cache, 0 turns it off
+    SEARCH_CACHE_SIZE: int = int(os.environ.get('SEARCH_CACHE_SIZE', 256))
+    # a trigram index finding words and URLs by any part of them, built at start and by the
+    # collection cycle, takes about 4 to 5 times the space of the articles' text
+    # (205 MB grew to 977 MB at 50k articles) and a while to build for existing articles
+    SEARCH_SUBSTRINGS: bool = os.environ.get('SEARCH_SUBSTRINGS', 'false').lower() == 'true'
+    FEED_TIME_BUDGET: int = int(os.environ.get('FEED_TIME_BUDGET', 120))
+    # feeds failing this many polls in a row are disabled, and probed to re-enable them
+    FEED_DISABLE_AFTER: int = int(os.environ.get('FEED_DISABLE_AFTER', 5))
+    FEED_VALIDATE_BUDGET: int = int(os.environ.get('FEED_VALIDATE_BUDGET', 30))
+    FEED_PROBE_INTERVAL: int = int(os.environ.get('FEED_PROBE_INTERVAL', 6 * 60 * 60))
+    # replicas sharing the database split the feeds through leases when sharding is on,
+    # the instance name must be unique, such as the pod name
+    COLLECTOR_SHARDING: bool = os.environ.get('COLLECTOR_SHARDING', 'false').lower() == 'true'
+    COLLECTOR_INSTANCE: str = os.environ.get('COLLECTOR_INSTANCE', socket.gethostname())
+    FEED_LEASE_SECONDS: int = int(os.environ.get('FEED_LEASE_SECONDS', 20 * 60))
+    # below these collecting stores no HTML or pauses, memory is a fraction of the cgroup limit
+    GUARD_HTML_FREE_DISK_MB: int = int(os.environ.get('GUARD_HTML_FREE_DISK_MB', 1000))
+    GUARD_MIN_FREE_DISK_MB: int = int(os.environ.get('GUARD_MIN_FREE_DISK_MB', 200))
+    GUARD_MEMORY_THROTTLE: float = float(os.environ.get('GUARD_MEMORY_THROTTLE', 0.8))
+    GUARD_MEMORY_PAUSE: float = float(os.environ.get('GUARD_MEMORY_PAUSE', 0.95))
 
 @dataclass
 class TestConfig(Config):
@@ -26,3 +67,4 @@ class TestConfig(Config):
     TESTING: bool = True
     FETCHER_FOLDER: str = os.path.join(Config.SERVER_ROOT, 'test-rss-fetcher')
     DATABASE_URL: str = 'sqlite:///:memory:'
+    SEARCH_SUBSTRINGS: bool = True
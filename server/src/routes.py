@@ -12,13 +12,13 @@ from src.views.administration import (
     status_stream
 )
 from src.views.data_acquisition import feed_manager, content_fetcher
-from src.views.data_analysis import query_processor, stats_analyzer
+from src.views.data_analysis import query_processor, stats_analyzer, article_history
 from src.views.data_export import export_manager
 
 def init_routes(app):
     """
     Configures the basic routes for the app. Used by create_app().
-    The index, 9 admin/user and 11 article data related.
+    The index, 9 admin/user and 20 article data related.
     """
     log_file_path = app.config['LOG_FILE_PATH']
 
@@ -99,6 +99,48 @@ def init_routes(app):
         jwt_required_conditional(feed_manager.set_feed_urls),
         methods=['POST']
     )
+    app.add_url_rule(
+        '/api/feeds',
+        'get_feeds',
+        jwt_required_conditional(feed_manager.get_feeds),
+        methods=['GET']
+    )
+    app.add_url_rule(
+        '/api/feeds',
+        'add_feeds',
+        jwt_required_conditional(feed_manager.add_feeds),
+        methods=['POST']
+    )
+    app.add_url_rule(
+        '/api/feeds/<int:feed_id>',
+        'update_feed',
+        jwt_required_conditional(feed_manager.update_feed),
+        methods=['PATCH']
+    )
+    app.add_url_rule(
+        '/api/feeds/<int:feed_id>',
+        'remove_feed',
+        jwt_required_conditional(feed_manager.remove_feed),
+        methods=['DELETE']
+    )
+    app.add_url_rule(
+        '/api/feeds/import',
+        'import_feeds',
+        jwt_required_conditional(feed_manager.import_feeds),
+        methods=['POST']
+    )
+    app.add_url_rule(
+        '/api/feeds/export',
+        'export_feeds',
+        jwt_required_conditional(feed_manager.export_feeds),
+        methods=['GET']
+    )
+    app.add_url_rule(
+        '/api/feeds/validate',
+        'validate_feeds',
+        jwt_required_conditional(feed_manager.validate_feed_list),
+        methods=['POST']
+    )
     app.add_url_rule(
         '/api/start',
         'start_fetch',
@@ -117,6 +159,12 @@ def init_routes(app):
         jwt_required_conditional(content_fetcher.get_fetch_status),
         methods=['GET']
     )
+    app.add_url_rule(
+        '/api/fetch_history',
+        'get_fetch_history',
+        jwt_required_conditional(content_fetcher.get_fetch_history),
+        methods=['GET']
+    )
     app.add_url_rule(
         '/api/articles/search',
         'get_search_results',
@@ -135,6 +183,12 @@ def init_routes(app):
         jwt_required_conditional(stats_analyzer.get_text),
         methods=['GET']
     )
+    app.add_url_rule(
+        '/api/articles/<int:article_id>/revisions',
+        'get_article_revisions',
+        jwt_required_conditional(article_history.get_article_revisions),
+        methods=['GET']
+    )
     app.add_url_rule(
         '/api/data_size',
         'get_data_size',
@@ -0,0 +1,229 @@
+"""
+This handles the long-lived collector worker process. Rather than starting a fresh
+interpreter every cycle, the worker is spawned once, keeps the collector's imports
+(newspaper, nltk, database engines) warm and runs cycles on command, sending
+structured results back over a pipe. While a cycle runs, it can send progress
+updates over the same pipe with report_progress(). A running cycle can be
+cancelled, and a watchdog kills one that overruns its time limit, together with the
+extraction processes it started, so the collection slot always comes back.
+A killed cycle isn't undone: the articles, extraction batches and moved HTML it
+had committed stay, each batch with the watermark it advanced, and only the batch
+in progress is rolled back by SQLite and done again by the next cycle.
+Used by content_fetcher.py.
+"""
+import os
+import time
+import atexit
+import signal
+import threading
+import importlib
+import traceback
+import multiprocessing
+# imported up front so its exit handler is registered before, and so runs after, ours
+import multiprocessing.util
+
+# spawn rather than fork, since the server process has scheduler and request threads
+_mp_context = multiprocessing.get_context('spawn')
+
+# the worker's end of the pipe is set only inside the worker process
+_reporter = {'conn': None, 'phase': None, 'sent_at': 0.0}
+PROGRESS_INTERVAL = 0.5
+
+class CollectorWorkerError(RuntimeError):
+    """Raised when the worker process dies, can't be reached or the cycle raised."""
+
+class CycleInterrupted(CollectorWorkerError):
+    """Raised when a running cycle was cancelled or killed for overrunning its time limit."""
+
+class CollectorWorker:
+    """
+    Supervisor of the single collector worker process. The worker is started lazily
+    on the first cycle and restarted if it has died in between cycles.
+    """
+    def __init__(self):
+        self._process = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+
+    def is_alive(self):
+        """Whether the worker process is currently running."""
+        return self._process is not None and self._process.is_alive()
+
+    @property
+    def pid(self):
+        """Worker process id, None if not running."""
+        process = self._process
+        return process.pid if process is not None and process.is_alive() else None
+
+    def start(self):
+        """Starts the worker process if not already running. Called with the lock held."""
+        if self.is_alive():
+            return
+        self._stop()
+
+        parent_conn, child_conn = _mp_context.Pipe()
+        self._process = _mp_context.Process(
+            target=_worker_main,
+            args=(child_conn,),
+            name='collector-worker',
+            # not a daemon, since daemonic processes can't start the extraction pool
+            daemon=False
+        )
+        self._process.start()
+        child_conn.close()
+        self._conn = parent_conn
+
+    def stop(self, timeout=5):
+        """
+        Stops the worker, interrupting the running cycle if there is one. A running
+        cycle sees the cancel within a second, kills the worker's process group and
+        gives up the lock. An idle worker is asked to exit, its process group being
+        killed if it doesn't within the timeout.
+        """
+        self._cancel.set()
+        with self._lock:
+            try:
+                self._stop(timeout)
+            finally:
+                self._cancel.clear()
+
+    def cancel(self):
+        """
+        Interrupts the running cycle, if any, by killing the worker right away.
+        What survives the kill is described at the top of the module.
+        """
+        self.stop(timeout=0)
+
+    def _stop(self, timeout=5):
+        """Asks the worker to exit, killing it if it doesn't. Called with the lock held."""
+        if self._process is None:
+            return
+        try:
+            if self._process.is_alive():
+                self._conn.send({'command': 'stop'})
+                self._process.join(timeout)
+        except (OSError, EOFError, BrokenPipeError):
+            pass
+        finally:
+            if self._process.is_alive():
+                self._kill()
+            self._conn.close()
+            self._process = None
+            self._conn = None
+
+    def _kill(self, timeout=5):
+        """
+        Kills the worker together with the extraction processes it started,
+        which share its process group.
+        """
+        try:
+            os.killpg(self._process.pid, signal.SIGKILL)
+        except (AttributeError, ProcessLookupError, PermissionError):
+            # not yet in its own group, or no process groups on this platform
+            self._process.kill()
+        self._process.join(timeout)
+
+    def run_cycle(self, target, on_progress=None, time_limit=None, **kwargs):
+        """
+        Calls target, a 'module:function' path, with kwargs in the worker and
+        returns its result, which has to be picklable. on_progress is called
+        with each progress dict the target reports meanwhile. A cycle running longer
+        than time_limit seconds, or cancelled, is killed and raises CycleInterrupted.
+        """
+        with self._lock:
+            self.start()
+            deadline = time.monotonic() + time_limit if time_limit else None
+            try:
+                self._conn.send({'command': 'run_cycle', 'target': target, 'kwargs': kwargs})
+                reply = self._receive(on_progress, deadline)
+            except (OSError, EOFError) as e:
+                self._stop()
+                raise CollectorWorkerError(f"Collector worker unreachable: {e}") from e
+
+        if reply['status'] == 'error':
+            raise CollectorWorkerError(f"Cycle failed in collector worker:\n{reply['error']}")
+        return reply['result']
+
+    def _receive(self, on_progress=None, deadline=None):
+        """
+        Waits for the reply, passing on progress updates as they arrive and
+        noticing if the worker dies, is cancelled or overruns the deadline meanwhile.
+        """
+        while True:
+            if self._cancel.is_set():
+                self._cancel.clear()
+                self._stop(timeout=0)
+                raise CycleInterrupted("Cycle cancelled, collector worker stopped")
+            if deadline is not None and time.monotonic() >= deadline:
+                self._stop(timeout=0)
+                raise CycleInterrupted("Cycle exceeded its time limit, collector worker killed")
+            try:
+                if self._conn.poll(1):
+                    message = self._conn.recv()
+                    if message['status'] != 'progress':
+                        return message
+                    if on_progress is not None:
+                        on_progress(message['progress'])
+                    continue
+            except EOFError:
+                self._process.join(5)
+            if not self._process.is_alive():
+                exitcode = self._process.exitcode
+                self._stop()
+                raise CollectorWorkerError(
+                    f"Collector worker exited unexpectedly with code {exitcode}"
+                )
+
+def report_progress(phase, force=False, **counts):
+    """
+    Sends the running cycle's progress to the server process. Updates within the
+    same phase are sent at most every PROGRESS_INTERVAL seconds unless forced, so
+    frequent calls stay cheap. Does nothing outside the worker process.
+    """
+    if _reporter['conn'] is None:
+        return
+    now = time.monotonic()
+    if (not force and phase == _reporter['phase']
+            and now - _reporter['sent_at'] < PROGRESS_INTERVAL):
+        return
+    _reporter.update(phase=phase, sent_at=now)
+    _reporter['conn'].send({'status': 'progress', 'progress': {'phase': phase, **counts}})
+
+def _worker_main(conn):
+    """
+    Worker process loop. Targets are imported on first use and then stay imported,
+    which is what keeps later cycles cheap.
+    """
+    _reporter['conn'] = conn
+    if hasattr(os, 'setpgrp'):
+        # its own process group, so that the watchdog can kill its pool processes too
+        os.setpgrp()
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+
+        if message.get('command') == 'stop':
+            break
+        if message.get('command') == 'run_cycle':
+            _reporter['phase'] = None
+            try:
+                result = resolve_target(message['target'])(**message['kwargs'])
+                reply = {'status': 'done', 'result': result}
+            except Exception:
+                reply = {'status': 'error', 'error': traceback.format_exc()}
+            conn.send(reply)
+
+    conn.close()
+
+def resolve_target(target):
+    """Imports 'module:function' and returns the function."""
+    module_name, function_name = target.split(':', 1)
+    return getattr(importlib.import_module(module_name), function_name)
+
+# used in content_fetcher.py
+collector_worker = CollectorWorker()
+# runs before multiprocessing's own exit handler, which would wait for the worker forever
+atexit.register(collector_worker.stop)
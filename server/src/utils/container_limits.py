@@ -0,0 +1,102 @@
+"""
+This reads the resource limits of the container the app runs in. On Rahti the pod's
+CPU quota is much lower than the host's CPU count that os.cpu_count() reports,
+so pool sizes are based on the cgroup quota instead. The cgroup memory limit and
+usage, and the free space of the data volume, are read for resource_guard.py.
+Used by collection_cycle.py and resource_guard.py.
+"""
+import os
+import math
+import shutil
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+def _read(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def cpu_quota(cgroup_root=CGROUP_ROOT):
+    """
+    Returns the cgroup CPU quota in CPUs (for example 1.5), None if unlimited
+    or unknown. Reads cgroup v2 cpu.max and falls back to cgroup v1.
+    """
+    cpu_max = _read(os.path.join(cgroup_root, 'cpu.max'))
+    if cpu_max:
+        quota, _, period = cpu_max.partition(' ')
+        if quota != 'max' and period:
+            return int(quota) / int(period)
+        return None
+
+    quota = _read(os.path.join(cgroup_root, 'cpu', 'cpu.cfs_quota_us'))
+    period = _read(os.path.join(cgroup_root, 'cpu', 'cpu.cfs_period_us'))
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+def cpu_limit(cgroup_root=CGROUP_ROOT):
+    """Number of CPUs the process can actually keep busy, at least 1."""
+    if hasattr(os, 'sched_getaffinity'):
+        count = len(os.sched_getaffinity(0))
+    else:
+        count = os.cpu_count() or 1
+    quota = cpu_quota(cgroup_root)
+    if quota:
+        count = min(count, math.floor(quota))
+    return max(1, count)
+
+def worker_count(configured=0, cgroup_root=CGROUP_ROOT):
+    """
+    Pool size for CPU-bound work: the configured count capped by the CPU limit,
+    or the CPU limit itself if configured is 0.
+    """
+    limit = cpu_limit(cgroup_root)
+    if configured and configured > 0:
+        return min(configured, limit)
+    return limit
+
+def memory_limit(cgroup_root=CGROUP_ROOT):
+    """
+    Returns the cgroup memory limit in bytes, None if unlimited or unknown.
+    Reads cgroup v2 memory.max and falls back to cgroup v1.
+    """
+    limit = _read(os.path.join(cgroup_root, 'memory.max'))
+    if limit is None:
+        limit = _read(os.path.join(cgroup_root, 'memory', 'memory.limit_in_bytes'))
+    if not limit or limit == 'max':
+        return None
+    # cgroup v1 reports no limit as a huge page-aligned number
+    if int(limit) >= 2 ** 62:
+        return None
+    return int(limit)
+
+def memory_usage(cgroup_root=CGROUP_ROOT):
+    """
+    Returns the cgroup's working set in bytes, None if unknown. Like the kubelet,
+    it leaves out inactive page cache, which the kernel can reclaim at will.
+    """
+    usage = _read(os.path.join(cgroup_root, 'memory.current'))
+    stat = _read(os.path.join(cgroup_root, 'memory.stat'))
+    inactive_key = 'inactive_file'
+    if usage is None:
+        usage = _read(os.path.join(cgroup_root, 'memory', 'memory.usage_in_bytes'))
+        stat = _read(os.path.join(cgroup_root, 'memory', 'memory.stat'))
+        inactive_key = 'total_inactive_file'
+    if usage is None:
+        return None
+
+    inactive = 0
+    for line in (stat or '').splitlines():
+        key, _, value = line.partition(' ')
+        if key == inactive_key:
+            inactive = int(value)
+    return max(0, int(usage) - inactive)
+
+def free_disk(path):
+    """Free bytes on the volume of the path, None if it can't be read."""
+    try:
+        return shutil.disk_usage(path).free
+    except OSError:
+        return None
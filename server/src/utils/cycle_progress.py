@@ -0,0 +1,34 @@
+"""
+This holds the progress of the running collection cycle and the summary of the
+last finished one, as reported by the collector worker. Used by content_fetcher.py
+and status_stream.py.
+"""
+class CycleProgress:
+    """
+    Shared class of cycle progress in the app process. Progress is
+    a dict with the phase ('collecting' or 'processing') and its counts, None
+    between cycles.
+    """
+    _progress = None
+    _summary = None
+
+    @classmethod
+    def set_progress(cls, progress):
+        """Sets the running cycle's progress. Used by content_fetcher.py."""
+        cls._progress = progress
+
+    @classmethod
+    def get_progress(cls):
+        """Gets the running cycle's progress. Used by status_stream.py."""
+        return cls._progress
+
+    @classmethod
+    def finish(cls, summary):
+        """Stores the finished cycle's summary and clears progress. Used by content_fetcher.py."""
+        cls._summary = summary
+        cls._progress = None
+
+    @classmethod
+    def get_summary(cls):
+        """Gets the last finished cycle's summary. Used by status_stream.py."""
+        return cls._summary
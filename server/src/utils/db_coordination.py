@@ -0,0 +1,252 @@
+"""
+This coordinates the readers and writers of the database, replacing the processing
+status flag that exports polled and that only the app process could see. Leases are
+rows of the db_leases table, so every process using the database sees them: the
+collection cycle of each collector instance holds a write lease and exports hold
+read leases. Under SQLite's WAL journal a reader sees a consistent snapshot while
+cycles write, so exports start right away. Without WAL, exports queue until the
+write leases are released, and no cycle starts while exports are reading or queued.
+Queued exports are woken when this process releases a write lease, and write leases
+of other processes are checked again every few seconds until they expire. Expired
+leases are deleted when leases are acquired and released, so the status, which the
+status stream reads every second, is a plain read. The engines' connections are set
+up here too, with the WAL journal and the attached database of search result sets.
+Used by resource_management.py, content_fetcher.py, export_manager.py and
+status_stream.py.
+"""
+import os
+import time
+import threading
+from dataclasses import dataclass
+from sqlalchemy import event, text
+from sqlalchemy.exc import IntegrityError
+
+from src.utils.db_schema import RESULT_SET_DATABASE, ensure_lease_table
+
+# the file of the search result sets next to the articles' database file
+RESULT_SET_FILE = 'search_results.db'
+WRITE = 'write'
+READ = 'read'
+WAITING = 'waiting'
+
+class LeaseTimeout(Exception):
+    """A read lease wasn't granted within the timeout."""
+
+@dataclass
+class Lease:
+    """A granted lease, handed back to DbCoordinator.release()."""
+    id: int
+    mode: str
+    holder: str
+
+def enable_wal(engine):
+    """
+    Switches the engine's SQLite database file to the WAL journal, in which readers
+    and the writer don't block each other. Used where engines are created.
+    """
+    if engine.dialect.name != 'sqlite' or engine.url.database in (None, '', ':memory:'):
+        return
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.close()
+
+def attach_result_sets(engine):
+    """
+    Attaches the database of the search result sets of result_sets.py to every
+    connection of the engine, a file next to the articles' database file or an
+    in-memory one with an in-memory database. A file is put in WAL mode like the
+    articles' database, so searches storing sets don't lock the articles' database.
+    Used where engines are created.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    database = engine.url.database
+    in_memory = database in (None, '', ':memory:')
+    path = ':memory:' if in_memory else os.path.join(
+        os.path.dirname(os.path.abspath(database)), RESULT_SET_FILE
+    )
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"ATTACH DATABASE ? AS {RESULT_SET_DATABASE}", (path,))
+        if not in_memory:
+            cursor.execute(f"PRAGMA {RESULT_SET_DATABASE}.journal_mode=WAL")
+        cursor.close()
+
+class DbCoordinator:
+    """
+    Grants the leases of one database. Leases expire after write_seconds or
+    read_seconds, so those of a crashed process don't block the others for good.
+    """
+    def __init__(self, engine, write_seconds=3600, read_seconds=3600, recheck_seconds=5):
+        self.engine = engine
+        self.write_seconds = write_seconds
+        self.read_seconds = read_seconds
+        self.recheck_seconds = recheck_seconds
+        self._released = threading.Condition()
+        self._own_writes = set()
+        self._wal = None
+        self._table_ready = False
+
+    def concurrent_reads(self):
+        """Whether reads can run during a write, which they can under WAL."""
+        if self._wal is None:
+            with self.engine.connect() as connection:
+                mode = connection.execute(text("PRAGMA journal_mode")).scalar()
+            self._wal = str(mode).lower() == 'wal'
+        return self._wal
+
+    def acquire_write(self, holder):
+        """
+        Returns a write lease for the holder, None if the holder already has one or,
+        without WAL, if readers are reading or queued. Doesn't wait.
+        """
+        concurrent = self.concurrent_reads()
+        try:
+            with self.engine.begin() as connection:
+                self._prune(connection)
+                counts = self._counts(connection)
+                if not concurrent and (counts[READ] or counts[WAITING]):
+                    return None
+                lease = self._insert(connection, WRITE, holder, self.write_seconds)
+        except IntegrityError:
+            # the holder has one, maybe taken by another process
+            return None
+        self._own_writes.add(lease.id)
+        return lease
+
+    def acquire_read(self, holder, timeout=None):
+        """
+        Returns a read lease, queueing without WAL until no write leases are held.
+        Raises LeaseTimeout if that takes longer than timeout seconds.
+        """
+        if self.concurrent_reads():
+            with self.engine.begin() as connection:
+                self._prune(connection)
+                return self._insert(connection, READ, holder, self.read_seconds)
+
+        with self.engine.begin() as connection:
+            self._prune(connection)
+            lease = self._insert(connection, WAITING, holder, self.read_seconds)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            with self._released:
+                while True:
+                    wait = self._try_read(lease)
+                    if wait is None:
+                        lease.mode = READ
+                        return lease
+                    if deadline is not None:
+                        if time.monotonic() >= deadline:
+                            raise LeaseTimeout(f"Database busy for over {timeout} s")
+                        wait = min(wait, deadline - time.monotonic())
+                    self._released.wait(max(wait, 0))
+        except BaseException:
+            self.release(lease)
+            raise
+
+    def release(self, lease):
+        """Gives a lease back, waking the queued readers if it was a write lease."""
+        with self.engine.begin() as connection:
+            connection.execute(text("DELETE FROM db_leases WHERE id = :id"), {'id': lease.id})
+            self._prune(connection)
+        if lease.mode == WRITE:
+            self._own_writes.discard(lease.id)
+            with self._released:
+                self._released.notify_all()
+
+    def holds_write(self):
+        """Whether this process holds a write lease."""
+        return bool(self._own_writes)
+
+    def is_writing(self):
+        """Whether any process holds a write lease."""
+        return self.status()['writing']
+
+    def status(self):
+        """
+        The holders of unexpired write leases and the numbers of readers and queued
+        readers. Only reads the database.
+        """
+        self._ensure_table()
+        with self.engine.connect() as connection:
+            counts = self._counts(connection)
+            writers = connection.execute(text("""
+                SELECT holder FROM db_leases WHERE mode = :mode AND expires_at >= :now
+                ORDER BY holder
+            """), {'mode': WRITE, 'now': time.time()}).scalars().all()
+        return {
+            'writing': bool(counts[WRITE]),
+            'writers': writers,
+            'readers': counts[READ],
+            'waiting': counts[WAITING]
+        }
+
+    def _try_read(self, lease):
+        """
+        Turns the queued lease into a read lease and returns None if no write leases
+        are held, otherwise how long to wait before checking again.
+        """
+        now = time.time()
+        with self.engine.begin() as connection:
+            counts = self._counts(connection)
+            if not counts[WRITE]:
+                connection.execute(
+                    text("UPDATE db_leases SET mode = :mode, expires_at = :expires WHERE id = :id"),
+                    {'mode': READ, 'expires': now + self.read_seconds, 'id': lease.id}
+                )
+                return None
+            # the queued lease mustn't expire while waiting
+            connection.execute(
+                text("UPDATE db_leases SET expires_at = :expires WHERE id = :id"),
+                {'expires': now + self.read_seconds, 'id': lease.id}
+            )
+            writers = connection.execute(text("""
+                SELECT pid, expires_at FROM db_leases WHERE mode = :mode AND expires_at >= :now
+            """), {'mode': WRITE, 'now': now}).fetchall()
+        wait = min(writer.expires_at for writer in writers) - now
+        if any(writer.pid != os.getpid() for writer in writers):
+            # other processes can't notify this one
+            wait = min(wait, self.recheck_seconds)
+        return wait
+
+    def _ensure_table(self):
+        """Creates the db_leases table if no lease was acquired before the status is read."""
+        if not self._table_ready:
+            with self.engine.begin() as connection:
+                ensure_lease_table(connection)
+            self._table_ready = True
+
+    def _prune(self, connection):
+        """
+        Creates the db_leases table if needed and deletes the expired leases, such as
+        those of crashed processes.
+        """
+        ensure_lease_table(connection)
+        self._table_ready = True
+        connection.execute(
+            text("DELETE FROM db_leases WHERE expires_at < :now"), {'now': time.time()}
+        )
+
+    def _counts(self, connection):
+        """Numbers of unexpired leases by mode."""
+        rows = connection.execute(text("""
+            SELECT mode, COUNT(*) FROM db_leases WHERE expires_at >= :now GROUP BY mode
+        """), {'now': time.time()}).fetchall()
+        return {WRITE: 0, READ: 0, WAITING: 0, **dict(rows)}
+
+    def _insert(self, connection, mode, holder, seconds):
+        now = time.time()
+        lease_id = connection.execute(text("""
+            INSERT INTO db_leases (mode, holder, pid, acquired_at, expires_at)
+            VALUES (:mode, :holder, :pid, :now, :expires)
+            RETURNING id
+        """), {
+            'mode': mode, 'holder': holder, 'pid': os.getpid(),
+            'now': now, 'expires': now + seconds
+        }).scalar()
+        return Lease(lease_id, mode, holder)
@@ -0,0 +1,393 @@
+"""
+This handles the database schema the collection pipeline writes to. The articles
+table keeps the original news-article-collection layout so that existing databases
+keep working, and searches and exports read it through a view that adds the HTML
+kept in the body store. Searches match words against a full-text index of the
+articles and, when it's turned on, substrings against a trigram index of them, both
+of which triggers keep in sync with the table. Used by collection_cycle.py,
+resource_management.py, query_processor.py and db_coordination.py.
+"""
+from sqlalchemy import text
+
+ARTICLE_COLUMNS = {
+    'url': 'TEXT',
+    'html': 'TEXT',
+    'full_text': 'TEXT',
+    'time': 'DATETIME',
+    'download_time': 'DATETIME',
+    'title': 'TEXT',
+    'url_key': 'INTEGER',
+    'body_hash': 'TEXT'
+}
+
+# the articles as searches and exports read them, with the HTML of the body store
+ARTICLE_VIEW = 'article_contents'
+# the FTS5 indexes of the articles searches match words and substrings against,
+# and the columns both index
+SEARCH_INDEX = 'article_search'
+SUBSTRING_INDEX = 'article_substrings'
+SEARCH_INDEX_COLUMNS = ('title', 'full_text', 'url', 'time')
+# the database attached to the app's connections that result_sets.py keeps the sets in
+RESULT_SET_DATABASE = 'results'
+# pipeline_state key of the articles' data version, bumped by triggers on every change
+DATA_VERSION_KEY = 'articles_version'
+
+def get_table_columns(connection, table_name):
+    """Returns the column names of a table, empty set if it doesn't exist."""
+    rows = connection.execute(text(f"PRAGMA table_info({table_name})")).fetchall()
+    return {row[1] for row in rows}
+
+def ensure_articles_table(connection, substrings=False):
+    """
+    Creates the articles table if needed and adds any missing columns,
+    since databases created by older collectors may lack some of them.
+    url_key is the canonical URL hash of url_index.py, and body_hash refers to the
+    page's HTML in the article_bodies table of html_storage.py, which is read
+    together with the articles through the article_contents view. The trigram index
+    is only built with substrings, as it takes several times the space of the text.
+    """
+    columns = get_table_columns(connection, 'articles')
+    if not columns:
+        column_sql = ',\n'.join(f"{name} {sql_type}" for name, sql_type in ARTICLE_COLUMNS.items())
+        connection.execute(text(f"""
+            CREATE TABLE articles (
+                id INTEGER PRIMARY KEY,
+                {column_sql}
+            )
+        """))
+    else:
+        add_missing_columns(connection, 'articles', ARTICLE_COLUMNS)
+
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_articles_url_key ON articles (url_key)"
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_articles_body_hash ON articles (body_hash)"
+    ))
+    # the sort orders search pages are read in, see query_processor.py
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_articles_time_id ON articles (COALESCE(time, ''), id)"
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_articles_url_id ON articles (COALESCE(url, ''), id)"
+    ))
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS article_bodies (
+            content_hash TEXT PRIMARY KEY,
+            html BLOB NOT NULL,
+            refs INTEGER NOT NULL DEFAULT 1
+        )
+    """))
+    connection.execute(text(f"""
+        CREATE VIEW IF NOT EXISTS {ARTICLE_VIEW} AS
+        SELECT articles.id, articles.url, COALESCE(article_bodies.html, articles.html) AS html,
+            articles.full_text, articles.time, articles.download_time, articles.title
+        FROM articles
+        LEFT JOIN article_bodies ON article_bodies.content_hash = articles.body_hash
+    """))
+    ensure_search_index(connection, SEARCH_INDEX, 'unicode61')
+    if substrings:
+        ensure_search_index(connection, SUBSTRING_INDEX, 'trigram')
+    ensure_data_version(connection)
+
+def ensure_data_version(connection):
+    """
+    Creates the triggers that bump the articles' data version in pipeline_state
+    whenever articles are added, changed or deleted, which tells search_cache.py
+    to drop what it cached. Triggers missing with a recreated articles table are
+    created again, and the version is bumped then too. Used by ensure_articles_table().
+    """
+    if connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'articles_version_insert'"
+    )).scalar():
+        return
+    ensure_state_table(connection)
+    bump = f"""
+        INSERT INTO pipeline_state (key, value) VALUES ('{DATA_VERSION_KEY}', 1)
+        ON CONFLICT (key) DO UPDATE SET value = value + 1;
+    """
+    connection.execute(text(bump))
+    connection.execute(text(f"""
+        CREATE TRIGGER articles_version_insert AFTER INSERT ON articles
+        BEGIN {bump} END
+    """))
+    connection.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS articles_version_delete AFTER DELETE ON articles
+        BEGIN {bump} END
+    """))
+    # the columns searches and statistics read, html only moves to the body store
+    connection.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS articles_version_update
+        AFTER UPDATE OF url, full_text, time, title, body_hash ON articles
+        BEGIN {bump} END
+    """))
+
+def ensure_search_index(connection, index, tokenizer):
+    """
+    Creates an FTS5 index of the articles' titles, texts, URLs and times with the
+    tokenizer, unicode61 for words or trigram for substrings, and the triggers that
+    update it whenever articles are added, changed or deleted, by this app or any
+    other writer. The index reads the text from the articles table instead of keeping
+    a copy. It counts as built only once a rebuild from the articles has finished, so
+    an index a failed or interrupted build left behind, or one whose triggers went with
+    a dropped articles table, is built again from scratch. Used by ensure_articles_table().
+    """
+    ensure_state_table(connection)
+    trigger = 'articles_' + index.removeprefix('article_')
+    if get_state(connection, f'{index}_built') and connection.execute(text(
+        "SELECT COUNT(*) FROM sqlite_master WHERE name IN (:index, :trigger)"
+    ), {'index': index, 'trigger': f'{trigger}_insert'}).scalar() == 2:
+        return
+    drop_search_index(connection, index)
+
+    columns = ', '.join(SEARCH_INDEX_COLUMNS)
+    new_values = ', '.join(f"new.{column}" for column in SEARCH_INDEX_COLUMNS)
+    old_values = ', '.join(f"old.{column}" for column in SEARCH_INDEX_COLUMNS)
+    insert = f"INSERT INTO {index} (rowid, {columns}) VALUES (new.id, {new_values});"
+    delete = (
+        f"INSERT INTO {index} ({index}, rowid, {columns}) "
+        f"VALUES ('delete', old.id, {old_values});"
+    )
+    connection.execute(text(f"""
+        CREATE VIRTUAL TABLE {index} USING fts5 (
+            {columns}, content='articles', content_rowid='id', tokenize='{tokenizer}'
+        )
+    """))
+    connection.execute(text(f"""
+        CREATE TRIGGER {trigger}_insert AFTER INSERT ON articles
+        BEGIN {insert} END
+    """))
+    connection.execute(text(f"""
+        CREATE TRIGGER {trigger}_delete AFTER DELETE ON articles
+        BEGIN {delete} END
+    """))
+    # moving HTML to the body store doesn't touch the index
+    connection.execute(text(f"""
+        CREATE TRIGGER {trigger}_update
+        AFTER UPDATE OF {columns} ON articles
+        BEGIN {delete} {insert} END
+    """))
+    connection.execute(text(f"INSERT INTO {index} ({index}) VALUES ('rebuild')"))
+    set_state(connection, f'{index}_built', 1)
+
+def drop_search_index(connection, index):
+    """
+    Drops a search index of ensure_search_index() and its triggers, if they exist,
+    and forgets it was built. Used by resource_management.py for a turned off index.
+    """
+    ensure_state_table(connection)
+    connection.execute(
+        text("DELETE FROM pipeline_state WHERE key = :key"), {'key': f'{index}_built'}
+    )
+    trigger = 'articles_' + index.removeprefix('article_')
+    for action in ('insert', 'delete', 'update'):
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {trigger}_{action}"))
+    connection.execute(text(f"DROP TABLE IF EXISTS {index}"))
+
+def add_missing_columns(connection, table_name, columns):
+    """Adds the columns, a dict of names to SQL types, that an existing table lacks."""
+    existing = get_table_columns(connection, table_name)
+    for name, sql_type in columns.items():
+        if name not in existing:
+            connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {name} {sql_type}"))
+
+def to_db_time(value):
+    """Formats a datetime the way the articles table stores times, None stays None."""
+    if value is None:
+        return None
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+def ensure_collection_tables(connection):
+    """Creates the collection pipeline's own bookkeeping tables next to articles."""
+    ensure_state_table(connection)
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS feeds (
+            id INTEGER PRIMARY KEY,
+            url TEXT NOT NULL UNIQUE,
+            enabled INTEGER NOT NULL DEFAULT 1,
+            settings TEXT,
+            added_at DATETIME NOT NULL,
+            last_polled_at DATETIME,
+            last_status TEXT,
+            last_error TEXT,
+            failures INTEGER NOT NULL DEFAULT 0,
+            auto_disabled INTEGER NOT NULL DEFAULT 0
+        )
+    """))
+    # added after the table was introduced
+    add_missing_columns(connection, 'feeds', {'auto_disabled': 'INTEGER NOT NULL DEFAULT 0'})
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS feed_state (
+            feed_url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            content_hash TEXT,
+            content_length INTEGER,
+            last_status TEXT,
+            checked_at DATETIME,
+            cache_hits INTEGER NOT NULL DEFAULT 0,
+            cache_misses INTEGER NOT NULL DEFAULT 0,
+            bytes_saved INTEGER NOT NULL DEFAULT 0
+        )
+    """))
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS feed_schedule (
+            feed_url TEXT PRIMARY KEY,
+            interval REAL NOT NULL,
+            next_poll_at REAL NOT NULL,
+            last_polled_at REAL,
+            rate REAL,
+            failures INTEGER NOT NULL DEFAULT 0
+        )
+    """))
+
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS fetch_runs (
+            id INTEGER PRIMARY KEY,
+            started_at DATETIME NOT NULL,
+            finished_at DATETIME NOT NULL,
+            duration REAL,
+            collect_duration REAL,
+            feeds_polled INTEGER NOT NULL DEFAULT 0,
+            feed_errors INTEGER NOT NULL DEFAULT 0,
+            http_time REAL NOT NULL DEFAULT 0,
+            parse_time REAL NOT NULL DEFAULT 0,
+            new_articles INTEGER NOT NULL DEFAULT 0,
+            duplicates INTEGER NOT NULL DEFAULT 0,
+            article_errors INTEGER NOT NULL DEFAULT 0,
+            processed INTEGER NOT NULL DEFAULT 0,
+            bytes INTEGER NOT NULL DEFAULT 0,
+            error_class TEXT,
+            resource_state TEXT
+        )
+    """))
+    # added after the table was introduced
+    add_missing_columns(connection, 'fetch_runs', {'resource_state': 'TEXT'})
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS fetch_run_feeds (
+            id INTEGER PRIMARY KEY,
+            run_id INTEGER NOT NULL REFERENCES fetch_runs (id),
+            feed_url TEXT NOT NULL,
+            started_at DATETIME NOT NULL,
+            finished_at DATETIME NOT NULL,
+            duration REAL,
+            http_time REAL NOT NULL DEFAULT 0,
+            parse_time REAL NOT NULL DEFAULT 0,
+            cache TEXT,
+            entries INTEGER NOT NULL DEFAULT 0,
+            new_articles INTEGER NOT NULL DEFAULT 0,
+            duplicates INTEGER NOT NULL DEFAULT 0,
+            article_errors INTEGER NOT NULL DEFAULT 0,
+            bytes INTEGER NOT NULL DEFAULT 0,
+            error_class TEXT
+        )
+    """))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_fetch_run_feeds_run_id ON fetch_run_feeds (run_id)"
+    ))
+    # change detection of stored articles, see article_revisions.py
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS article_sources (
+            article_id INTEGER PRIMARY KEY,
+            feed_url TEXT,
+            published DATETIME,
+            etag TEXT,
+            last_modified TEXT,
+            checked_at DATETIME
+        )
+    """))
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS article_revisions (
+            id INTEGER PRIMARY KEY,
+            article_id INTEGER NOT NULL,
+            revision INTEGER NOT NULL,
+            body_hash TEXT,
+            full_text TEXT,
+            title TEXT,
+            time DATETIME,
+            download_time DATETIME,
+            UNIQUE (article_id, revision)
+        )
+    """))
+    # sharded collection, see feed_leases.py
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS collector_instances (
+            instance TEXT PRIMARY KEY,
+            heartbeat_at REAL NOT NULL
+        )
+    """))
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS feed_leases (
+            feed_url TEXT PRIMARY KEY,
+            instance TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    """))
+
+def ensure_state_table(connection):
+    """Creates the pipeline_state table of get_state() and set_state()."""
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS pipeline_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    """))
+
+def ensure_lease_table(connection):
+    """
+    Creates the db_leases table of db_coordination.py. The partial unique index
+    allows each writer, such as the cycle of one collector instance, one write lease
+    at a time, whichever process takes it.
+    """
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS db_leases (
+            id INTEGER PRIMARY KEY,
+            mode TEXT NOT NULL,
+            holder TEXT NOT NULL,
+            pid INTEGER NOT NULL,
+            acquired_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    """))
+    connection.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_db_leases_writer ON db_leases (holder) "
+        "WHERE mode = 'write'"
+    ))
+
+def ensure_result_set_tables(connection):
+    """
+    Creates the tables of the search result sets of result_sets.py in their own
+    attached database. The ids of a set are stored in order of the set and article,
+    so reading a set is a range scan.
+    """
+    connection.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {RESULT_SET_DATABASE}.search_results (
+            id INTEGER PRIMARY KEY,
+            handle TEXT NOT NULL UNIQUE,
+            search_key TEXT NOT NULL,
+            size INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            used_at REAL NOT NULL
+        )
+    """))
+    connection.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {RESULT_SET_DATABASE}.search_result_ids (
+            result_id INTEGER NOT NULL,
+            article_id INTEGER NOT NULL,
+            PRIMARY KEY (result_id, article_id)
+        ) WITHOUT ROWID
+    """))
+
+def get_state(connection, key, default=None):
+    """Reads a value of the pipeline_state table, such as the extraction watermark."""
+    value = connection.execute(
+        text("SELECT value FROM pipeline_state WHERE key = :key"), {'key': key}
+    ).scalar()
+    return default if value is None else value
+
+def set_state(connection, key, value):
+    """Writes a pipeline_state value within the connection's current transaction."""
+    connection.execute(text("""
+        INSERT INTO pipeline_state (key, value) VALUES (:key, :value)
+        ON CONFLICT (key) DO UPDATE SET value = excluded.value
+    """), {'key': key, 'value': str(value)})
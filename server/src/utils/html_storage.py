@@ -0,0 +1,126 @@
+"""
+This handles the storage of article HTML, by far the largest part of the database.
+Pages are kept once per content hash in the article_bodies table as zlib compressed
+blobs, and articles refer to them by body_hash, since syndicated news gives the same
+page under many URLs and pages are sometimes downloaded again. Rows written by the
+original collector, or before the body store, hold their HTML in articles.html,
+plain or compressed, until move_stored_html() gets to them. decode_html() reads
+any of these, and the html_text() SQL function does the same inside queries.
+Used by collection_cycle.py, article_extractor.py, query_processor.py,
+format_converter.py and stats_analyzer.py.
+"""
+import time
+import zlib
+import hashlib
+from sqlalchemy import event, text
+
+from src.utils.db_schema import get_state, set_state
+
+COMPRESSION_LEVEL = 6
+WATERMARK_KEY = 'html_moved_id'
+
+def compress_html(html):
+    """Compresses an HTML string for storage, None stays None."""
+    if html is None:
+        return None
+    return zlib.compress(html.encode('utf-8'), COMPRESSION_LEVEL)
+
+def decode_html(value):
+    """Returns the stored HTML as a string, whether it's compressed or plain text."""
+    if isinstance(value, (bytes, memoryview)):
+        return zlib.decompress(value).decode('utf-8', errors='replace')
+    return value
+
+def content_hash(html):
+    """Hex SHA-256 of the HTML, the key of the body store."""
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+def register_sql_functions(engine):
+    """
+    Registers html_text(html), which returns the column as text, on every new
+    SQLite connection of the engine. Used where engines are created.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, _):
+        dbapi_connection.create_function('html_text', 1, decode_html, deterministic=True)
+
+def store_body(connection, html):
+    """
+    Stores the HTML in the body store unless it's already there, and returns its
+    hash and whether it was a duplicate. Duplicates are only counted, so they cost
+    neither the compression nor the space.
+    """
+    body_hash = content_hash(html)
+    duplicate = connection.execute(
+        text("UPDATE article_bodies SET refs = refs + 1 WHERE content_hash = :hash"),
+        {'hash': body_hash}
+    ).rowcount > 0
+    if not duplicate:
+        connection.execute(
+            text("INSERT INTO article_bodies (content_hash, html) VALUES (:hash, :html)"),
+            {'hash': body_hash, 'html': compress_html(html)}
+        )
+    return body_hash, duplicate
+
+def extracted_for_body(connection, body_hash):
+    """
+    Returns the text, title and time already extracted from an article with the same
+    body as a row, None if none of them is extracted yet.
+    """
+    return connection.execute(text("""
+        SELECT full_text, title, time FROM articles
+        WHERE body_hash = :hash AND full_text IS NOT NULL
+        LIMIT 1
+    """), {'hash': body_hash}).one_or_none()
+
+def dedup_savings(connection):
+    """Returns the number of articles that share a stored body and the bytes it saves."""
+    row = connection.execute(text("""
+        SELECT COALESCE(SUM(refs - 1), 0) AS duplicates,
+            COALESCE(SUM(LENGTH(html) * (refs - 1)), 0) AS saved
+        FROM article_bodies
+    """)).one()
+    return row.duplicates, row.saved
+
+def has_stored_html(connection):
+    """Whether any article past the watermark still has its HTML in the articles table."""
+    return bool(connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM articles WHERE id > :id AND html IS NOT NULL)"
+    ), {'id': int(get_state(connection, WATERMARK_KEY, 0))}).scalar())
+
+def move_stored_html(connection, batch_size=200, deadline=None):
+    """
+    Moves the HTML kept in the articles table past the watermark to the body store
+    in batches, committing each one, and returns the number of rows moved. Rows the
+    original collector keeps adding are picked up by the next call. Stops at the
+    deadline, a time.monotonic() value, and carries on from there the next time.
+    """
+    last_id = int(get_state(connection, WATERMARK_KEY, 0))
+    moved = 0
+    while deadline is None or time.monotonic() < deadline:
+        rows = connection.execute(text("""
+            SELECT id, html FROM articles
+            WHERE id > :last_id AND html IS NOT NULL
+            ORDER BY id LIMIT :limit
+        """), {'last_id': last_id, 'limit': batch_size}).fetchall()
+        if not rows:
+            # nothing left to move, so later calls start from the newest row
+            last_id = connection.execute(text("SELECT MAX(id) FROM articles")).scalar() or 0
+            set_state(connection, WATERMARK_KEY, last_id)
+            connection.commit()
+            break
+        connection.execute(
+            text("UPDATE articles SET html = NULL, body_hash = :hash WHERE id = :id"),
+            [
+                {'id': article_id, 'hash': store_body(connection, decode_html(html))[0]}
+                for article_id, html in rows
+            ]
+        )
+        last_id = rows[-1].id
+        set_state(connection, WATERMARK_KEY, last_id)
+        connection.commit()
+        moved += len(rows)
+    return moved
@@ -5,6 +5,13 @@ from flask_apscheduler import APScheduler
 from sqlalchemy import create_engine, inspect
 from flask import jsonify, current_app
 
+from src.utils.db_schema import (
+    SUBSTRING_INDEX, drop_search_index, ensure_articles_table, ensure_collection_tables
+)
+from src.utils.html_storage import register_sql_functions
+from src.utils.db_coordination import DbCoordinator, attach_result_sets, enable_wal
+from src.utils.search_cache import SearchCache
+
 # used in content_fetcher.py
 scheduler = APScheduler()
 
@@ -19,6 +26,50 @@ def init_db_engine(app):
     """Creates the database engine. Used by app.py."""
     if not hasattr(app, 'db_engine'):
         app.db_engine = create_engine(app.config['DATABASE_URL'], echo=False)
+        register_sql_functions(app.db_engine)
+        enable_wal(app.db_engine)
+        attach_result_sets(app.db_engine)
+
+def init_db_coordinator(app):
+    """
+    Creates the coordinator of the database's readers and writers. The write lease
+    outlasts the longest a cycle can run before the watchdog kills it. Used by app.py.
+    """
+    if not hasattr(app, 'db_coordinator'):
+        app.db_coordinator = DbCoordinator(
+            app.db_engine,
+            write_seconds=app.config['CYCLE_TIME_BUDGET'] + app.config['CYCLE_KILL_GRACE'],
+            read_seconds=app.config['EXPORT_LEASE_SECONDS']
+        )
+
+def init_search_cache(app):
+    """
+    Creates the cache of searches and statistics. Its entries are kept for half the
+    time unused result sets are, so the handles it returns stay valid. Used by app.py.
+    """
+    if not hasattr(app, 'search_cache'):
+        app.search_cache = SearchCache(
+            app.db_engine,
+            size=app.config['SEARCH_CACHE_SIZE'],
+            max_age=app.config['SEARCH_RESULT_SECONDS'] / 2
+        )
+
+def init_db_schema(app):
+    """
+    Upgrades the schema of an existing articles table once at start, since it may be
+    from the original collector, without the view searches read, so requests only read
+    it. The trigram index is built when SEARCH_SUBSTRINGS is turned on and dropped when
+    it's turned off. New databases get the schema from the first collection cycle.
+    The collection tables, which the feed and revision routes read, are created too.
+    Used by app.py.
+    """
+    substrings = app.config['SEARCH_SUBSTRINGS']
+    with app.db_engine.begin() as connection:
+        if inspect(connection).has_table('articles'):
+            ensure_articles_table(connection, substrings)
+            if not substrings:
+                drop_search_index(connection, SUBSTRING_INDEX)
+        ensure_collection_tables(connection)
 
 def check_articles_table():
     """
@@ -0,0 +1,106 @@
+"""
+This caches search responses, the result sets and counts of searches, and statistics,
+so paging, sorting and reopening the statistics of the same search don't run the same
+queries again. Entries belong to a data version of the articles, which triggers on the
+articles table bump on every change, so whatever a collection cycle commits empties
+the cache. The version is only read again once PRAGMA data_version on the cache's own
+connection tells another connection committed, so a hit doesn't query the database.
+A value is put with the version read before it was computed, and isn't cached if the
+articles changed since, as it may be from the data before the change.
+Used by resource_management.py, query_processor.py and stats_analyzer.py.
+"""
+import time
+import threading
+from collections import OrderedDict
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.utils.db_schema import DATA_VERSION_KEY, get_state
+
+class SearchCache:
+    """
+    A least recently used cache of at most size entries, each kept for max_age seconds
+    at most. A size of 0 turns it off. Keys are tuples of normalized request params.
+    """
+    def __init__(self, engine, size=256, max_age=3600):
+        self.engine = engine
+        self.size = size
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._commits = None
+        self._version = None
+
+    def get(self, key):
+        """Returns the cached value of the key, None if there is none for the current data."""
+        if not self.size:
+            return None
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic() - self.max_age:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def version(self):
+        """The data version of the articles, read before computing a value to put()."""
+        with self._lock:
+            self._check_version()
+            return self._version
+
+    def put(self, key, value, version):
+        """
+        Caches the value of the key computed at the data version, evicting the least
+        recently used entry when full. A value computed while a change was committed
+        isn't cached.
+        """
+        if not self.size:
+            return
+        with self._lock:
+            self._check_version()
+            if version is None or version != self._version:
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Empties the cache."""
+        with self._lock:
+            self._entries.clear()
+
+    def _check_version(self):
+        """Empties the cache if the articles changed since its entries were cached."""
+        if not self._committed():
+            return
+        try:
+            with self.engine.connect() as connection:
+                version = get_state(connection, DATA_VERSION_KEY)
+        except SQLAlchemyError:
+            # no articles yet
+            version = None
+        if version is None or version != self._version:
+            self._entries.clear()
+        self._version = version
+
+    def _committed(self):
+        """
+        Whether another connection may have committed since the last check. PRAGMA
+        data_version can't see the commits of its own connection, which an in-memory
+        database shares with everything, so those are always checked.
+        """
+        if self.engine.url.database in (None, '', ':memory:'):
+            return True
+        if self._watcher is None:
+            self._watcher = self.engine.raw_connection()
+        cursor = self._watcher.cursor()
+        try:
+            cursor.execute("PRAGMA data_version")
+            commits = cursor.fetchone()[0]
+        finally:
+            cursor.close()
+        changed = commits != self._commits
+        self._commits = commits
+        return changed
@@ -1,24 +1,42 @@
 """
-Handles streaming processing status route for frontend.
-While currently only used for processing status, other statuses could be included too.
-Used by routes.py.
+Handles streaming processing status route for frontend. Processing is active while
+any process holds a write lease of the database.
+Besides the processing status, the running collection cycle's progress is sent as
+cycle_progress events and the summary of each finished cycle as a cycle_done event,
+both with JSON data. Used by routes.py.
 """
+import json
 import time
-from flask import Response, stream_with_context
+from flask import Response, stream_with_context, current_app
 
-from src.utils.processing_status import ProcessingStatus
+from src.utils.cycle_progress import CycleProgress
 
 def stream():
     """
-    Processing status check stream, inactive when client not in use.
+    Processing status and cycle progress stream, inactive when client not in use.
     Used by routes.init_routes() for route /stream.
     """
+    coordinator = current_app.db_coordinator
+
     def event_stream():
         last_status = None
+        last_progress = None
+        # the summary of a cycle finished before connecting isn't news
+        last_summary = CycleProgress.get_summary()
         while True:
-            current_status = ProcessingStatus.get_status()
+            current_status = coordinator.is_writing()
             if current_status != last_status:
                 yield f"event: processing_status\ndata: {str(current_status).lower()}\n\n"
                 last_status = current_status
+
+            current_progress = CycleProgress.get_progress()
+            if current_progress is not None and current_progress != last_progress:
+                yield f"event: cycle_progress\ndata: {json.dumps(current_progress)}\n\n"
+            last_progress = current_progress
+
+            current_summary = CycleProgress.get_summary()
+            if current_summary is not last_summary:
+                yield f"event: cycle_done\ndata: {json.dumps(current_summary)}\n\n"
+                last_summary = current_summary
             time.sleep(1)
     return Response(stream_with_context(event_stream()), content_type='text/event-stream')
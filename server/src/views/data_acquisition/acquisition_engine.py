@@ -0,0 +1,523 @@
+"""
+This is the concurrent acquisition engine that fetches feeds and article pages.
+Feeds and articles share one bounded thread pool, which caps global concurrency.
+Fetches wait in a queue of their host until it has a free slot, so a busy host doesn't
+tie up the pool's workers, and the HTTP client keeps connections alive between
+requests to the same host. Articles are queued as soon as their feed
+is parsed, so a cycle takes about as long as its slowest feed rather than the sum
+of all of them. Feeds are polled with conditional GETs against their stored state,
+and an unmodified or byte-identical feed isn't parsed at all. Used by collection_cycle.py.
+"""
+import re
+import gzip
+import hashlib
+import zlib
+import time
+import threading
+import http.client
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urljoin, urlsplit
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+import feedparser
+
+USER_AGENT = 'Mozilla/5.0 (compatible; news-article-collector)'
+MAX_BODY_BYTES = 20 * 1024 * 1024
+MAX_REDIRECTS = 5
+
+@dataclass
+class HttpResponse:
+    """A fully read HTTP response."""
+    url: str
+    status: int
+    headers: dict
+    body: bytes
+    elapsed: float
+
+    def text(self):
+        """Body decoded by the declared or sniffed charset."""
+        return decode_body(self.body, self.headers.get('content-type', ''))
+
+@dataclass
+class FeedEntry:
+    """
+    One item of a feed. article_id and validators are set when the page of an
+    already stored article is checked for changes, the validators being the
+    etag and last_modified it was stored with.
+    """
+    link: str
+    feed_url: str
+    title: str = None
+    published: datetime = None
+    article_id: int = None
+    validators: dict = None
+
+@dataclass
+class FeedResult:  # pylint: disable=too-many-instance-attributes
+    """
+    Outcome of fetching and parsing one feed. cache is 'not_modified' for a 304,
+    'unchanged' for a body identical to the last one and 'changed' otherwise.
+    elapsed is split into http_time for the request and parse_time for hashing
+    and parsing the body.
+    """
+    url: str
+    entries: list = field(default_factory=list)
+    error: str = None
+    elapsed: float = 0.0
+    bytes: int = 0
+    http_time: float = 0.0
+    parse_time: float = 0.0
+    cache: str = None
+    etag: str = None
+    last_modified: str = None
+    content_hash: str = None
+
+@dataclass
+class ArticleResult:  # pylint: disable=too-many-instance-attributes
+    """
+    Outcome of downloading one article page, with the page's validators.
+    not_modified is set for a 304 to a conditional GET, which has no html.
+    """
+    entry: FeedEntry
+    html: str = None
+    error: str = None
+    elapsed: float = 0.0
+    bytes: int = 0
+    etag: str = None
+    last_modified: str = None
+    not_modified: bool = False
+
+class HttpError(Exception):
+    """Raised for non-2xx responses and unusable bodies."""
+
+class HttpClient:
+    """
+    Small thread-safe HTTP/1.1 client with a keep-alive connection pool of
+    per_host_limit idle connections per host, the most a HostQueue runs at once.
+    Only what fetching feeds needs: GET, redirects, gzip and deflate.
+    """
+    def __init__(self, timeout=15, per_host_limit=2, user_agent=USER_AGENT):
+        self.timeout = timeout
+        self.per_host_limit = per_host_limit
+        self.user_agent = user_agent
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _checkout(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        scheme, host, port = key
+        connection_class = (
+            http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        )
+        return connection_class(host, port, timeout=self.timeout), False
+
+    def _checkin(self, key, connection):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.per_host_limit:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def get(self, url, headers=None):
+        """GETs the URL following redirects. Raises HttpError for non-2xx responses."""
+        started = time.monotonic()
+        for _ in range(MAX_REDIRECTS + 1):
+            status, response_headers, body = self._request(url, headers or {})
+            if status in (301, 302, 303, 307, 308) and 'location' in response_headers:
+                url = urljoin(url, response_headers['location'])
+                continue
+            break
+        else:
+            raise HttpError(f"Too many redirects: {url}")
+
+        response = HttpResponse(url, status, response_headers, body, time.monotonic() - started)
+        if status >= 400:
+            raise HttpError(f"HTTP {status}")
+        return response
+
+    def _request(self, url, headers):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise HttpError(f"Unsupported URL: {url}")
+        host = parts.hostname.lower()
+        key = (parts.scheme, host, parts.port or (443 if parts.scheme == 'https' else 80))
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        request_headers = {
+            'User-Agent': self.user_agent,
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+            **headers
+        }
+
+        connection, reused = self._checkout(key)
+        try:
+            status, response_headers, body, keep_alive = _send(
+                connection, path, request_headers
+            )
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            connection.close()
+            if not reused:
+                raise
+            # a pooled connection the server had already closed, retry with a fresh one
+            connection, _ = self._checkout(key)
+            try:
+                status, response_headers, body, keep_alive = _send(
+                    connection, path, request_headers
+                )
+            except Exception:
+                connection.close()
+                raise
+        except Exception:
+            connection.close()
+            raise
+
+        if keep_alive:
+            self._checkin(key, connection)
+        else:
+            connection.close()
+
+        return status, response_headers, body
+
+    def close(self):
+        """Closes all pooled connections."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+def _send(connection, path, headers):
+    """One request and fully read response on a connection."""
+    connection.request('GET', path, headers=headers)
+    response = connection.getresponse()
+    body = response.read(MAX_BODY_BYTES + 1)
+    if len(body) > MAX_BODY_BYTES:
+        raise HttpError("Response body too large")
+    response_headers = {name.lower(): value for name, value in response.getheaders()}
+    keep_alive = not response.will_close
+
+    encoding = response_headers.get('content-encoding', '').lower()
+    if encoding == 'gzip':
+        body = gzip.decompress(body)
+    elif encoding == 'deflate':
+        body = zlib.decompress(body)
+
+    return response.status, response_headers, body, keep_alive
+
+def decode_body(body, content_type=''):
+    """Decodes bytes by the header charset, a meta charset or UTF-8."""
+    match = re.search(r'charset=["\']?([\w-]+)', content_type, re.I)
+    if not match:
+        match = re.search(rb'<meta[^>]+charset=["\']?([\w-]+)', body[:2048], re.I)
+    charset = match.group(1) if match else 'utf-8'
+    if isinstance(charset, bytes):
+        charset = charset.decode('ascii')
+    try:
+        return body.decode(charset, errors='replace')
+    except LookupError:
+        return body.decode('utf-8', errors='replace')
+
+def parse_date(value):
+    """Parses RFC 822 (RSS) and ISO 8601 (Atom) dates to naive UTC, None if neither."""
+    if not value:
+        return None
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def _entry_published(entry):
+    """The entry's publication or update time as naive UTC, None if it has neither."""
+    parsed = entry.get('published_parsed') or entry.get('updated_parsed')
+    return datetime(*parsed[:6]) if parsed else None
+
+def parse_feed(body, feed_url, base_url=None):
+    """
+    Parses RSS and Atom feeds into FeedEntry items with feedparser, which tolerates
+    the malformed markup many feeds have. A feed that didn't parse cleanly is only
+    rejected when no entries could be read from it. Relative links resolve against
+    base_url, the feed's final URL after redirects.
+    Raises ValueError if the body isn't a feed.
+    """
+    base_url = base_url or feed_url
+    parsed = feedparser.parse(body)
+    if not parsed.entries and (parsed.bozo or not parsed.version):
+        reason = parsed.get('bozo_exception') or 'no feed found'
+        raise ValueError(f"Not a valid feed: {reason}")
+
+    return [
+        FeedEntry(
+            link=urljoin(base_url, entry.link.strip()),
+            feed_url=feed_url,
+            title=entry.get('title') or None,
+            published=_entry_published(entry)
+        )
+        for entry in parsed.entries if entry.get('link', '').strip()
+    ]
+
+class HostQueue:
+    """
+    Submits fetches to a thread pool with at most limit of them per host in the pool,
+    queueing the rest by host until a slot frees up. Returns futures of its own, so
+    a queued fetch can be cancelled before it gets a worker.
+    """
+    def __init__(self, pool, limit):
+        self.pool = pool
+        self.limit = limit
+        self._active = {}
+        self._queued = {}
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def submit(self, url, function, *args):
+        """Returns the future of function(*args), a fetch from the host of the URL."""
+        future = Future()
+        host = (urlsplit(url).hostname or '').lower()
+        with self._lock:
+            if self._active.get(host, 0) >= self.limit:
+                self._queued.setdefault(host, deque()).append((future, function, args))
+            else:
+                self._active[host] = self._active.get(host, 0) + 1
+                self.pool.submit(self._run, host, future, function, args)
+        return future
+
+    def _run(self, host, future, function, args):
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(function(*args))
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            self._release(host)
+
+    def _release(self, host):
+        """Hands the host's slot to its next queued fetch that wasn't cancelled."""
+        with self._lock:
+            queued = self._queued.get(host)
+            while queued and queued[0][0].cancelled():
+                queued.popleft()
+            if queued and not self._closed:
+                future, function, args = queued.popleft()
+                self.pool.submit(self._run, host, future, function, args)
+            else:
+                self._active[host] -= 1
+
+    def close(self):
+        """Cancels the queued fetches and starts no more."""
+        with self._lock:
+            self._closed = True
+            queued, self._queued = self._queued, {}
+        for fetches in queued.values():
+            for future, _, _ in fetches:
+                future.cancel()
+
+class AcquisitionEngine:
+    """
+    Fetches feeds and their new articles concurrently. One thread pool of
+    max_workers is shared by both stages, and a HostQueue keeps each
+    domain to per_host_limit concurrent requests. feed_budget is the wall-clock
+    time in seconds a feed and its articles get from the moment the feed's fetch
+    starts, None for no limit.
+    """
+    def __init__(self, max_workers=16, per_host_limit=2, timeout=15, feed_budget=None):
+        self.max_workers = max_workers
+        self.feed_budget = feed_budget
+        self.client = HttpClient(timeout=timeout, per_host_limit=per_host_limit)
+
+    def fetch_feed(self, feed_url, state=None):
+        """
+        Fetches and parses one feed, returning a FeedResult either way. state is the
+        feed's stored dict of etag, last_modified and content_hash, if any.
+        """
+        started = time.monotonic()
+        state = state or {}
+        headers = {}
+        if state.get('etag'):
+            headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            headers['If-Modified-Since'] = state['last_modified']
+
+        received = None
+        try:
+            response = self.client.get(feed_url, headers)
+            received = time.monotonic()
+            result = FeedResult(
+                feed_url,
+                elapsed=received - started,
+                bytes=len(response.body),
+                http_time=received - started,
+                etag=response.headers.get('etag', state.get('etag')),
+                last_modified=response.headers.get('last-modified', state.get('last_modified'))
+            )
+            if response.status == 304:
+                result.cache = 'not_modified'
+                result.content_hash = state.get('content_hash')
+                return result
+
+            result.content_hash = hashlib.sha256(response.body).hexdigest()
+            if result.content_hash == state.get('content_hash'):
+                result.cache = 'unchanged'
+            else:
+                result.entries = parse_feed(response.body, feed_url, response.url)
+                result.cache = 'changed'
+            result.elapsed = time.monotonic() - started
+            result.parse_time = result.elapsed - result.http_time
+            return result
+        except Exception as e:
+            finished = time.monotonic()
+            return FeedResult(
+                feed_url, [], _describe(e), finished - started,
+                http_time=(received or finished) - started,
+                parse_time=finished - received if received else 0.0
+            )
+
+    def fetch_article(self, entry):
+        """
+        Downloads one article page, returning an ArticleResult either way.
+        Pages checked for changes are requested conditionally with their validators.
+        """
+        started = time.monotonic()
+        validators = entry.validators or {}
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        try:
+            response = self.client.get(entry.link, headers)
+            not_modified = response.status == 304
+            return ArticleResult(
+                entry,
+                None if not_modified else response.text(),
+                None,
+                time.monotonic() - started,
+                len(response.body),
+                etag=response.headers.get('etag', validators.get('etag')),
+                last_modified=response.headers.get(
+                    'last-modified', validators.get('last_modified')
+                ),
+                not_modified=not_modified
+            )
+        except Exception as e:
+            return ArticleResult(entry, None, _describe(e), time.monotonic() - started)
+
+    def collect(self, feed_urls, select_new=None, feed_states=None, deadline=None):
+        """
+        Generator yielding FeedResults and ArticleResults as they complete.
+        select_new is called with each feed's entries and returns the ones whose
+        articles should be downloaded, defaulting to all of them. It runs in the
+        caller's thread, so it can safely use the caller's database connection.
+        feed_states maps feed URLs to their stored conditional GET state.
+        Fetches still pending when their feed's budget or the cycle's deadline,
+        a time.monotonic() value, runs out are given up and yielded as timed out.
+        """
+        feed_states = feed_states or {}
+        started = {}
+
+        def fetch_feed(url):
+            started[url] = time.monotonic()
+            return self.fetch_feed(url, feed_states.get(url))
+
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='acquisition')
+        hosts = HostQueue(pool, self.client.per_host_limit)
+        try:
+            # future to the feed URL and, for articles, the entry
+            pending = {hosts.submit(url, fetch_feed, url): (url, None) for url in feed_urls}
+            queued_links = set()
+            while pending:
+                done, _ = wait(
+                    pending,
+                    timeout=self._time_left(pending, started, deadline),
+                    return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    del pending[future]
+                    result = future.result()
+                    if isinstance(result, FeedResult):
+                        for entry in _new_entries(result, queued_links, select_new):
+                            pending[hosts.submit(entry.link, self.fetch_article, entry)] = (
+                                result.url, entry
+                            )
+                    yield result
+                yield from self._expire(pending, started, deadline)
+        finally:
+            # requests that overran their budget aren't waited for,
+            # their sockets time out on their own
+            hosts.close()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _deadline(self, feed_url, started, deadline):
+        """The earlier of the feed's budget and the cycle's deadline, None if neither."""
+        limits = [deadline] if deadline is not None else []
+        if self.feed_budget is not None and feed_url in started:
+            limits.append(started[feed_url] + self.feed_budget)
+        return min(limits) if limits else None
+
+    def _time_left(self, pending, started, deadline):
+        """Seconds until the first pending fetch runs out of time, None if none can."""
+        now = time.monotonic()
+        limits = [
+            limit for limit in (
+                self._deadline(feed_url, started, deadline) for feed_url, _ in pending.values()
+            ) if limit is not None
+        ]
+        if self.feed_budget is not None and any(
+                feed_url not in started for feed_url, _ in pending.values()):
+            # queued feeds get their budget once they start, so check back soon
+            limits.append(now + 1)
+        if not limits:
+            return None
+        return max(0, min(limits) - now)
+
+    def _expire(self, pending, started, deadline):
+        """Gives up the pending fetches whose time has run out, yielding them as timed out."""
+        now = time.monotonic()
+        for future, (feed_url, entry) in list(pending.items()):
+            limit = self._deadline(feed_url, started, deadline)
+            if limit is None or now < limit:
+                continue
+            del pending[future]
+            future.cancel()
+            if deadline is not None and now >= deadline:
+                error = TimeoutError("Cycle time budget exceeded")
+            else:
+                error = TimeoutError(f"Feed time budget of {self.feed_budget} s exceeded")
+            if entry is None:
+                yield FeedResult(feed_url, [], _describe(error), now - started.get(feed_url, now))
+            else:
+                yield ArticleResult(entry, None, _describe(error))
+
+    def close(self):
+        """Releases pooled connections."""
+        self.client.close()
+
+def _new_entries(result, queued_links, select_new):
+    """
+    The entries of a feed result whose articles should be downloaded: those not
+    already queued this cycle that select_new, if given, picks. Marks them queued.
+    """
+    entries = [entry for entry in result.entries if entry.link not in queued_links]
+    if select_new is not None and entries:
+        entries = select_new(entries)
+    queued_links.update(entry.link for entry in entries)
+    return entries
+
+def _describe(error):
+    """Short error description with the error class, for logs and fetch stats."""
+    return f"{type(error).__name__}: {error}"
@@ -0,0 +1,330 @@
+"""
+This extracts article text from downloaded HTML, the part process.py used to do.
+Extraction uses newspaper (newspaper4k, installed with the rss-fetcher requirements)
+when available and otherwise falls back to a plain paragraph scraper.
+Parsing is CPU-bound, so a large backlog is split into batches across a process pool,
+while the calling process stays the only writer and saves each batch in one transaction.
+A durable watermark of the last id extracted keeps each cycle to the rows added since.
+ExtractionPipeline extracts articles as they are downloaded, so that extraction
+overlaps with the rest of the downloading. Used by collection_cycle.py.
+"""
+import re
+import time
+import multiprocessing
+from itertools import chain
+from collections import deque
+from html.parser import HTMLParser
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from sqlalchemy import text
+
+from src.utils.db_schema import to_db_time, get_state, set_state
+from src.utils.collector_worker import report_progress
+from src.utils.html_storage import decode_html
+from src.views.data_acquisition.acquisition_engine import parse_date
+
+WATERMARK_KEY = 'extract_watermark'
+# downloaded articles waiting for extraction, with their HTML in either place
+PENDING = (
+    "articles.full_text IS NULL "
+    "AND (articles.html IS NOT NULL OR articles.body_hash IS NOT NULL)"
+)
+
+try:
+    import newspaper
+except ImportError:
+    newspaper = None
+
+class _ParagraphParser(HTMLParser):
+    """Collects the title, publish time meta and paragraph text of a page."""
+    SKIPPED = {'script', 'style', 'noscript', 'nav', 'header', 'footer', 'aside'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = None
+        self.published = None
+        self.paragraphs = []
+        self._current = None
+        self._in_title = False
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        attributes = dict(attrs)
+        if tag in self.SKIPPED:
+            self._skip_depth += 1
+        elif tag == 'title':
+            self._in_title = True
+        elif tag == 'p' and not self._skip_depth:
+            self._current = []
+        elif tag == 'meta' and not self.published:
+            name = (attributes.get('property') or attributes.get('name') or '').lower()
+            if name in ('article:published_time', 'pubdate', 'date', 'dc.date'):
+                self.published = parse_date(attributes.get('content'))
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag == 'title':
+            self._in_title = False
+        elif tag == 'p' and self._current is not None:
+            paragraph = re.sub(r'\s+', ' ', ''.join(self._current)).strip()
+            if paragraph:
+                self.paragraphs.append(paragraph)
+            self._current = None
+
+    def handle_data(self, data):
+        if self._in_title and not self.title:
+            self.title = data.strip() or None
+        elif self._current is not None and not self._skip_depth:
+            self._current.append(data)
+
+def extract_article(html, url=''):
+    """
+    Returns a dict with full_text, title and time extracted from the HTML.
+    Missing values are None, full_text is an empty string if nothing was found.
+    """
+    if newspaper is not None:
+        article = newspaper.Article(url or 'http://localhost/')
+        article.download(input_html=html)
+        article.parse()
+        published = article.publish_date
+        if published is not None and published.tzinfo:
+            published = parse_date(published.isoformat())
+        return {
+            'full_text': article.text or '',
+            'title': article.title or None,
+            'time': published
+        }
+
+    parser = _ParagraphParser()
+    parser.feed(html)
+    parser.close()
+    return {
+        'full_text': '\n\n'.join(parser.paragraphs),
+        'title': parser.title,
+        'time': parser.published
+    }
+
+def extract_batch(rows):
+    """
+    Extracts a batch of (id, url, html) rows, returning (id, extracted, ok) tuples.
+    The HTML may be as stored, compressed or not.
+    Runs in the pool's processes, so it has to stay a picklable top-level function.
+    """
+    results = []
+    for article_id, url, html in rows:
+        try:
+            results.append((article_id, extract_article(decode_html(html), url), True))
+        except Exception:
+            # an empty text marks it done so a broken page isn't retried every cycle
+            results.append((article_id, {'full_text': '', 'title': None, 'time': None}, False))
+    return results
+
+def iter_pending_batches(connection, batch_size, after_id=0):
+    """
+    Yields batches of downloaded articles without full text past after_id, in id order,
+    with their HTML from the body store or the articles table. Seeking by id keeps
+    each query to the rows past the previous batch.
+    """
+    last_id = after_id
+    while True:
+        rows = connection.execute(text(f"""
+            SELECT articles.id, articles.url, COALESCE(article_bodies.html, articles.html)
+            FROM articles
+            LEFT JOIN article_bodies ON article_bodies.content_hash = articles.body_hash
+            WHERE articles.id > :last_id AND {PENDING}
+            ORDER BY articles.id
+            LIMIT :batch_size
+        """), {'last_id': last_id, 'batch_size': batch_size}).fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [tuple(row) for row in rows]
+
+def has_pending(connection):
+    """Whether any downloaded article past the watermark is waiting for extraction."""
+    return bool(connection.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM articles WHERE id > :id AND {PENDING})"
+    ), {'id': int(get_state(connection, WATERMARK_KEY, 0))}).scalar())
+
+def process_pending(connection, workers=1, batch_size=50, deadline=None):
+    """
+    Extracts the downloaded articles without full text past the watermark and writes
+    the results back, using a pool of the given number of processes when there is
+    more than one batch. Returns a dict of counts and the watermark before and after.
+    No new batches are started past the deadline, a time.monotonic() value, and the
+    rest are left for the next call. Progress is reported after each batch when run
+    in the collector worker.
+    """
+    watermark = int(get_state(connection, WATERMARK_KEY, 0))
+    counts = {'processed': 0, 'failed': 0, 'watermark_from': watermark, 'watermark': watermark}
+    batches = iter_pending_batches(connection, batch_size, watermark)
+
+    first = next(batches, None)
+    if first is None:
+        # nothing past the watermark is ready to be extracted, for example because the
+        # pipeline got to it first, so it moves up to the last article before the first
+        # one still without text, which another collector may be storing the page of
+        last_id = connection.execute(text("""
+            SELECT COALESCE(
+                (SELECT MIN(id) - 1 FROM articles WHERE id > :id AND full_text IS NULL),
+                (SELECT MAX(id) FROM articles)
+            )
+        """), {'id': watermark}).scalar()
+        if last_id and last_id > watermark:
+            set_state(connection, WATERMARK_KEY, last_id)
+            connection.commit()
+            counts['watermark'] = last_id
+        return counts
+    # past the watermark this is a range scan of the primary key
+    counts['pending'] = connection.execute(text(
+        f"SELECT COUNT(*) FROM articles WHERE id > :id AND {PENDING}"
+    ), {'id': watermark}).scalar()
+    report_progress('processing', force=True, processed=0, failed=0, pending=counts['pending'])
+    batches = _until(chain([first], batches), deadline)
+    if workers <= 1 or len(first) < batch_size:
+        # a single process, or a backlog too small to be worth starting a pool for
+        for batch in batches:
+            save_batch(connection, extract_batch(batch), counts, batch[-1][0])
+        return counts
+    _process_in_pool(connection, batches, workers, counts)
+    return counts
+
+def _until(batches, deadline):
+    """Passes batches on until the deadline."""
+    for batch in batches:
+        if deadline is not None and time.monotonic() >= deadline:
+            return
+        yield batch
+
+def _process_in_pool(connection, batches, workers, counts):
+    """Extracts the batches in a process pool, saving them as they finish."""
+    # batches finish out of order, so the watermark only moves past a batch
+    # once every batch before it has been saved too
+    in_order = deque()
+    saved = set()
+
+    def save_done(futures):
+        for future in futures:
+            save_batch(connection, future.result(), counts)
+            saved.add(future)
+        while in_order and in_order[0][0] in saved:
+            future, last_id = in_order.popleft()
+            saved.discard(future)
+            counts['watermark'] = last_id
+        set_state(connection, WATERMARK_KEY, counts['watermark'])
+        connection.commit()
+
+    # spawned rather than forked, since the acquisition threads may be running
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        # a couple of batches in flight per process keeps them busy without
+        # holding the whole backlog's HTML in memory
+        pending = set()
+        for batch in batches:
+            future = pool.submit(extract_batch, batch)
+            in_order.append((future, batch[-1][0]))
+            pending.add(future)
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                save_done(done)
+        save_done(pending)
+
+class ExtractionPipeline:
+    """
+    Consumer stage of a cycle: downloaded articles are put in as they are stored and
+    extracted in batches while the downloading goes on. With more than one worker,
+    full batches go to a process pool that is started on the first one, and at most
+    two batches per process are in flight, past which put() blocks until one is
+    saved. The caller's connection stays the only writer. Call close() at the end.
+    """
+    def __init__(self, connection, workers=1, batch_size=50):
+        self.connection = connection
+        self.workers = workers
+        self.batch_size = batch_size
+        self.counts = {'processed': 0, 'failed': 0}
+        self._batch = []
+        self._in_flight = set()
+        self._pool = None
+
+    def put(self, article_id, url, html):
+        """Queues a stored article for extraction, saving any batches done meanwhile."""
+        self._batch.append((article_id, url, html))
+        if len(self._batch) >= self.batch_size:
+            self._submit()
+        self._save_done(block=False)
+
+    def throttle(self):
+        """Extracts later batches in the calling process, saving the memory of a pool."""
+        self.workers = 1
+
+    def _submit(self):
+        batch, self._batch = self._batch, []
+        if self.workers <= 1:
+            save_batch(self.connection, extract_batch(batch), self.counts)
+            return
+        if self._pool is None:
+            # spawned rather than forked, since the acquisition threads are running
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        while len(self._in_flight) >= self.workers * 2:
+            self._save_done(block=True)
+        self._in_flight.add(self._pool.submit(extract_batch, batch))
+
+    def _save_done(self, block):
+        if not self._in_flight:
+            return
+        done, self._in_flight = wait(
+            self._in_flight, timeout=None if block else 0, return_when=FIRST_COMPLETED
+        )
+        for future in done:
+            save_batch(self.connection, future.result(), self.counts)
+
+    def close(self):
+        """Extracts what is left and waits for the batches in flight."""
+        try:
+            if self._batch:
+                if self._pool is None:
+                    # a last small batch isn't worth starting a pool for
+                    save_batch(self.connection, extract_batch(self._batch), self.counts)
+                    self._batch = []
+                else:
+                    self._submit()
+            while self._in_flight:
+                self._save_done(block=True)
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+def save_batch(connection, results, counts, watermark=None):
+    """
+    Writes a batch of extraction results in one transaction and updates counts,
+    moving the watermark in the same transaction if given. Articles with the same
+    body that are still waiting for it get the same text.
+    """
+    connection.execute(text("""
+        UPDATE articles
+        SET full_text = :full_text,
+            title = COALESCE(:title, title),
+            time = COALESCE(:time, time)
+        WHERE id = :id OR (
+            full_text IS NULL
+            AND body_hash = (SELECT body_hash FROM articles WHERE id = :id)
+        )
+    """), [
+        {**extracted, 'time': to_db_time(extracted['time']), 'id': article_id}
+        for article_id, extracted, _ in results
+    ])
+    if watermark is not None:
+        set_state(connection, WATERMARK_KEY, watermark)
+        counts['watermark'] = watermark
+    connection.commit()
+    for _, _, ok in results:
+        counts['processed' if ok else 'failed'] += 1
+    report_progress(
+        'processing',
+        processed=counts['processed'],
+        failed=counts['failed'],
+        pending=counts.get('pending')
+    )
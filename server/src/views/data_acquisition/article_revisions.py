@@ -0,0 +1,198 @@
+"""
+This detects changes to already collected articles and keeps their revisions.
+Known article URLs are normally skipped, but when a feed lists one with a new
+publication date, or under another feed than before, its page is checked again.
+The check is a conditional GET with the validators the page was stored with, and
+then the hash of the HTML against the stored body, so unchanged pages are never
+extracted again. A changed page whose text changed too becomes a new revision: the
+article row is updated and the previous version goes to article_revisions, which
+keeps each revision's text for line diffs.
+Used by collection_cycle.py and article_history.py.
+"""
+import difflib
+import time
+from dataclasses import replace
+from datetime import datetime
+from sqlalchemy import text, bindparam
+
+from src.utils.db_schema import to_db_time
+from src.utils.html_storage import content_hash, decode_html, store_body
+from src.views.data_acquisition.article_extractor import extract_batch
+from src.views.data_acquisition.url_index import url_key
+
+# a known article listed with a new date or under another feed is checked again
+# at most this often, so feeds that change them on every fetch don't cost a download each
+RECHECK_AFTER = 60 * 60
+
+def select_rechecks(connection, entries, now=None):
+    """
+    Returns the entries of known articles whose pages should be checked for changes,
+    with their article ids and validators set. Articles collected before change
+    detection get their current feed and date recorded instead, as the baseline.
+    """
+    keys = {url_key(entry.link): entry for entry in entries}
+    if not keys:
+        return []
+    rows = connection.execute(text("""
+        SELECT articles.id, articles.url_key, article_sources.article_id AS tracked,
+            article_sources.feed_url, article_sources.published, article_sources.etag,
+            article_sources.last_modified, article_sources.checked_at
+        FROM articles
+        LEFT JOIN article_sources ON article_sources.article_id = articles.id
+        WHERE articles.url_key IN :keys
+    """).bindparams(bindparam('keys', expanding=True)), {'keys': list(keys)}).fetchall()
+
+    now = time.time() if now is None else now
+    rechecks = []
+    for row in rows:
+        entry = keys[row.url_key]
+        published = to_db_time(entry.published)
+        if row.tracked is None:
+            save_source(connection, row.id, entry)
+        elif (row.checked_at or 0) < now - RECHECK_AFTER and (
+                (published is not None and published != row.published)
+                or entry.feed_url != row.feed_url):
+            rechecks.append(replace(entry, article_id=row.id, validators={
+                'etag': row.etag, 'last_modified': row.last_modified
+            }))
+    return rechecks
+
+def save_source(connection, article_id, entry, result=None, now=None):
+    """
+    Records the feed and date an article was last seen with, and the validators
+    of its page if it was downloaded.
+    """
+    connection.execute(text("""
+        INSERT INTO article_sources (
+            article_id, feed_url, published, etag, last_modified, checked_at
+        )
+        VALUES (:article_id, :feed_url, :published, :etag, :last_modified, :checked_at)
+        ON CONFLICT (article_id) DO UPDATE SET
+            feed_url = excluded.feed_url,
+            published = excluded.published,
+            etag = COALESCE(excluded.etag, etag),
+            last_modified = COALESCE(excluded.last_modified, last_modified),
+            checked_at = excluded.checked_at
+    """), {
+        'article_id': article_id,
+        'feed_url': entry.feed_url,
+        'published': to_db_time(entry.published),
+        'etag': result.etag if result else None,
+        'last_modified': result.last_modified if result else None,
+        'checked_at': time.time() if now is None else now
+    })
+
+def check_revision(connection, result):
+    """
+    Handles the ArticleResult of a page checked for changes and returns the outcome:
+    'failed', 'not_modified' for a 304, 'unchanged' for the same HTML or text, or
+    'revised' when a new revision was stored. Only pages with new HTML are extracted.
+    """
+    if result.error:
+        # the source stays as it was, so the page is checked again next time
+        return 'failed'
+    article_id = result.entry.article_id
+    if result.not_modified:
+        save_source(connection, article_id, result.entry, result)
+        return 'not_modified'
+
+    current = connection.execute(text("""
+        SELECT body_hash, html, full_text, title, time, download_time
+        FROM articles WHERE id = :id
+    """), {'id': article_id}).one_or_none()
+    if current is None:
+        return 'failed'
+    return compare_revision(connection, result, current)
+
+def compare_revision(connection, result, current):
+    """
+    Compares a downloaded page with the current version of its article, a row of its
+    articles columns, and stores a new revision if its text changed. Returns the outcome
+    for check_revision().
+    """
+    article_id = result.entry.article_id
+    stored_hash = current.body_hash or (current.html and content_hash(decode_html(current.html)))
+    if stored_hash == content_hash(result.html):
+        save_source(connection, article_id, result.entry, result)
+        return 'unchanged'
+
+    _, extracted, ok = extract_batch([(article_id, result.entry.link, result.html)])[0]
+    if not ok:
+        return 'failed'
+    save_source(connection, article_id, result.entry, result)
+    # a page where only the markup around the text changed isn't a revision
+    if extracted['full_text'] == current.full_text:
+        return 'unchanged'
+    store_revision(connection, article_id, current, result.html, extracted)
+    return 'revised'
+
+def store_revision(connection, article_id, current, html, extracted):
+    """
+    Moves the current version of an article, a row of its articles columns, to
+    article_revisions and updates the article with the new page and its extracted text.
+    """
+    connection.execute(text("""
+        INSERT INTO article_revisions (
+            article_id, revision, body_hash, full_text, title, time, download_time
+        )
+        SELECT :article_id,
+            COALESCE((SELECT MAX(revision) FROM article_revisions
+                      WHERE article_id = :article_id), 0) + 1,
+            :body_hash, :full_text, :title, :time, :download_time
+    """), {
+        'article_id': article_id,
+        # HTML still in the articles table moves to the body store with its revision
+        'body_hash': current.body_hash or (
+            current.html and store_body(connection, decode_html(current.html))[0]
+        ),
+        'full_text': current.full_text,
+        'title': current.title,
+        'time': current.time,
+        'download_time': current.download_time
+    })
+    body_hash, _ = store_body(connection, html)
+    connection.execute(text("""
+        UPDATE articles SET
+            html = NULL,
+            body_hash = :body_hash,
+            full_text = :full_text,
+            title = :title,
+            time = :time,
+            download_time = :download_time
+        WHERE id = :id
+    """), {
+        'id': article_id,
+        'body_hash': body_hash,
+        'full_text': extracted['full_text'],
+        'title': extracted['title'] or current.title,
+        'time': to_db_time(extracted['time']) or current.time,
+        'download_time': datetime.now().isoformat(sep=' ')
+    })
+
+def get_revisions(connection, article_id):
+    """
+    Returns the revisions of an article as dicts in order, the current version
+    last, or None if there is no such article.
+    """
+    current = connection.execute(text("""
+        SELECT full_text, title, time, download_time FROM articles WHERE id = :id
+    """), {'id': article_id}).one_or_none()
+    if current is None:
+        return None
+    rows = connection.execute(text("""
+        SELECT revision, full_text, title, time, download_time FROM article_revisions
+        WHERE article_id = :id ORDER BY revision
+    """), {'id': article_id}).fetchall()
+    revisions = [{**row._asdict(), 'current': False} for row in rows]
+    revisions.append({**current._asdict(), 'revision': len(rows) + 1, 'current': True})
+    return revisions
+
+def revision_diff(old, new):
+    """Unified diff of the texts of two revision dicts, line by line."""
+    return '\n'.join(difflib.unified_diff(
+        (old['full_text'] or '').splitlines(),
+        (new['full_text'] or '').splitlines(),
+        fromfile=f"revision {old['revision']}",
+        tofile=f"revision {new['revision']}",
+        lineterm=''
+    ))
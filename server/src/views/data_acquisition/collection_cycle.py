@@ -0,0 +1,409 @@
+"""
+This runs one collection cycle, the work collect.py and process.py used to do:
+the enabled feeds of the feed registry that are due by the feed scheduler and their
+new article pages are fetched concurrently by the acquisition engine, stored in the
+articles table and then extracted. The resource guard can throttle, stop storing HTML
+or pause a cycle. Collector instances sharing the database can split the feeds
+between them through the feed leases of feed_leases.py.
+Runs inside the collector worker, so it must not depend on the Flask app.
+Called by content_fetcher.py via collector_worker.py.
+"""
+import time
+from datetime import datetime
+from sqlalchemy import create_engine, text
+
+from src.utils.db_schema import ensure_articles_table, ensure_collection_tables, to_db_time
+from src.utils.container_limits import worker_count
+from src.utils.collector_worker import report_progress
+from src.utils.db_coordination import enable_wal
+from src.utils.html_storage import (
+    store_body,
+    extracted_for_body,
+    move_stored_html,
+    register_sql_functions
+)
+from src.views.data_acquisition.acquisition_engine import (
+    AcquisitionEngine,
+    FeedResult
+)
+from src.views.data_acquisition.article_extractor import (
+    process_pending,
+    extract_batch,
+    ExtractionPipeline
+)
+from src.views.data_acquisition.url_index import SeenUrlIndex, url_key
+from src.views.data_acquisition.feed_scheduler import FeedScheduler, ScheduleSettings
+from src.views.data_acquisition.feed_registry import (
+    ensure_feed_registry,
+    load_enabled_feeds,
+    record_health
+)
+from src.views.data_acquisition.article_revisions import (
+    select_rechecks,
+    save_source,
+    check_revision
+)
+from src.views.data_acquisition.feed_leases import ShardSettings, claim_feeds
+from src.views.data_acquisition.fetch_history import FetchRun
+from src.views.data_acquisition.resource_guard import ResourceGuard, ResourceLimits
+from src.views.data_acquisition.feed_state import (
+    load_feed_states,
+    save_feed_state,
+    invalidate_feed_state
+)
+
+# engines are kept per database between cycles, since the worker is long-lived
+_db_engines = {}
+
+def get_db_engine(database_url):
+    """Returns the cached engine for the database URL."""
+    if database_url not in _db_engines:
+        # sharded collectors take turns writing, so they wait longer for the lock
+        connect_args = {'timeout': 30} if database_url.startswith('sqlite') else {}
+        _db_engines[database_url] = create_engine(
+            database_url, echo=False, connect_args=connect_args
+        )
+        register_sql_functions(_db_engines[database_url])
+        enable_wal(_db_engines[database_url])
+    return _db_engines[database_url]
+
+def insert_article(connection, result, extracted=None):
+    """
+    Stores a downloaded article and returns its id and whether its page was a
+    duplicate. The HTML goes to the body store and the text is filled in by
+    extraction later, except for duplicates, which get the text of an article with
+    the same body, or get it once that one is extracted. If extracted is given,
+    its text is stored instead and the HTML isn't stored at all.
+    """
+    values = {
+        'url': result.entry.link,
+        'url_key': url_key(result.entry.link),
+        'body_hash': None,
+        'full_text': None,
+        'title': result.entry.title,
+        'time': to_db_time(result.entry.published),
+        'download_time': datetime.now().isoformat(sep=' ')
+    }
+    duplicate = False
+    if extracted is not None:
+        values['full_text'] = extracted['full_text']
+        values['title'] = extracted['title'] or values['title']
+        values['time'] = to_db_time(extracted['time']) or values['time']
+    else:
+        values['body_hash'], duplicate = store_body(connection, result.html)
+        known = duplicate and extracted_for_body(connection, values['body_hash'])
+        if known:
+            values['full_text'] = known.full_text
+            values['title'] = known.title or values['title']
+            values['time'] = known.time or values['time']
+    article_id = connection.execute(text("""
+        INSERT INTO articles (url, url_key, body_hash, full_text, title, time, download_time)
+        VALUES (:url, :url_key, :body_hash, :full_text, :title, :time, :download_time)
+    """), values).lastrowid
+    return article_id, duplicate
+
+def run_cycle(database_url, fetcher_folder, options=None, force=False):
+    """
+    Runs one full cycle and returns a summary dict of counts, timings and errors.
+    options may have the sections 'fetch' (max_workers, per_host_limit, timeout
+    and feed_budget for the engine), 'schedule' (fields of ScheduleSettings),
+    'extraction' (workers, 0 for the CPU quota, and batch_size), 'history'
+    (keep_runs), 'cycle' (budget, the cycle's wall-clock time in seconds),
+    'resources' (fields of ResourceLimits) and 'shard' (fields of ShardSettings,
+    for collecting only a share of the feeds next to other collector instances).
+    Only due feeds are polled unless forced. Known articles listed with a new date
+    or under another feed are checked for changes, and changed ones get a new
+    revision. New articles are extracted while the rest are downloading, and whatever
+    is left over is extracted after. Pages are stored once in the body store, so
+    duplicates aren't extracted again, and HTML still in the articles table is moved
+    there at the end.
+    Fetches and extraction batches that don't fit the budget are left for the next
+    cycle. Cycles that did something, or failed, are recorded in the fetch history.
+    Progress is reported as it goes when run in the collector worker.
+    When the resource guard finds the disk or memory too low, the cycle runs with
+    less concurrency, stores extracted text without the HTML, or doesn't collect
+    at all, and the reason is recorded in the summary and the fetch history.
+    """
+    options = options or {}
+    started = time.monotonic()
+    summary = {
+        'feeds': 0,
+        'polled': 0,
+        'next_poll_in': None,
+        'feed_errors': [],
+        'disabled_feeds': [],
+        'entries': 0,
+        'known_skipped': 0,
+        'new_articles': 0,
+        'article_errors': 0,
+        'processed': 0,
+        'extract_failed': 0,
+        'pipelined': 0,
+        'watermark_from': None,
+        'watermark': None,
+        'duplicate_bodies': 0,
+        'html_moved': 0,
+        'page_checks': {'not_modified': 0, 'unchanged': 0, 'revised': 0, 'failed': 0},
+        'feed_cache': {'not_modified': 0, 'unchanged': 0, 'changed': 0},
+        'budget_exceeded': False,
+        'resources': None,
+        'shard': None
+    }
+    run = FetchRun(summary, cycle_deadline(started, options))
+    guard = ResourceGuard.for_database(
+        database_url, ResourceLimits(**options.get('resources', {}))
+    )
+    if guard.check().at_least('pause'):
+        return skip_paused(database_url, run, guard, options)
+    if guard.state.at_least('throttle'):
+        options = throttled(options)
+
+    db_engine = get_db_engine(database_url)
+    engine = AcquisitionEngine(**options.get('fetch', {}))
+
+    try:
+        with db_engine.connect() as connection:
+            ensure_articles_table(connection, **options.get('search', {}))
+            scheduler, shard = load_scheduler(connection, fetcher_folder, options, summary)
+            pipeline = ExtractionPipeline(connection, **extraction_settings(options))
+            try:
+                collect_due_feeds(
+                    connection, engine, scheduler, run, force, pipeline=pipeline, guard=guard
+                )
+            finally:
+                pipeline.close()
+            summary['processed'] += pipeline.counts['processed']
+            summary['extract_failed'] += pipeline.counts['failed']
+            summary['pipelined'] = pipeline.counts['processed'] + pipeline.counts['failed']
+            scheduler.save(connection)
+            connection.commit()
+            if scheduler.next_due_at() is not None:
+                summary['next_poll_in'] = round(max(0, scheduler.next_due_at() - time.time()))
+        summary['collect_duration'] = round(time.monotonic() - started, 3)
+        # with sharding one instance takes care of the shared backlogs
+        if not guard.poll().at_least('pause') and (shard is None or shard.leader):
+            extract_pending(db_engine, extraction_settings(options), run)
+            move_html_backlog(db_engine, run)
+    except Exception as e:
+        summary['duration'] = round(time.monotonic() - started, 3)
+        summary['resources'] = guard.worst.as_dict()
+        with db_engine.connect() as connection:
+            run.save(connection, e, **options.get('history', {}))
+        raise
+    finally:
+        engine.close()
+
+    summary['duration'] = round(time.monotonic() - started, 3)
+    summary['budget_exceeded'] = run.deadline is not None and time.monotonic() >= run.deadline
+    summary['resources'] = guard.worst.as_dict()
+    if summary['polled'] or summary['processed'] or summary['resources']:
+        with db_engine.connect() as connection:
+            run.save(connection, **options.get('history', {}))
+    return summary
+
+def load_scheduler(connection, fetcher_folder, options, summary):
+    """
+    Loads the feed scheduler for the enabled feeds of the registry, with their own
+    settings. With sharding, only the feeds the instance claimed are scheduled.
+    Returns the scheduler and the Shard, None without sharding. Used by run_cycle().
+    """
+    ensure_feed_registry(connection, fetcher_folder)
+    feed_urls, overrides = load_enabled_feeds(connection)
+    shard = None
+    if options.get('shard'):
+        shard = claim_feeds(connection, feed_urls, ShardSettings(**options['shard']))
+        summary['shard'] = shard.as_dict()
+    summary['feeds'] = len(feed_urls if shard is None else shard.feed_urls)
+    scheduler = FeedScheduler.load(
+        connection, feed_urls, ScheduleSettings(**options.get('schedule', {})), overrides,
+        claimed=None if shard is None else shard.feed_urls
+    )
+    return scheduler, shard
+
+def skip_paused(database_url, run, guard, options):
+    """Records a cycle the resource guard paused before it began and returns its summary."""
+    run.summary['resources'] = guard.worst.as_dict()
+    with get_db_engine(database_url).connect() as connection:
+        ensure_collection_tables(connection)
+        run.save(connection, **options.get('history', {}))
+    return run.summary
+
+def cycle_deadline(started, options):
+    """The cycle's deadline as a time.monotonic() value, None without a budget."""
+    budget = options.get('cycle', {}).get('budget')
+    return started + budget if budget else None
+
+def throttled(options):
+    """
+    Cycle options with half the fetch concurrency and no extraction pool,
+    for when memory runs low.
+    """
+    fetch = options.get('fetch', {})
+    return {
+        **options,
+        'fetch': {**fetch, 'max_workers': max(1, fetch.get('max_workers', 16) // 2)},
+        'extraction': {**options.get('extraction', {}), 'workers': 1}
+    }
+
+def extraction_settings(options):
+    """Extraction pool size and batch size from the cycle options."""
+    extraction = options.get('extraction', {})
+    return {
+        'workers': worker_count(extraction.get('workers', 0)),
+        'batch_size': extraction.get('batch_size', 50)
+    }
+
+def extract_pending(db_engine, settings, run):
+    """
+    Extracts the articles the pipeline didn't get to, such as ones stored by an
+    earlier, interrupted cycle. Used by run_cycle().
+    """
+    with db_engine.connect() as connection:
+        counts = process_pending(connection, deadline=run.deadline, **settings)
+    run.summary['processed'] += counts['processed']
+    run.summary['extract_failed'] += counts['failed']
+    run.summary['watermark_from'] = counts['watermark_from']
+    run.summary['watermark'] = counts['watermark']
+
+def move_html_backlog(db_engine, run):
+    """
+    Moves HTML still stored in the articles table, by older cycles or the original
+    collector, to the body store within the cycle's budget. Used by run_cycle().
+    """
+    with db_engine.connect() as connection:
+        run.summary['html_moved'] = move_stored_html(connection, deadline=run.deadline)
+
+def collect_due_feeds(  # pylint: disable=too-many-arguments
+        connection, engine, scheduler, run, force=False, pipeline=None, guard=None):
+    """
+    Polls the due feeds and downloads their new articles, recording schedules and
+    the FetchRun with its summary counts as results come in. Stored articles are
+    put to the extraction pipeline, if given, which may block for backpressure.
+    The resource guard, if given, is polled as results come in: once it finds disk
+    space short, articles are extracted right away and stored without HTML, memory
+    running short stops the pipeline's pool, and at pause level collecting stops.
+    A feed's state is only saved once all of its articles are done, so if the cycle
+    is cut short the feed
+    is fetched and parsed in full again next time rather than its missed articles
+    being hidden behind a 304. Used by run_cycle().
+    """
+    summary = run.summary
+    due_urls = scheduler.pop_due(force=force)
+    summary['polled'] = len(due_urls)
+    if not due_urls:
+        return
+    report_progress('collecting', force=True, feeds_done=0, feeds_total=len(due_urls),
+                    articles_done=0, articles_queued=0, new_articles=0)
+
+    feed_states = load_feed_states(connection)
+    seen_urls = SeenUrlIndex.load(connection)
+    new_by_feed = {}
+    # feed results waiting for their articles, with the count of those left
+    unfinished = {}
+
+    def settle(feed_url, failed=False):
+        """Counts a finished fetch of the feed, saving its state after the last one."""
+        feed = unfinished[feed_url]
+        feed['left'] -= 1
+        feed['failed'] = feed['failed'] or failed
+        if feed['left'] == 0:
+            del unfinished[feed_url]
+            save_feed_state(connection, feed['result'], feed_states.get(feed_url))
+            if feed['failed']:
+                # forget the validators so the failed articles are retried next time
+                invalidate_feed_state(connection, feed_url)
+            connection.commit()
+
+    for result in engine.collect(
+            due_urls, _entry_selector(connection, seen_urls, summary, new_by_feed),
+            feed_states, run.deadline):
+        if isinstance(result, FeedResult):
+            scheduler.record(result.url, new_by_feed.get(result.url, 0), bool(result.error))
+            record_feed_health(connection, result, scheduler.settings, summary)
+            run.feed_polled(result, new_by_feed.get(result.url, 0))
+            # the feed itself and each of its new articles
+            unfinished[result.url] = {
+                'result': result, 'left': new_by_feed.get(result.url, 0) + 1, 'failed': False
+            }
+            settle(result.url)
+            if result.error:
+                summary['feed_errors'].append(f"{result.url}: {result.error}")
+            else:
+                summary['feed_cache'][result.cache] += 1
+        elif result.entry.article_id is not None:
+            # a known article's page checked for changes, not a new article
+            summary['page_checks'][check_revision(connection, result)] += 1
+            connection.commit()
+        else:
+            run.article_done(result)
+            if result.error:
+                summary['article_errors'] += 1
+            else:
+                store_article(connection, result, summary, pipeline, guard and guard.poll())
+                summary['new_articles'] += 1
+            settle(result.entry.feed_url, bool(result.error))
+        report_progress(
+            'collecting',
+            feeds_done=len(run.feeds),
+            feeds_total=len(due_urls),
+            articles_done=summary['new_articles'] + summary['article_errors'],
+            articles_queued=sum(new_by_feed.values()),
+            new_articles=summary['new_articles']
+        )
+        if guard is not None and guard.poll().at_least('pause'):
+            # unfinished feeds keep their old state, so they are fetched in full next time
+            break
+
+def record_feed_health(connection, result, settings, summary):
+    """
+    Records a polled feed's health in the registry, listing it in the summary if
+    this poll got it disabled for failing. Used by collect_due_feeds().
+    """
+    health = record_health(
+        connection, result.url, result.error, result.cache, settings.disable_after
+    )
+    if health is not None and health.auto_disabled and not health.enabled:
+        summary['disabled_feeds'].append(result.url)
+
+def store_article(connection, result, summary, pipeline=None, resources=None):
+    """
+    Stores a downloaded article and puts it to the pipeline, unless its page is a
+    duplicate of one stored before. When the resource state is at skip_html, it's
+    extracted right away and stored without the HTML instead.
+    Used by collect_due_feeds().
+    """
+    if resources is not None and resources.at_least('skip_html'):
+        _, extracted, ok = extract_batch([(None, result.entry.link, result.html)])[0]
+        article_id, _ = insert_article(connection, result, extracted)
+        save_source(connection, article_id, result.entry, result)
+        connection.commit()
+        summary['processed' if ok else 'extract_failed'] += 1
+        return
+
+    article_id, duplicate = insert_article(connection, result)
+    save_source(connection, article_id, result.entry, result)
+    connection.commit()
+    if duplicate:
+        summary['duplicate_bodies'] += 1
+    elif pipeline is not None:
+        if resources is not None and resources.at_least('throttle'):
+            pipeline.throttle()
+        pipeline.put(article_id, result.entry.link, result.html)
+
+def _entry_selector(connection, seen_urls, summary, new_by_feed):
+    """
+    Returns the select_new function for AcquisitionEngine.collect(), which picks
+    the entries not collected before and counts them by feed, and adds the known
+    entries whose pages should be checked for changes.
+    """
+    def select_new(entries):
+        unseen = seen_urls.select_unseen(connection, entries)
+        summary['entries'] += len(entries)
+        summary['known_skipped'] += len(entries) - len(unseen)
+        new_by_feed[entries[0].feed_url] = len(unseen)
+        unseen_links = {entry.link for entry in unseen}
+        rechecks = select_rechecks(
+            connection, [entry for entry in entries if entry.link not in unseen_links]
+        )
+        return unseen + rechecks
+    return select_new
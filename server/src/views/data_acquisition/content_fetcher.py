@@ -1,112 +1,302 @@
 """
-This handles fetching routes, schedules fetching and
-manages collect.py and process.py. Called by routes.py.
+This handles fetching routes, schedules fetching and runs the collection
+cycles in the collector worker. Called by routes.py.
 """
-import os
-import subprocess
-from flask import jsonify
+from flask import jsonify, request, current_app
+from sqlalchemy.exc import SQLAlchemyError
 
 from src.utils.resource_management import scheduler
-from src.utils.processing_status import ProcessingStatus
+from src.utils.cycle_progress import CycleProgress
+from src.utils.collector_worker import collector_worker, CycleInterrupted
+from src.utils.html_storage import has_stored_html
+from src.views.data_acquisition.feed_state import get_cache_stats
+from src.views.data_acquisition.fetch_history import get_history
+from src.views.data_acquisition.feed_registry import count_enabled_feeds
+from src.views.data_acquisition.feed_validator import probe_disabled_feeds
+from src.views.data_acquisition.feed_leases import release_feeds
+from src.views.data_acquisition.feed_scheduler import count_due_feeds
+from src.views.data_acquisition.article_extractor import has_pending
 
 def start_fetch():
     """
-    Schedules the fetching job to run at five minute intervals, starting now.
-    Uses run_collect_and_process(). Called by routes.init_routes() for route /api/start.
+    Schedules the fetching job to tick at short intervals, starting now with every feed.
+    Each tick only polls the feeds that the adaptive feed scheduler finds due, and
+    feeds disabled for failing are probed at longer intervals.
+    Uses run_collect_and_process() and run_feed_probe().
+    Called by routes.init_routes() for route /api/start.
     """
     if not scheduler.get_job('collect_and_process'):
         scheduler.add_job(
             id='collect_and_process',
             func=run_collect_and_process,
             trigger='interval',
-            minutes=5,
+            seconds=scheduler.app.config['POLL_TICK_SECONDS'],
             misfire_grace_time=30
         )
-        run_collect_and_process()
+        scheduler.add_job(
+            id='probe_feeds',
+            func=run_feed_probe,
+            trigger='interval',
+            seconds=scheduler.app.config['FEED_PROBE_INTERVAL'],
+            misfire_grace_time=60
+        )
+        run_collect_and_process(force=True)
         return jsonify({"status": "started"}), 201
     else:
         return jsonify({"status": "already running"}), 409
 
 def stop_fetch():
     """
-    Asks scheduler if the job exists, and if it does, tells it to end it.
+    Asks scheduler if the job exists, and if it does, tells it to end it
+    and interrupts a cycle that is still running. With sharding, the instance's
+    feed leases are given up for the other instances.
     Called by  Called by routes.init_routes() for route /api/stop.
     """
     if scheduler.get_job('collect_and_process'):
         scheduler.remove_job('collect_and_process')
+        if scheduler.get_job('probe_feeds'):
+            scheduler.remove_job('probe_feeds')
+        if scheduler.app.config['COLLECTOR_SHARDING']:
+            # the other instances can take over the feeds right away
+            with scheduler.app.db_engine.connect() as connection:
+                release_feeds(connection, scheduler.app.config['COLLECTOR_INSTANCE'])
+        # interrupts a running cycle and frees the worker's memory either way
+        collector_worker.cancel()
         return jsonify({"status": "stopped"}), 200
     else:
         return jsonify({"status": "it was not running"}), 409
 
 def get_fetch_status():
     """
-    Asks scheduler the status of the job.
-    Called by routes.init_routes() for route /api/status.
+    Asks scheduler the status of the job, with the feed cache hit rate and the
+    database leases while running. Called by routes.init_routes() for route /api/status.
     """
     if scheduler.get_job('collect_and_process'):
-        return jsonify({"status": "running"}), 200
+        return jsonify({
+            "status": "running",
+            "feed_cache": get_cache_stats(scheduler.app.db_engine),
+            "database": scheduler.app.db_coordinator.status()
+        }), 200
     else:
         return jsonify({"status": "stopped"}), 204
 
+def get_fetch_history():
+    """
+    Returns the latest collection cycles with per-feed timing and yield aggregates,
+    slowest feeds first. The query parameters runs and feeds limit how many are included.
+    Called by routes.init_routes() for route /api/fetch_history.
+    """
+    try:
+        runs = min(max(request.args.get('runs', 20, type=int), 1), 1000)
+        feeds = min(max(request.args.get('feeds', 20, type=int), 1), 1000)
+        return jsonify(get_history(current_app.db_engine, runs, feeds)), 200
+    except SQLAlchemyError as e:
+        current_app.logger.exception("Database error when getting fetch history")
+        return jsonify({
+            "status": "error",
+            "message": f"Database error when getting fetch history: {str(e)}"
+        }), 500
+
 # note that flask-apscheduler ran functions can only handle app context via scheduler.app.function
 # whereas flask import current_app, then current_app.function doesn't work
-def run_collect_and_process():
+def run_collect_and_process(force=False):
     """
-    Runs collect.py and process.py of the original 
-    news_article_container repo on feeds from feeds.txt.
-    The processing status is to make exporting wait. Called by start_fetch().
+    Runs a collection cycle on the due feeds of the feed registry, or all of them if forced,
+    in the long-lived collector worker, replacing collect.py and process.py of the
+    original news_article_container repo.
+    Ticks with no feeds due and no backlog left by earlier cycles return right away.
+    Otherwise the cycle holds a write lease of the database, which only makes exports
+    wait when the database isn't in WAL mode, and the worker's progress reports are
+    passed on to /stream through CycleProgress. A cycle overrunning its time budget by
+    more than the grace is killed, so the lease is always released in bounded time.
+    Called by start_fetch().
     """
-    if ProcessingStatus.get_status():
-        scheduler.app.logger.info("Processing is already active.")
-        return
-
-    if not os.path.exists(
-        os.path.join(scheduler.app.config['FETCHER_FOLDER'], 'data', 'feeds.txt')
-    ):
-        scheduler.app.logger.info("Fetch attempted without feeds")
-        return
-
+    config = scheduler.app.config
+    coordinator = scheduler.app.db_coordinator
+    lease = None
     try:
-        ProcessingStatus.set_status(True)
-        run_subprocess('collect.py')
-        run_subprocess('process.py')
-    except Exception:
+        with scheduler.app.db_engine.connect() as connection:
+            feed_count = count_enabled_feeds(connection)
+            idle = not (force or has_cycle_work(connection))
+        if not feed_count:
+            scheduler.app.logger.info("Fetch attempted without feeds")
+            return
+        if idle:
+            return
+        lease = coordinator.acquire_write(f"collection cycle {config['COLLECTOR_INSTANCE']}")
+        if lease is None:
+            scheduler.app.logger.info("Processing is already active or exports are waiting.")
+            return
+
+        summary = collector_worker.run_cycle(
+            'src.views.data_acquisition.collection_cycle:run_cycle',
+            database_url=config['DATABASE_URL'],
+            fetcher_folder=config['FETCHER_FOLDER'],
+            options=get_cycle_options(config),
+            force=force,
+            on_progress=CycleProgress.set_progress,
+            time_limit=config['CYCLE_TIME_BUDGET'] + config['CYCLE_KILL_GRACE']
+        )
+        log_cycle_summary(summary)
+        if summary['polled'] or summary['processed']:
+            CycleProgress.finish({'status': 'done', **summary})
+        else:
+            CycleProgress.set_progress(None)
+    except CycleInterrupted as e:
+        scheduler.app.logger.warning("Collection cycle interrupted: %s", e)
+        CycleProgress.finish({'status': 'interrupted', 'error': str(e)})
+    except Exception as e:
         scheduler.app.logger.exception("Error in run_collect_and_process")
+        CycleProgress.finish({'status': 'failed', 'error': str(e).strip().splitlines()[-1]})
     finally:
-        ProcessingStatus.set_status(False)
+        if lease is not None:
+            coordinator.release(lease)
 
-def run_subprocess(script_name):
+def has_cycle_work(connection):
     """
-    The actual, once repeated subprocess run with logging for run_collect_and_process().
+    Whether a cycle has anything to do: feeds that are due, or articles to extract
+    or HTML to move left over by earlier cycles. Used by run_collect_and_process().
+    """
+    return bool(
+        count_due_feeds(connection) or has_pending(connection) or has_stored_html(connection)
+    )
+
+def run_feed_probe():
     """
+    Validates the feeds that were disabled for failing and re-enables the ones
+    that work again, so a feed that was down for a while comes back by itself.
+    Scheduled by start_fetch().
+    """
+    config = scheduler.app.config
     try:
-        result = subprocess.run(
-            ['python3', script_name],
-            cwd=scheduler.app.config['FETCHER_FOLDER'],
-            capture_output=True,
-            check=True,
-            text=True
-        )
-        if result.stdout:
-            scheduler.app.logger.info(
-                "%s output:\n%s",
-                script_name,
-                result.stdout.strip(),
-                extra={'script_name': script_name}
+        with scheduler.app.db_engine.connect() as connection:
+            results = probe_disabled_feeds(
+                connection,
+                config['FEED_VALIDATE_BUDGET'],
+                config['FEED_DISABLE_AFTER'],
+                **get_cycle_options(config)['fetch']
             )
-        if result.stderr:
-            scheduler.app.logger.error(
-                "%s error:\n%s",
-                script_name,
-                result.stderr.strip(),
-                extra={'script_name': script_name}
-            )
-    except subprocess.CalledProcessError as e:
-        scheduler.app.logger.error(
-            "%s failed with return code %d:\n%s",
-            script_name,
-            e.returncode,
-            e.stderr.strip(),
-            extra={'script_name': script_name}
+        for result in results.values():
+            if result['ok']:
+                scheduler.app.logger.info("Feed works again, re-enabled: %s", result['url'])
+    except Exception:
+        scheduler.app.logger.exception("Error in run_feed_probe")
+
+def get_cycle_options(config):
+    """Collection cycle options from the app config. Used by run_collect_and_process()."""
+    return {
+        'fetch': {
+            'max_workers': config['FETCH_MAX_WORKERS'],
+            'per_host_limit': config['FETCH_PER_HOST_LIMIT'],
+            'timeout': config['FETCH_TIMEOUT'],
+            'feed_budget': config['FEED_TIME_BUDGET']
+        },
+        'schedule': {
+            'min_interval': config['POLL_MIN_INTERVAL'],
+            'max_interval': config['POLL_MAX_INTERVAL'],
+            'default_interval': config['POLL_DEFAULT_INTERVAL'],
+            'disable_after': config['FEED_DISABLE_AFTER']
+        },
+        'extraction': {
+            'workers': config['EXTRACT_WORKERS'],
+            'batch_size': config['EXTRACT_BATCH_SIZE']
+        },
+        'history': {
+            'keep_runs': config['FETCH_HISTORY_KEEP_RUNS']
+        },
+        'cycle': {
+            'budget': config['CYCLE_TIME_BUDGET']
+        },
+        'search': {
+            'substrings': config['SEARCH_SUBSTRINGS']
+        },
+        'resources': {
+            'html_free_disk_mb': config['GUARD_HTML_FREE_DISK_MB'],
+            'min_free_disk_mb': config['GUARD_MIN_FREE_DISK_MB'],
+            'memory_throttle': config['GUARD_MEMORY_THROTTLE'],
+            'memory_pause': config['GUARD_MEMORY_PAUSE']
+        },
+        'shard': {
+            'instance': config['COLLECTOR_INSTANCE'],
+            'lease_seconds': config['FEED_LEASE_SECONDS']
+        } if config['COLLECTOR_SHARDING'] else None
+    }
+
+def log_cycle_summary(summary):
+    """
+    Logs the structured summary of a collection cycle for run_collect_and_process().
+    Feed errors go to the error log, as they are what users need to act on.
+    Ticks with no due feeds and nothing to process are only logged at debug level,
+    unless the resource guard degraded or paused collecting.
+    """
+    if summary['resources']:
+        scheduler.app.logger.warning(
+            "Collecting degraded to %s: %s",
+            summary['resources']['level'],
+            '; '.join(summary['resources']['reasons'])
+        )
+    if not summary['polled'] and not summary['processed']:
+        scheduler.app.logger.debug(
+            "No feeds due, next poll in %s s", summary['next_poll_in']
+        )
+        return
+    scheduler.app.logger.info(
+        "Collection cycle done in %.1f s (collecting %.1f s): %d of %d feeds due, %d entries, "
+        "%d already collected, %d new articles, %d article download errors, "
+        "%d processed, %d extraction failures",
+        summary['duration'],
+        summary['collect_duration'],
+        summary['polled'],
+        summary['feeds'],
+        summary['entries'],
+        summary['known_skipped'],
+        summary['new_articles'],
+        summary['article_errors'],
+        summary['processed'],
+        summary['extract_failed']
+    )
+    scheduler.app.logger.info(
+        "Extraction: %d articles extracted while collecting, %d duplicate pages skipped, "
+        "%d more past id %s, watermark now at id %s",
+        summary['pipelined'],
+        summary['duplicate_bodies'],
+        summary['processed'] + summary['extract_failed'] - summary['pipelined'],
+        summary['watermark_from'],
+        summary['watermark']
+    )
+    scheduler.app.logger.info(
+        "Feed cache: %d not modified, %d unchanged, %d changed",
+        summary['feed_cache']['not_modified'],
+        summary['feed_cache']['unchanged'],
+        summary['feed_cache']['changed']
+    )
+    if any(summary['page_checks'].values()):
+        scheduler.app.logger.info(
+            "Known pages checked for changes: %d not modified, %d unchanged, "
+            "%d new revisions, %d failed",
+            summary['page_checks']['not_modified'],
+            summary['page_checks']['unchanged'],
+            summary['page_checks']['revised'],
+            summary['page_checks']['failed']
+        )
+    if summary['shard']:
+        scheduler.app.logger.info(
+            "Shard %s claimed %d feeds, %d collector instances alive",
+            summary['shard']['instance'], summary['shard']['claimed'],
+            summary['shard']['instances']
+        )
+    if summary['html_moved']:
+        scheduler.app.logger.info(
+            "Moved the HTML of %d older articles to the body store", summary['html_moved']
+        )
+    if summary['budget_exceeded']:
+        scheduler.app.logger.warning(
+            "Collection cycle ran out of its time budget, the rest is left for the next cycle"
+        )
+    for feed_error in summary['feed_errors']:
+        scheduler.app.logger.error("Feed fetch failed: %s", feed_error)
+    for feed_url in summary['disabled_feeds']:
+        scheduler.app.logger.warning(
+            "Feed disabled after %d failed polls in a row: %s",
+            scheduler.app.config['FEED_DISABLE_AFTER'], feed_url
         )
-        raise
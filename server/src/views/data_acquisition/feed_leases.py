@@ -0,0 +1,114 @@
+"""
+This shards collection across collector instances sharing the database, such as
+the replicas of one deployment. Each instance heartbeats in collector_instances and
+claims feeds through time-bounded leases in feed_leases, up to its fair share of the
+enabled feeds among the live instances. The leases of an instance that dies expire,
+and the others claim its feeds. A new instance gets its share as the others give up
+their excess on their next cycle. The articles of every instance go to the same
+tables, and the instance first in name order takes care of the shared backlogs.
+Used by collection_cycle.py.
+"""
+import math
+import time
+from dataclasses import dataclass
+from sqlalchemy import text
+
+@dataclass
+class ShardSettings:
+    """
+    The instance's unique name and how long its heartbeat and feed leases last
+    in seconds, which should outlast a whole cycle and the wait for the next one.
+    """
+    instance: str
+    lease_seconds: float = 20 * 60
+
+@dataclass
+class Shard:
+    """The feeds an instance claimed for a cycle and the instances alive then."""
+    instance: str
+    feed_urls: list
+    instances: list
+
+    @property
+    def leader(self):
+        """Whether the instance runs the shared backlogs: extraction and HTML moving."""
+        return bool(self.instances) and self.instances[0] == self.instance
+
+    def as_dict(self):
+        """Summary of the shard for the cycle summary."""
+        return {
+            'instance': self.instance,
+            'instances': len(self.instances),
+            'claimed': len(self.feed_urls),
+            'leader': self.leader
+        }
+
+def claim_feeds(connection, feed_urls, settings, now=None):
+    """
+    Heartbeats the instance, renews its leases up to its fair share of the feeds,
+    gives up the rest and claims unleased feeds until it has its share. Returns
+    the Shard. Commits, so the claims are visible to the other instances at once.
+    """
+    now = time.time() if now is None else now
+    expires = now + settings.lease_seconds
+    connection.execute(text("""
+        INSERT INTO collector_instances (instance, heartbeat_at) VALUES (:instance, :now)
+        ON CONFLICT (instance) DO UPDATE SET heartbeat_at = excluded.heartbeat_at
+    """), {'instance': settings.instance, 'now': now})
+    connection.execute(
+        text("DELETE FROM collector_instances WHERE heartbeat_at < :since"),
+        {'since': now - settings.lease_seconds}
+    )
+    connection.execute(text("DELETE FROM feed_leases WHERE expires_at < :now"), {'now': now})
+    leased = dict(connection.execute(text("SELECT feed_url, instance FROM feed_leases")).fetchall())
+    # leases of removed or disabled feeds
+    gone = set(leased) - set(feed_urls)
+    if gone:
+        connection.execute(
+            text("DELETE FROM feed_leases WHERE feed_url = :feed_url"),
+            [{'feed_url': feed_url} for feed_url in gone]
+        )
+
+    instances = connection.execute(
+        text("SELECT instance FROM collector_instances ORDER BY instance")
+    ).scalars().all()
+    share = math.ceil(len(feed_urls) / len(instances))
+    own = sorted(url for url in feed_urls if leased.get(url) == settings.instance)
+    kept, excess = own[:share], own[share:]
+    if excess:
+        connection.execute(
+            text("DELETE FROM feed_leases WHERE feed_url = :feed_url AND instance = :instance"),
+            [{'feed_url': feed_url, 'instance': settings.instance} for feed_url in excess]
+        )
+    if kept:
+        connection.execute(
+            text("UPDATE feed_leases SET expires_at = :expires WHERE feed_url = :feed_url"),
+            [{'feed_url': feed_url, 'expires': expires} for feed_url in kept]
+        )
+
+    claimed = list(kept)
+    for feed_url in feed_urls:
+        if len(claimed) >= share:
+            break
+        if feed_url in leased:
+            continue
+        # another instance may have claimed it in between
+        inserted = connection.execute(text("""
+            INSERT INTO feed_leases (feed_url, instance, expires_at)
+            VALUES (:feed_url, :instance, :expires)
+            ON CONFLICT (feed_url) DO NOTHING
+        """), {'feed_url': feed_url, 'instance': settings.instance, 'expires': expires})
+        if inserted.rowcount:
+            claimed.append(feed_url)
+    connection.commit()
+    return Shard(settings.instance, claimed, instances)
+
+def release_feeds(connection, instance):
+    """Gives up the instance's leases and heartbeat, when it shuts down cleanly. Commits."""
+    connection.execute(
+        text("DELETE FROM feed_leases WHERE instance = :instance"), {'instance': instance}
+    )
+    connection.execute(
+        text("DELETE FROM collector_instances WHERE instance = :instance"), {'instance': instance}
+    )
+    connection.commit()
@@ -1,30 +1,74 @@
 """
-This handles get and set routes of feeds.txt. Called by routes.py.
+This handles the feed routes: the incremental routes of the feed registry, the
+original get and set routes of the whole feed list, import and export of
+feeds.txt, and validation of candidate feeds. URLs that can't be feed addresses
+are rejected when saved. Called by routes.py.
 """
-import os
 from flask import jsonify, request, current_app
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 
-def get_feed_urls():
+from src.views.data_acquisition import feed_registry
+from src.views.data_acquisition.feed_registry import FeedRegistryError
+from src.views.data_acquisition.feed_validator import (
+    check_url, invalid_urls, parse_opml, validate_feeds, record_validation
+)
+
+def init_feed_registry(app):
     """
-    Returns the URLs from feeds.txt.
-    Called by routes.init_routes() for route /api/get_feed_urls.
+    Creates the feed registry with the other collection tables and imports feeds.txt
+    into it once at start, so the routes below only read and write feeds. Used by app.py.
     """
-    feed_file_path = os.path.join(current_app.config['FETCHER_FOLDER'], 'data', 'feeds.txt')
+    with app.db_engine.connect() as connection:
+        feed_registry.ensure_feed_registry(connection, app.config['FETCHER_FOLDER'])
 
-    feeds = []
-    if os.path.exists(feed_file_path):
-        try:
-            with open(feed_file_path, encoding='utf-8') as f:
-                feeds = f.readlines()
-        except Exception as e:
-            current_app.logger.exception("Error in getting feed URLs")
-            return jsonify({"status": "error", "message": str(e)}), 500
+def database_error(e, action):
+    """Logs and returns the response of a database error when doing the action."""
+    current_app.logger.exception("Database error when %s", action)
+    return jsonify({
+        "status": "error",
+        "message": f"Database error when {action}: {str(e)}"
+    }), 500
 
-    return jsonify(feeds), 200
+def invalid_urls_error(urls):
+    """Returns the response rejecting URLs that can't be feeds, None if all look usable."""
+    invalid = invalid_urls(urls)
+    if not invalid:
+        return None
+    return jsonify({"status": "error", "message": "Invalid feed URLs", "invalid": invalid}), 400
+
+def run_validation(connection, urls):
+    """Validates the feeds with the app's fetch settings and records the registered ones."""
+    config = current_app.config
+    results = validate_feeds(
+        urls,
+        config['FEED_VALIDATE_BUDGET'],
+        max_workers=config['FETCH_MAX_WORKERS'],
+        per_host_limit=config['FETCH_PER_HOST_LIMIT'],
+        timeout=config['FETCH_TIMEOUT']
+    )
+    record_validation(connection, results, config['FEED_DISABLE_AFTER'])
+    return results
+
+def get_feed_urls():
+    """
+    Returns the URLs of the enabled feeds.
+    Called by routes.init_routes() for route /api/get_feed_urls.
+    """
+    try:
+        with current_app.db_engine.connect() as connection:
+            feeds = feed_registry.list_feeds(connection, enabled_only=True)
+        return jsonify([feed['url'] for feed in feeds]), 200
+    except SQLAlchemyError as e:
+        return database_error(e, "getting feed URLs")
+    except Exception as e:
+        current_app.logger.exception("Error in getting feed URLs")
+        return jsonify({"status": "error", "message": str(e)}), 500
 
 def set_feed_urls():
     """
-    Writes the URLs to feeds.txt.
+    Makes the enabled feeds the URLs, keeping the settings and health of the ones
+    that stay. Disabled feeds, which get_feed_urls() doesn't list, are left alone
+    unless listed again, which enables them.
     Called by routes.init_routes() for route /api/set_feed_urls.
     """
     if not request.is_json:
@@ -34,16 +78,168 @@ def set_feed_urls():
         feeds = request.json
         if not isinstance(feeds, dict) or 'feedUrls' not in feeds:
             return jsonify({"status": "error", "message": "Invalid JSON structure"}), 400
+        urls = [url for url in feeds['feedUrls'] if url and url.strip()]
+        if (error := invalid_urls_error(urls)):
+            return error
 
-        feed_urls = feeds['feedUrls']
-        with open(
-            os.path.join(current_app.config["FETCHER_FOLDER"], 'data', 'feeds.txt'),
-            'w',
-            encoding='utf-8'
-        ) as f:
-            f.write("\n".join(feed_urls))
+        with current_app.db_engine.connect() as connection:
+            feed_registry.replace_feeds(connection, feeds['feedUrls'])
+            connection.commit()
 
         return jsonify({"status": "success"}), 200
+    except SQLAlchemyError as e:
+        return database_error(e, "setting feed URLs")
     except Exception as e:
         current_app.logger.exception("Error in setting feed URLs")
         return jsonify({"status": "error", "message": str(e)}), 500
+
+def get_feeds():
+    """
+    Returns every registered feed with its settings and health.
+    Called by routes.init_routes() for route /api/feeds.
+    """
+    try:
+        with current_app.db_engine.connect() as connection:
+            return jsonify({"feeds": feed_registry.list_feeds(connection)}), 200
+    except SQLAlchemyError as e:
+        return database_error(e, "getting feeds")
+
+def add_feeds():
+    """
+    Registers the URLs of {"urls": [...]} that aren't registered yet. With
+    "validate": true only the feeds that pass validation are registered.
+    Called by routes.init_routes() for route /api/feeds.
+    """
+    if not request.is_json:
+        return jsonify({"status": "error", "message": "Invalid content type, expected JSON"}), 415
+    urls = request.json.get('urls') if isinstance(request.json, dict) else None
+    if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+        return jsonify({"status": "error", "message": "Invalid JSON structure"}), 400
+    urls = [url for url in urls if url.strip()]
+    if (error := invalid_urls_error(urls)):
+        return error
+
+    try:
+        with current_app.db_engine.connect() as connection:
+            response = {"status": "success"}
+            if request.json.get('validate'):
+                results = run_validation(connection, urls)
+                response['failed'] = {
+                    url: result['error'] for url, result in results.items() if not result['ok']
+                }
+                urls = [url for url, result in results.items() if result['ok']]
+            response['added'] = feed_registry.add_feeds(connection, urls)
+            connection.commit()
+        return jsonify(response), 201
+    except SQLAlchemyError as e:
+        return database_error(e, "adding feeds")
+
+def update_feed(feed_id):
+    """
+    Changes the URL, enabled flag or settings of a feed.
+    Called by routes.init_routes() for route /api/feeds/<feed_id>.
+    """
+    if not request.is_json or not isinstance(request.json, dict):
+        return jsonify({"status": "error", "message": "Invalid content type, expected JSON"}), 415
+
+    try:
+        url = request.json.get('url')
+        if isinstance(url, str) and url.strip() and (error := check_url(url)):
+            raise FeedRegistryError(f"Invalid feed URL: {error}")
+        with current_app.db_engine.connect() as connection:
+            feed = feed_registry.update_feed(connection, feed_id, request.json)
+            connection.commit()
+        if feed is None:
+            return jsonify({"status": "error", "message": "Feed not found"}), 404
+        return jsonify(feed), 200
+    except FeedRegistryError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except IntegrityError:
+        return jsonify({"status": "error", "message": "Feed URL is already registered"}), 409
+    except SQLAlchemyError as e:
+        return database_error(e, "updating a feed")
+
+def remove_feed(feed_id):
+    """
+    Removes a feed. Called by routes.init_routes() for route /api/feeds/<feed_id>.
+    """
+    try:
+        with current_app.db_engine.connect() as connection:
+            removed = feed_registry.remove_feed(connection, feed_id)
+            connection.commit()
+        if not removed:
+            return jsonify({"status": "error", "message": "Feed not found"}), 404
+        return jsonify({"status": "success"}), 200
+    except SQLAlchemyError as e:
+        return database_error(e, "removing a feed")
+
+def import_feeds():
+    """
+    Registers the URLs of data/feeds.txt, or with ?replace=true makes the registry
+    list exactly them. Called by routes.init_routes() for route /api/feeds/import.
+    """
+    replace = request.args.get('replace', 'false').lower() == 'true'
+    try:
+        urls = feed_registry.read_feed_file(current_app.config['FETCHER_FOLDER'])
+        with current_app.db_engine.connect() as connection:
+            if replace:
+                feed_registry.replace_feeds(connection, urls)
+            else:
+                feed_registry.add_feeds(connection, urls)
+            connection.commit()
+            count = len(feed_registry.list_feeds(connection))
+        return jsonify({"status": "success", "imported": len(urls), "feeds": count}), 200
+    except SQLAlchemyError as e:
+        return database_error(e, "importing feeds")
+
+def export_feeds():
+    """
+    Writes the enabled feeds to data/feeds.txt and returns it.
+    Called by routes.init_routes() for route /api/feeds/export.
+    """
+    try:
+        with current_app.db_engine.connect() as connection:
+            content = feed_registry.export_feed_file(
+                connection, current_app.config['FETCHER_FOLDER']
+            )
+        return current_app.response_class(content, content_type='text/plain; charset=utf-8')
+    except SQLAlchemyError as e:
+        return database_error(e, "exporting feeds")
+
+def validate_feed_list():
+    """
+    Validates the feeds of {"urls": [...]} or of an OPML document {"opml": "..."}
+    concurrently within the validation budget and returns each one's result.
+    Registered feeds get the outcome in their health, and with "add": true the valid
+    ones are registered. Called by routes.init_routes() for route /api/feeds/validate.
+    """
+    if not request.is_json or not isinstance(request.json, dict):
+        return jsonify({"status": "error", "message": "Invalid content type, expected JSON"}), 415
+
+    if 'opml' in request.json:
+        try:
+            urls = parse_opml(request.json['opml'])
+        except (ValueError, TypeError) as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+    else:
+        urls = request.json.get('urls')
+        if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+            return jsonify({"status": "error", "message": "Invalid JSON structure"}), 400
+
+    try:
+        with current_app.db_engine.connect() as connection:
+            results = run_validation(connection, urls)
+            valid = [url for url, result in results.items() if result['ok']]
+            added = 0
+            if request.json.get('add'):
+                added = feed_registry.add_feeds(connection, valid)
+                connection.commit()
+        return jsonify({
+            "status": "success",
+            "results": list(results.values()),
+            "valid": len(valid),
+            "invalid": len(results) - len(valid),
+            "added": added
+        }), 200
+    except SQLAlchemyError as e:
+        return database_error(e, "validating feeds")
@@ -0,0 +1,211 @@
+"""
+This is the feed registry, the feeds table that replaced rewriting feeds.txt on every
+change. Each feed has an id, its URL, an enabled flag, per-feed settings that override
+the scheduler's polling bounds, and health fields the collection cycle and the feed
+validator update after each check, which also disable feeds that keep failing.
+feeds.txt can still be imported and exported, and an existing one is imported once
+when the registry is first set up.
+Used by feed_manager.py, feed_validator.py, content_fetcher.py and collection_cycle.py.
+"""
+import os
+import json
+from datetime import datetime
+from sqlalchemy import text
+
+from src.utils.db_schema import ensure_collection_tables, get_state, set_state
+from src.views.data_acquisition.fetch_history import error_class
+
+IMPORTED_KEY = 'feeds_txt_imported'
+# per-feed settings, overriding the fields of feed_scheduler.ScheduleSettings
+SETTING_KEYS = ('min_interval', 'max_interval', 'default_interval')
+
+class FeedRegistryError(ValueError):
+    """Invalid feed data, such as an unknown setting or an empty URL."""
+
+def feed_file_path(fetcher_folder):
+    """Path of data/feeds.txt."""
+    return os.path.join(fetcher_folder, 'data', 'feeds.txt')
+
+def read_feed_file(fetcher_folder):
+    """Reads non-empty lines of data/feeds.txt, an empty list if there is none."""
+    path = feed_file_path(fetcher_folder)
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def ensure_feed_registry(connection, fetcher_folder):
+    """
+    Creates the registry with the other collection tables and imports feeds.txt
+    into it the first time, so existing deployments keep their feeds. Commits.
+    """
+    ensure_collection_tables(connection)
+    if get_state(connection, IMPORTED_KEY) is None:
+        add_feeds(connection, read_feed_file(fetcher_folder))
+        set_state(connection, IMPORTED_KEY, 1)
+    connection.commit()
+
+def validate_settings(settings):
+    """Returns the settings dict if it only has known, positive numeric settings."""
+    if not isinstance(settings, dict):
+        raise FeedRegistryError("Feed settings must be an object")
+    for key, value in settings.items():
+        if key not in SETTING_KEYS:
+            raise FeedRegistryError(f"Unknown feed setting: {key}")
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+            raise FeedRegistryError(f"Feed setting {key} must be a positive number")
+    return settings
+
+def _feed_dict(row):
+    feed = row._asdict()
+    feed['enabled'] = bool(feed['enabled'])
+    feed['settings'] = json.loads(feed['settings']) if feed['settings'] else {}
+    return feed
+
+def list_feeds(connection, enabled_only=False):
+    """Returns the feeds as dicts in id order."""
+    where = "WHERE enabled = 1" if enabled_only else ""
+    rows = connection.execute(text(f"SELECT * FROM feeds {where} ORDER BY id")).fetchall()
+    return [_feed_dict(row) for row in rows]
+
+def get_feed(connection, feed_id):
+    """Returns a feed as a dict, None if there is no such feed."""
+    row = connection.execute(
+        text("SELECT * FROM feeds WHERE id = :id"), {'id': feed_id}
+    ).one_or_none()
+    return _feed_dict(row) if row else None
+
+def add_feeds(connection, urls):
+    """Adds the URLs not registered yet, enabled, and returns how many were added."""
+    urls = [url.strip() for url in urls if url and url.strip()]
+    if not urls:
+        return 0
+    now = datetime.now().isoformat(sep=' ', timespec='seconds')
+    result = connection.execute(text("""
+        INSERT INTO feeds (url, added_at) VALUES (:url, :added_at)
+        ON CONFLICT (url) DO NOTHING
+    """), [{'url': url, 'added_at': now} for url in dict.fromkeys(urls)])
+    return result.rowcount
+
+def remove_feed(connection, feed_id):
+    """Removes a feed, returning whether it existed."""
+    return connection.execute(
+        text("DELETE FROM feeds WHERE id = :id"), {'id': feed_id}
+    ).rowcount > 0
+
+def update_feed(connection, feed_id, changes):
+    """
+    Applies the changes, a dict that may have url, enabled and settings, to a feed
+    and returns it, None if there is no such feed. Settings are merged into the
+    feed's settings, and a None value removes one.
+    """
+    feed = get_feed(connection, feed_id)
+    if feed is None:
+        return None
+    unknown = set(changes) - {'url', 'enabled', 'settings'}
+    if unknown:
+        raise FeedRegistryError(f"Unknown feed fields: {', '.join(sorted(unknown))}")
+
+    if 'url' in changes:
+        if not isinstance(changes['url'], str) or not changes['url'].strip():
+            raise FeedRegistryError("Feed URL can't be empty")
+        feed['url'] = changes['url'].strip()
+    if 'enabled' in changes:
+        feed['enabled'] = bool(changes['enabled'])
+    if 'settings' in changes:
+        merged = {**feed['settings'], **(changes['settings'] or {})}
+        feed['settings'] = validate_settings(
+            {key: value for key, value in merged.items() if value is not None}
+        )
+
+    connection.execute(text("""
+        UPDATE feeds SET url = :url, enabled = :enabled, settings = :settings
+        WHERE id = :id
+    """), {
+        'id': feed_id,
+        'url': feed['url'],
+        'enabled': int(feed['enabled']),
+        'settings': json.dumps(feed['settings']) if feed['settings'] else None
+    })
+    return get_feed(connection, feed_id)
+
+def replace_feeds(connection, urls):
+    """
+    Makes the enabled feeds exactly the URLs, keeping the settings and health of
+    the enabled ones already registered. The feeds.txt style routes only list enabled
+    feeds, so disabled ones not listed are left alone, to be enabled again by hand or
+    by the probe, and disabled ones listed again are enabled with a clean health.
+    Used by the feeds.txt style set route and import.
+    """
+    urls = list(dict.fromkeys(url.strip() for url in urls if url and url.strip()))
+    registered = connection.execute(
+        text("SELECT url FROM feeds WHERE enabled = 1")
+    ).scalars().all()
+    removed = set(registered) - set(urls)
+    if removed:
+        connection.execute(
+            text("DELETE FROM feeds WHERE url = :url"), [{'url': url} for url in removed]
+        )
+    if urls:
+        now = datetime.now().isoformat(sep=' ', timespec='seconds')
+        connection.execute(text("""
+            INSERT INTO feeds (url, added_at) VALUES (:url, :added_at)
+            ON CONFLICT (url) DO UPDATE SET enabled = 1, auto_disabled = 0, failures = 0
+            WHERE feeds.enabled = 0
+        """), [{'url': url, 'added_at': now} for url in urls])
+
+def export_feed_file(connection, fetcher_folder):
+    """Writes the enabled feeds to data/feeds.txt and returns its text."""
+    content = "\n".join(feed['url'] for feed in list_feeds(connection, enabled_only=True))
+    with open(feed_file_path(fetcher_folder), 'w', encoding='utf-8') as f:
+        f.write(content)
+    return content
+
+def load_enabled_feeds(connection):
+    """
+    Returns the enabled feed URLs and a dict of the per-feed settings of those that
+    have any, for the collection cycle's scheduler.
+    """
+    feeds = list_feeds(connection, enabled_only=True)
+    return (
+        [feed['url'] for feed in feeds],
+        {feed['url']: feed['settings'] for feed in feeds if feed['settings']}
+    )
+
+def count_enabled_feeds(connection):
+    """Number of enabled feeds."""
+    return connection.execute(text("SELECT COUNT(*) FROM feeds WHERE enabled = 1")).scalar()
+
+def record_health(connection, url, error=None, status=None, disable_after=None):
+    """
+    Updates a checked feed's health fields. status is stored when there is no error,
+    otherwise the error's class. An enabled feed is disabled automatically once it
+    has failed disable_after times in a row, and an automatically disabled one is
+    enabled again when it works. Returns the feed's enabled and auto_disabled flags
+    after the update, None if the feed isn't registered.
+    """
+    return connection.execute(text("""
+        UPDATE feeds SET
+            last_polled_at = :now,
+            last_status = :status,
+            last_error = :error,
+            failures = CASE WHEN :error IS NULL THEN 0 ELSE failures + 1 END,
+            enabled = CASE
+                WHEN :error IS NULL AND auto_disabled = 1 THEN 1
+                WHEN :error IS NOT NULL AND failures + 1 >= :disable_after THEN 0
+                ELSE enabled
+            END,
+            auto_disabled = CASE
+                WHEN :error IS NULL THEN 0
+                WHEN enabled = 1 AND failures + 1 >= :disable_after THEN 1
+                ELSE auto_disabled
+            END
+        WHERE url = :url
+        RETURNING enabled, auto_disabled
+    """), {
+        'url': url,
+        'now': datetime.now().isoformat(sep=' ', timespec='seconds'),
+        'status': error_class(error) or status,
+        'error': error,
+        'disable_after': disable_after
+    }).one_or_none()
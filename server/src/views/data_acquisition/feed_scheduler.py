@@ -0,0 +1,169 @@
+"""
+This is the adaptive per-feed polling scheduler. Each feed keeps its own polling
+interval derived from its observed publication rate, bounded by a minimum and a
+maximum, with jitter so feeds don't line up, and with exponential backoff while a
+feed keeps failing. The scheduler job only ticks, and each tick polls the feeds that
+are due according to a priority queue ordered by next poll time.
+Used by collection_cycle.py.
+"""
+import time
+import heapq
+import random
+from dataclasses import dataclass, replace
+from sqlalchemy import text
+
+@dataclass
+class ScheduleSettings:
+    """
+    Polling bounds in seconds. target_new_per_poll sets how eagerly busy feeds are polled.
+    Feeds failing disable_after times in a row are disabled in the feed registry.
+    """
+    min_interval: float = 120
+    max_interval: float = 6 * 60 * 60
+    default_interval: float = 300
+    jitter: float = 0.1
+    target_new_per_poll: float = 1.0
+    rate_smoothing: float = 0.3
+    disable_after: int = None
+
+@dataclass
+class FeedSchedule:
+    """Stored scheduling state of one feed. rate is new articles per hour."""
+    feed_url: str
+    interval: float
+    next_poll_at: float = 0.0
+    last_polled_at: float = None
+    rate: float = None
+    failures: int = 0
+
+class FeedScheduler:
+    """
+    Priority queue of feed schedules, persisted in the feed_schedule table.
+    Load it for the current feed list, pop the due feeds, poll them and record
+    each outcome, then save. overrides maps feed URLs to dicts of ScheduleSettings
+    fields that apply to that feed only.
+    """
+    def __init__(self, schedules, settings=None, overrides=None):
+        self.settings = settings or ScheduleSettings()
+        self.overrides = {
+            feed_url: replace(self.settings, **fields)
+            for feed_url, fields in (overrides or {}).items()
+        }
+        self.schedules = {schedule.feed_url: schedule for schedule in schedules}
+        self._queue = [(schedule.next_poll_at, schedule.feed_url) for schedule in schedules]
+        heapq.heapify(self._queue)
+
+    @classmethod
+    def load(  # pylint: disable=too-many-arguments
+            cls, connection, feed_urls, settings=None, overrides=None, claimed=None):
+        """
+        Loads the schedules of the given feeds. New feeds are due immediately and
+        schedules of feeds no longer listed are deleted. claimed limits the queued
+        feeds to the ones this collector instance claimed when collection is sharded.
+        """
+        settings = settings or ScheduleSettings()
+        rows = connection.execute(text(
+            "SELECT feed_url, interval, next_poll_at, last_polled_at, rate, failures "
+            "FROM feed_schedule"
+        )).fetchall()
+        stored = {row.feed_url: FeedSchedule(**row._asdict()) for row in rows}
+
+        removed = set(stored) - set(feed_urls)
+        if removed:
+            connection.execute(
+                text("DELETE FROM feed_schedule WHERE feed_url = :feed_url"),
+                [{'feed_url': feed_url} for feed_url in removed]
+            )
+
+        scheduler = cls([], settings, overrides)
+        for feed_url in dict.fromkeys(feed_urls if claimed is None else claimed):
+            scheduler.add(stored.get(feed_url) or FeedSchedule(
+                feed_url, scheduler.settings_for(feed_url).default_interval
+            ))
+        return scheduler
+
+    def add(self, schedule):
+        """Adds a feed's schedule to the queue."""
+        self.schedules[schedule.feed_url] = schedule
+        heapq.heappush(self._queue, (schedule.next_poll_at, schedule.feed_url))
+
+    def settings_for(self, feed_url):
+        """The feed's ScheduleSettings, with its own overrides if it has any."""
+        return self.overrides.get(feed_url, self.settings)
+
+    def pop_due(self, now=None, force=False):
+        """Removes and returns the URLs of all due feeds, or of every feed if forced."""
+        now = time.time() if now is None else now
+        due = []
+        while self._queue and (force or self._queue[0][0] <= now):
+            due.append(heapq.heappop(self._queue)[1])
+        return due
+
+    def next_due_at(self):
+        """Time of the earliest upcoming poll, None if nothing is scheduled."""
+        return self._queue[0][0] if self._queue else None
+
+    def record(self, feed_url, new_entries=0, failed=False, now=None):
+        """
+        Updates a polled feed's rate estimate and interval and queues its next poll.
+        new_entries is the number of entries that weren't collected before.
+        """
+        now = time.time() if now is None else now
+        settings = self.settings_for(feed_url)
+        schedule = self.schedules[feed_url]
+
+        if failed:
+            schedule.failures += 1
+            schedule.interval = min(
+                settings.max_interval,
+                settings.default_interval * 2 ** schedule.failures
+            )
+        else:
+            schedule.failures = 0
+            # the first poll returns the feed's whole backlog, which says nothing of its rate
+            if schedule.last_polled_at is not None:
+                hours = max(now - schedule.last_polled_at, 1) / 3600
+                observed = new_entries / hours
+                if schedule.rate is None:
+                    schedule.rate = observed
+                else:
+                    schedule.rate += settings.rate_smoothing * (observed - schedule.rate)
+            if schedule.rate:
+                interval = settings.target_new_per_poll / schedule.rate * 3600
+            else:
+                interval = schedule.interval * 1.5 if schedule.last_polled_at else schedule.interval
+            schedule.interval = min(settings.max_interval, max(settings.min_interval, interval))
+            schedule.last_polled_at = now
+
+        jitter = random.uniform(1 - settings.jitter, 1 + settings.jitter)
+        schedule.next_poll_at = now + schedule.interval * jitter
+        heapq.heappush(self._queue, (schedule.next_poll_at, feed_url))
+
+    def save(self, connection):
+        """Writes every schedule back."""
+        if not self.schedules:
+            return
+        connection.execute(text("""
+            INSERT INTO feed_schedule (
+                feed_url, interval, next_poll_at, last_polled_at, rate, failures
+            )
+            VALUES (:feed_url, :interval, :next_poll_at, :last_polled_at, :rate, :failures)
+            ON CONFLICT (feed_url) DO UPDATE SET
+                interval = excluded.interval,
+                next_poll_at = excluded.next_poll_at,
+                last_polled_at = excluded.last_polled_at,
+                rate = excluded.rate,
+                failures = excluded.failures
+        """), [vars(schedule) for schedule in self.schedules.values()])
+
+def count_due_feeds(connection, now=None):
+    """
+    Number of enabled feeds that are due, counting feeds without a schedule yet,
+    which are due immediately. Lets the scheduler job skip ticks with nothing to poll.
+    """
+    return connection.execute(text("""
+        SELECT COUNT(*) FROM feeds
+        LEFT JOIN feed_schedule ON feed_schedule.feed_url = feeds.url
+        WHERE feeds.enabled = 1
+            AND (feed_schedule.next_poll_at IS NULL OR feed_schedule.next_poll_at <= :now)
+    """), {'now': time.time() if now is None else now}).scalar()
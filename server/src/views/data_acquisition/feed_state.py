@@ -0,0 +1,117 @@
+"""
+This handles the persistent per-feed state used for conditional GETs: the ETag,
+Last-Modified value and content hash of each feed's last fetch, plus cache hit
+counters. Written by collection_cycle.py and read by content_fetcher.py for the
+fetch status.
+"""
+from datetime import datetime
+from sqlalchemy import text, inspect
+
+def load_feed_states(connection):
+    """Returns a dict of feed URL to its stored conditional GET state."""
+    rows = connection.execute(text(
+        "SELECT feed_url, etag, last_modified, content_hash, content_length FROM feed_state"
+    )).fetchall()
+    return {row.feed_url: row._asdict() for row in rows}
+
+def save_feed_state(connection, result, previous=None):
+    """
+    Stores the state of a fetched feed and counts a cache hit for 304 and
+    identical-body responses. Failed fetches only record their status, so the
+    validators of the last good fetch are kept.
+    """
+    previous = previous or {}
+    hit = result.cache in ('not_modified', 'unchanged')
+    if result.error:
+        status = 'error'
+    else:
+        status = result.cache
+
+    values = {
+        'feed_url': result.url,
+        'etag': result.etag,
+        'last_modified': result.last_modified,
+        'content_hash': result.content_hash,
+        'content_length': result.bytes if result.cache == 'changed' else None,
+        'last_status': status,
+        'checked_at': datetime.now().isoformat(sep=' '),
+        'hit': int(hit),
+        'miss': int(result.cache == 'changed'),
+        # a 304 saves the whole body, an identical body only saves the parsing
+        'saved': (previous.get('content_length') or 0) if result.cache == 'not_modified' else 0
+    }
+
+    if result.error:
+        connection.execute(text("""
+            INSERT INTO feed_state (feed_url, last_status, checked_at)
+            VALUES (:feed_url, :last_status, :checked_at)
+            ON CONFLICT (feed_url) DO UPDATE SET
+                last_status = excluded.last_status,
+                checked_at = excluded.checked_at
+        """), values)
+        return
+
+    connection.execute(text("""
+        INSERT INTO feed_state (
+            feed_url, etag, last_modified, content_hash, content_length,
+            last_status, checked_at, cache_hits, cache_misses, bytes_saved
+        )
+        VALUES (
+            :feed_url, :etag, :last_modified, :content_hash, :content_length,
+            :last_status, :checked_at, :hit, :miss, :saved
+        )
+        ON CONFLICT (feed_url) DO UPDATE SET
+            etag = excluded.etag,
+            last_modified = excluded.last_modified,
+            content_hash = excluded.content_hash,
+            content_length = COALESCE(excluded.content_length, feed_state.content_length),
+            last_status = excluded.last_status,
+            checked_at = excluded.checked_at,
+            cache_hits = feed_state.cache_hits + excluded.cache_hits,
+            cache_misses = feed_state.cache_misses + excluded.cache_misses,
+            bytes_saved = feed_state.bytes_saved + excluded.bytes_saved
+    """), values)
+
+def invalidate_feed_state(connection, feed_url):
+    """
+    Forgets a feed's validators, so that its next fetch is parsed in full.
+    Used when some of the feed's articles failed to download, so they get retried.
+    """
+    connection.execute(text("""
+        UPDATE feed_state SET etag = NULL, last_modified = NULL, content_hash = NULL
+        WHERE feed_url = :feed_url
+    """), {'feed_url': feed_url})
+
+def get_cache_stats(db_engine):
+    """
+    Returns the conditional GET hit rate overall and for the latest fetch of each feed.
+    Used by content_fetcher.get_fetch_status().
+    """
+    stats = {
+        'hits': 0,
+        'misses': 0,
+        'hit_rate': None,
+        'bytes_saved': 0,
+        'latest': {'not_modified': 0, 'unchanged': 0, 'changed': 0, 'error': 0}
+    }
+    if not inspect(db_engine).has_table('feed_state'):
+        return stats
+
+    with db_engine.connect() as connection:
+        hits, misses, saved = connection.execute(text(
+            "SELECT COALESCE(SUM(cache_hits), 0), COALESCE(SUM(cache_misses), 0), "
+            "COALESCE(SUM(bytes_saved), 0) FROM feed_state"
+        )).one()
+        latest = connection.execute(text(
+            "SELECT last_status, COUNT(*) FROM feed_state GROUP BY last_status"
+        )).fetchall()
+
+    stats['hits'] = hits
+    stats['misses'] = misses
+    stats['bytes_saved'] = saved
+    if hits + misses:
+        stats['hit_rate'] = round(hits / (hits + misses), 3)
+    for status, count in latest:
+        if status in stats['latest']:
+            stats['latest'][status] = count
+    return stats
@@ -0,0 +1,113 @@
+"""
+This validates candidate feeds in bulk before they cost time in every cycle. URLs are
+first checked for a usable form, which catches typos like ttps://, and the rest are
+resolved, fetched and parsed concurrently by the acquisition engine within one time
+budget. Feeds can also come from an OPML export of another reader. Registered feeds
+get the outcome recorded in their health, and probe_disabled_feeds() re-enables the
+automatically disabled feeds that work again.
+Used by feed_manager.py and content_fetcher.py.
+"""
+import time
+from urllib.parse import urlsplit
+import xml.etree.ElementTree as ET
+from sqlalchemy import text
+
+from src.views.data_acquisition.acquisition_engine import AcquisitionEngine
+from src.views.data_acquisition.feed_registry import record_health
+
+def check_url(url):
+    """Returns why the URL can't be a feed address, None if it looks usable."""
+    if not isinstance(url, str) or not url.strip():
+        return "Empty URL"
+    url = url.strip()
+    if any(char.isspace() for char in url):
+        return "URL contains whitespace"
+    try:
+        parts = urlsplit(url)
+        parts.port  # pylint: disable=pointless-statement
+    except ValueError as e:
+        return f"Malformed URL: {e}"
+    if parts.scheme not in ('http', 'https'):
+        return f"Unsupported scheme: {parts.scheme or 'none'}"
+    if not parts.hostname or ('.' not in parts.hostname and parts.hostname != 'localhost'):
+        return f"Invalid host: {parts.hostname or 'none'}"
+    return None
+
+def invalid_urls(urls):
+    """Returns a dict of the URLs that fail check_url() to their reasons."""
+    return {url: error for url in urls if (error := check_url(url))}
+
+def parse_opml(content):
+    """Returns the feed URLs of the outlines of an OPML document."""
+    try:
+        root = ET.fromstring(content)
+    except ET.ParseError as e:
+        raise ValueError(f"Not a valid OPML document: {e}") from e
+    urls = [
+        outline.get('xmlUrl').strip()
+        for outline in root.iter('outline')
+        if outline.get('xmlUrl') and outline.get('xmlUrl').strip()
+    ]
+    return list(dict.fromkeys(urls))
+
+def validate_feeds(urls, budget=30, **engine_options):
+    """
+    Checks, fetches and parses the feeds concurrently and returns a dict of URL to
+    its result: ok, error, entries and elapsed. Fetches not done within the budget
+    in seconds fail as timed out. engine_options are passed to AcquisitionEngine.
+    """
+    urls = list(dict.fromkeys(url.strip() for url in urls if isinstance(url, str)))
+    results = {
+        url: {'url': url, 'ok': False, 'error': error, 'entries': 0, 'elapsed': 0.0}
+        for url, error in invalid_urls(urls).items()
+    }
+    candidates = [url for url in urls if url not in results]
+    if not candidates:
+        return results
+
+    engine = AcquisitionEngine(**engine_options)
+    try:
+        # only the feeds are fetched, none of their articles
+        for result in engine.collect(
+                candidates, lambda entries: [], deadline=time.monotonic() + budget):
+            error = result.error
+            if error and error.startswith('TimeoutError'):
+                error = f"TimeoutError: No response within the {budget} s validation budget"
+            results[result.url] = {
+                'url': result.url,
+                'ok': error is None,
+                'error': error,
+                'entries': len(result.entries),
+                'elapsed': round(result.elapsed, 3)
+            }
+    finally:
+        engine.close()
+    return results
+
+def record_validation(connection, results, disable_after=None):
+    """
+    Records the results of registered feeds in their health, disabling the ones that
+    reach disable_after consecutive failures and re-enabling automatically disabled
+    ones that pass. Adds each registered feed's enabled flag to its result. Commits.
+    """
+    for result in results.values():
+        state = record_health(
+            connection, result['url'], result['error'], 'valid', disable_after
+        )
+        if state is not None:
+            result['enabled'] = bool(state.enabled)
+    connection.commit()
+
+def probe_disabled_feeds(connection, budget=30, disable_after=None, **engine_options):
+    """
+    Validates the feeds disabled for failing, re-enabling the ones that work again,
+    and returns the results. Feeds disabled by hand are left alone.
+    """
+    urls = connection.execute(
+        text("SELECT url FROM feeds WHERE auto_disabled = 1")
+    ).scalars().all()
+    if not urls:
+        return {}
+    results = validate_feeds(urls, budget, **engine_options)
+    record_validation(connection, results, disable_after)
+    return results
@@ -0,0 +1,199 @@
+"""
+This records the history of collection cycles: one fetch_runs row per cycle and one
+fetch_run_feeds row per polled feed, with timings, yield, bytes and error classes,
+so that the feeds that dominate cycle time can be found. Written by
+collection_cycle.py and read by content_fetcher.py for route /api/fetch_history.
+"""
+import time
+from datetime import datetime
+from sqlalchemy import text, inspect
+
+KEEP_RUNS = 2000
+
+def _now():
+    return datetime.now().isoformat(sep=' ', timespec='seconds')
+
+def error_class(error):
+    """Error class of an acquisition engine error description, None if no error."""
+    if not error:
+        return None
+    return error.split(':', 1)[0]
+
+def describe_resources(resources):
+    """One line of the resource guard's level and reasons, None if there were none."""
+    if not resources:
+        return None
+    return f"{resources['level']}: {'; '.join(resources['reasons'])}"
+
+class FetchRun:
+    """
+    One cycle's summary dict of counts and its deadline, a time.monotonic() value
+    or None, plus per-feed bookkeeping. Feed the acquisition engine's results to
+    feed_polled() and article_done() as they come in, then save().
+    """
+    def __init__(self, summary, deadline=None):
+        self.summary = summary
+        self.deadline = deadline
+        self.started_at = _now()
+        self.feeds = {}
+
+    def feed_polled(self, result, new_entries=0):
+        """Records a FeedResult. new_entries is how many of its entries were queued."""
+        now = time.time()
+        self.feeds[result.url] = {
+            'feed_url': result.url,
+            'started': now - result.elapsed,
+            'finished': now,
+            'http_time': result.http_time,
+            'parse_time': result.parse_time,
+            'cache': result.cache,
+            'entries': len(result.entries),
+            'new_articles': 0,
+            'duplicates': len(result.entries) - new_entries,
+            'article_errors': 0,
+            'bytes': result.bytes,
+            'error_class': error_class(result.error)
+        }
+
+    def article_done(self, result):
+        """Records an ArticleResult against its feed."""
+        feed = self.feeds.get(result.entry.feed_url)
+        if feed is None:
+            return
+        feed['finished'] = time.time()
+        feed['http_time'] += result.elapsed
+        feed['bytes'] += result.bytes
+        if result.error:
+            feed['article_errors'] += 1
+        else:
+            feed['new_articles'] += 1
+
+    def save(self, connection, failure=None, keep_runs=KEEP_RUNS):
+        """
+        Writes the run with its summary counts and feeds, and deletes the runs
+        beyond the newest keep_runs. failure is the exception that ended the cycle.
+        Commits.
+        """
+        summary = self.summary
+        feeds = list(self.feeds.values())
+        run_id = connection.execute(text("""
+            INSERT INTO fetch_runs (
+                started_at, finished_at, duration, collect_duration, feeds_polled,
+                feed_errors, http_time, parse_time, new_articles, duplicates,
+                article_errors, processed, bytes, error_class, resource_state
+            )
+            VALUES (
+                :started_at, :finished_at, :duration, :collect_duration, :feeds_polled,
+                :feed_errors, :http_time, :parse_time, :new_articles, :duplicates,
+                :article_errors, :processed, :bytes, :error_class, :resource_state
+            )
+        """), {
+            'started_at': self.started_at,
+            'finished_at': _now(),
+            'duration': summary.get('duration'),
+            'collect_duration': summary.get('collect_duration'),
+            'feeds_polled': summary['polled'],
+            'feed_errors': len(summary['feed_errors']),
+            'http_time': sum(feed['http_time'] for feed in feeds),
+            'parse_time': sum(feed['parse_time'] for feed in feeds),
+            'new_articles': summary['new_articles'],
+            'duplicates': summary['known_skipped'],
+            'article_errors': summary['article_errors'],
+            'processed': summary['processed'],
+            'bytes': sum(feed['bytes'] for feed in feeds),
+            'error_class': type(failure).__name__ if failure else None,
+            'resource_state': describe_resources(summary.get('resources'))
+        }).lastrowid
+
+        if feeds:
+            connection.execute(text("""
+                INSERT INTO fetch_run_feeds (
+                    run_id, feed_url, started_at, finished_at, duration, http_time,
+                    parse_time, cache, entries, new_articles, duplicates,
+                    article_errors, bytes, error_class
+                )
+                VALUES (
+                    :run_id, :feed_url, :started_at, :finished_at, :duration, :http_time,
+                    :parse_time, :cache, :entries, :new_articles, :duplicates,
+                    :article_errors, :bytes, :error_class
+                )
+            """), [{
+                **feed,
+                'run_id': run_id,
+                'started_at': datetime.fromtimestamp(feed['started']).isoformat(
+                    sep=' ', timespec='seconds'
+                ),
+                'finished_at': datetime.fromtimestamp(feed['finished']).isoformat(
+                    sep=' ', timespec='seconds'
+                ),
+                'duration': round(feed['finished'] - feed['started'], 3)
+            } for feed in feeds])
+
+        oldest_kept = run_id - keep_runs
+        if oldest_kept > 0:
+            connection.execute(
+                text("DELETE FROM fetch_run_feeds WHERE run_id <= :id"), {'id': oldest_kept}
+            )
+            connection.execute(
+                text("DELETE FROM fetch_runs WHERE id <= :id"), {'id': oldest_kept}
+            )
+        connection.commit()
+        return run_id
+
+def get_history(db_engine, runs=20, feeds=20):
+    """
+    Returns the latest runs, totals over them and the feeds that took the most time
+    in them, slowest first. Used by content_fetcher.get_fetch_history().
+    """
+    history = {'runs': [], 'totals': None, 'feeds': []}
+    if not inspect(db_engine).has_table('fetch_runs'):
+        return history
+
+    with db_engine.connect() as connection:
+        run_rows = connection.execute(text(
+            "SELECT * FROM fetch_runs ORDER BY id DESC LIMIT :runs"
+        ), {'runs': runs}).fetchall()
+        if not run_rows:
+            return history
+        first_id = run_rows[-1].id
+
+        history['runs'] = [row._asdict() for row in run_rows]
+        history['totals'] = connection.execute(text("""
+            SELECT COUNT(*) AS runs,
+                   ROUND(AVG(duration), 3) AS avg_duration,
+                   ROUND(MAX(duration), 3) AS max_duration,
+                   ROUND(SUM(http_time), 3) AS http_time,
+                   ROUND(SUM(parse_time), 3) AS parse_time,
+                   SUM(new_articles) AS new_articles,
+                   SUM(duplicates) AS duplicates,
+                   SUM(bytes) AS bytes,
+                   SUM(feed_errors) AS feed_errors,
+                   COUNT(error_class) AS failed_runs
+            FROM fetch_runs WHERE id >= :first_id
+        """), {'first_id': first_id}).one()._asdict()
+
+        # feeds are fetched concurrently, so a feed's share is of the summed feed time
+        history['feeds'] = [row._asdict() for row in connection.execute(text("""
+            SELECT feed_url,
+                   COUNT(*) AS polls,
+                   ROUND(SUM(duration), 3) AS total_time,
+                   ROUND(AVG(duration), 3) AS avg_time,
+                   ROUND(MAX(duration), 3) AS max_time,
+                   ROUND(SUM(http_time), 3) AS http_time,
+                   ROUND(SUM(parse_time), 3) AS parse_time,
+                   ROUND(SUM(duration) / (
+                       SELECT NULLIF(SUM(duration), 0) FROM fetch_run_feeds
+                       WHERE run_id >= :first_id
+                   ), 3) AS time_share,
+                   SUM(new_articles) AS new_articles,
+                   SUM(duplicates) AS duplicates,
+                   SUM(article_errors) AS article_errors,
+                   SUM(bytes) AS bytes,
+                   COUNT(error_class) AS errors
+            FROM fetch_run_feeds
+            WHERE run_id >= :first_id
+            GROUP BY feed_url
+            ORDER BY total_time DESC
+            LIMIT :feeds
+        """), {'first_id': first_id, 'feeds': feeds})]
+    return history
@@ -0,0 +1,120 @@
+"""
+This is the resource guard of the collection pipeline. It checks the free space of
+the data volume and the container's memory use against its cgroup limit before and
+during each cycle, and tells the cycle how far to degrade: throttle concurrency,
+stop storing raw HTML, or pause collecting altogether, so that a full volume doesn't
+end in a crashed pod or a broken data.db. The levels are a ladder, each including
+the degradations of the ones below it. Used by collection_cycle.py.
+"""
+import os
+import time
+from dataclasses import dataclass, field
+from sqlalchemy.engine import make_url
+
+from src.utils.container_limits import CGROUP_ROOT, memory_limit, memory_usage, free_disk
+from src.utils.collector_worker import report_progress
+
+# in order of severity
+LEVELS = ('ok', 'throttle', 'skip_html', 'pause')
+MB = 1024 * 1024
+
+@dataclass
+class ResourceLimits:
+    """
+    Thresholds of the guard. Below html_free_disk_mb of free space, articles are
+    stored without their HTML, and below min_free_disk_mb collecting pauses.
+    Memory thresholds are fractions of the cgroup memory limit.
+    """
+    min_free_disk_mb: int = 200
+    html_free_disk_mb: int = 1000
+    memory_throttle: float = 0.8
+    memory_pause: float = 0.95
+
+@dataclass
+class ResourceState:
+    """Outcome of a check: the level, the reasons for it and the readings."""
+    level: str = 'ok'
+    reasons: list = field(default_factory=list)
+    free_disk: int = None
+    memory_usage: int = None
+    memory_limit: int = None
+
+    def at_least(self, level):
+        """Whether the state is at least as severe as the level."""
+        return LEVELS.index(self.level) >= LEVELS.index(level)
+
+    def as_dict(self):
+        """The level and reasons for the cycle summary, None when ok."""
+        if self.level == 'ok':
+            return None
+        return {'level': self.level, 'reasons': self.reasons}
+
+class ResourceGuard:
+    """
+    Checks resources against the limits. check() always reads, while poll() reads
+    at most every interval seconds and otherwise returns the last state, so it can
+    be called for every result of a cycle. The most severe state seen is kept as
+    worst, and each escalation is reported as cycle progress.
+    """
+    def __init__(self, data_dir, limits=None, cgroup_root=CGROUP_ROOT, interval=2.0):
+        self.data_dir = data_dir
+        self.limits = limits or ResourceLimits()
+        self.cgroup_root = cgroup_root
+        self.interval = interval
+        self.state = ResourceState()
+        self.worst = self.state
+        self._checked_at = None
+
+    @classmethod
+    def for_database(cls, database_url, limits=None, cgroup_root=CGROUP_ROOT):
+        """Guard for the volume of an SQLite database file, memory only for other databases."""
+        url = make_url(database_url)
+        data_dir = None
+        if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:'):
+            data_dir = os.path.dirname(os.path.abspath(url.database))
+        return cls(data_dir, limits, cgroup_root)
+
+    def check(self):
+        """Reads disk and memory now and returns the new ResourceState."""
+        limits = self.limits
+        state = ResourceState(
+            free_disk=free_disk(self.data_dir) if self.data_dir else None,
+            memory_usage=memory_usage(self.cgroup_root),
+            memory_limit=memory_limit(self.cgroup_root)
+        )
+
+        def escalate(level, reason):
+            state.reasons.append(reason)
+            if LEVELS.index(level) > LEVELS.index(state.level):
+                state.level = level
+
+        if state.free_disk is not None:
+            free_mb = state.free_disk // MB
+            if free_mb < limits.min_free_disk_mb:
+                escalate('pause', f"{free_mb} MB free on the data volume, "
+                                  f"below {limits.min_free_disk_mb} MB")
+            elif free_mb < limits.html_free_disk_mb:
+                escalate('skip_html', f"{free_mb} MB free on the data volume, "
+                                      f"below {limits.html_free_disk_mb} MB")
+
+        if state.memory_usage is not None and state.memory_limit:
+            ratio = state.memory_usage / state.memory_limit
+            if ratio >= limits.memory_pause:
+                escalate('pause', f"memory at {ratio:.0%} of the limit, "
+                                  f"above {limits.memory_pause:.0%}")
+            elif ratio >= limits.memory_throttle:
+                escalate('throttle', f"memory at {ratio:.0%} of the limit, "
+                                     f"above {limits.memory_throttle:.0%}")
+
+        self.state = state
+        self._checked_at = time.monotonic()
+        if LEVELS.index(state.level) > LEVELS.index(self.worst.level):
+            self.worst = state
+            report_progress('resources', force=True, **state.as_dict())
+        return state
+
+    def poll(self):
+        """Returns the state, reading again if the last check is older than the interval."""
+        if self._checked_at is None or time.monotonic() - self._checked_at >= self.interval:
+            return self.check()
+        return self.state
@@ -0,0 +1,95 @@
+"""
+This is the seen-URL index that lets a cycle skip already collected articles before
+any article request is made. Article URLs are canonicalized (tracking parameters and
+fragments stripped) and hashed into the indexed articles.url_key column, which the
+keys of each feed's entries are looked up in, a batch at a time.
+Used by collection_cycle.py.
+"""
+import hashlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from sqlalchemy import text, bindparam
+
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'igshid', 'mc_cid', 'mc_eid',
+    'yclid', '_ga', '_gl', 'ocid', 'cmpid', 'ref_src', 'spm'
+}
+TRACKING_PREFIXES = ('utm_', 'at_', 'pk_', 'itm_')
+
+def canonicalize_url(url):
+    """
+    Returns the URL with a lowercase scheme and host, no default port,
+    no fragment and no tracking query parameters.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+        host = f"{host}:{parts.port}"
+
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    ]
+    return urlunsplit((scheme, host, parts.path or '/', urlencode(query), ''))
+
+def url_key(url):
+    """Signed 64-bit hash of the canonical URL, fits an SQLite INTEGER."""
+    digest = hashlib.blake2b(canonicalize_url(url).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+class SeenUrlIndex:
+    """
+    Collected article URL keys, looked up in articles.url_key. Build it with load()
+    at cycle start, so rows without a key have one.
+    """
+    # keys looked up in one query, below SQLite's limit of variables
+    BATCH_SIZE = 500
+
+    def __init__(self):
+        self._selected = set()
+
+    @classmethod
+    def load(cls, connection, batch_size=5000):
+        """Backfills missing keys, which the url_key index finds without a scan."""
+        backfill_url_keys(connection, batch_size)
+        return cls()
+
+    def select_unseen(self, connection, entries):
+        """
+        Returns the entries whose canonical URL isn't collected yet, and not already
+        selected earlier in this cycle under another form of the same URL.
+        """
+        candidates = []
+        for entry in entries:
+            key = url_key(entry.link)
+            if key in self._selected:
+                continue
+            self._selected.add(key)
+            candidates.append((key, entry))
+
+        keys = [key for key, _ in candidates]
+        seen = set()
+        query = text("SELECT url_key FROM articles WHERE url_key IN :keys").bindparams(
+            bindparam('keys', expanding=True)
+        )
+        for i in range(0, len(keys), self.BATCH_SIZE):
+            seen.update(
+                row[0] for row in connection.execute(
+                    query, {'keys': keys[i:i + self.BATCH_SIZE]}
+                )
+            )
+        return [entry for key, entry in candidates if key not in seen]
+
+def backfill_url_keys(connection, batch_size=5000):
+    """Fills url_key for rows written without it, for example by the original collector."""
+    while True:
+        rows = connection.execute(text(
+            "SELECT id, url FROM articles WHERE url_key IS NULL AND url IS NOT NULL LIMIT :limit"
+        ), {'limit': batch_size}).fetchall()
+        if not rows:
+            return
+        connection.execute(
+            text("UPDATE articles SET url_key = :key WHERE id = :id"),
+            [{'key': url_key(url), 'id': article_id} for article_id, url in rows]
+        )
+        connection.commit()
@@ -0,0 +1,40 @@
+"""
+This handles the revision history route of single articles, whose changed pages
+the collection cycle stores as revisions. Called by routes.py.
+"""
+from flask import jsonify, request, current_app
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.utils.resource_management import check_articles_table
+from src.views.data_acquisition.article_revisions import get_revisions, revision_diff
+
+def get_article_revisions(article_id):
+    """
+    Returns the revisions of an article, oldest first and the current one last,
+    with the unified diff of each revision's text against the one before it.
+    ?text=false leaves the full texts out. Called by routes.init_routes() for
+    route /api/articles/<article_id>/revisions.
+    """
+    try:
+        db_check_error = check_articles_table()
+        if db_check_error:
+            return db_check_error
+
+        with current_app.db_engine.connect() as connection:
+            revisions = get_revisions(connection, article_id)
+        if revisions is None:
+            return jsonify({"status": "error", "message": "Article not found"}), 404
+
+        for old, new in zip(revisions, revisions[1:]):
+            new['diff'] = revision_diff(old, new)
+        revisions[0]['diff'] = None
+        if request.args.get('text', 'true').lower() == 'false':
+            for revision in revisions:
+                del revision['full_text']
+        return jsonify({"id": article_id, "revisions": revisions}), 200
+    except SQLAlchemyError as e:
+        current_app.logger.exception("Database error when getting article revisions")
+        return jsonify({
+            "status": "error",
+            "message": f"Database error when getting article revisions: {str(e)}"
+        }), 500
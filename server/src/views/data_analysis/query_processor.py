@@ -1,29 +1,45 @@
 """
 This handles all of the search algorithm, with some minor cosmetics
-happening on the frontend. All of this took a lot of work and breaks easily.
-And you don't know you've broken something because it takes plenty of testing
-to find out you did. Called by routes.py.
+happening on the frontend. The queries are compiled by search_grammar.py,
+and this builds the searches around them, with sorting and pagination.
+Called by routes.py.
 """
 from datetime import datetime, timedelta
-import re
+import base64
+import json
 from flask import jsonify, request, current_app
 from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 
 from src.utils.resource_management import check_articles_table
+from src.utils.db_schema import ARTICLE_VIEW
+from src.views.data_analysis.result_sets import create_result_set, find_result_set, search_key
+from src.views.data_analysis.search_grammar import compile_search
+
+# the search params of the queries and the columns they search
+QUERY_FIELDS = {
+    'general_query': 'general',
+    'text_query': 'full_text',
+    'url_query': 'url',
+    'html_query': 'html'
+}
+# sort keys of the (key, id) indexes of db_schema.py that pages are read from in order
+SORT_KEYS = {
+    'time': f"COALESCE({ARTICLE_VIEW}.time, '')",
+    'url': f"COALESCE({ARTICLE_VIEW}.url, '')"
+}
+
+class CursorError(ValueError):
+    """A pagination cursor that wasn't given by a search."""
 
 # start of the search functions
 def get_search_results():
     """
-    Searches db articles for a custom user query.
+    Searches db articles for a custom user query. Repeated requests for the same page
+    of the same search are answered from the search cache.
     Called by routes.init_routes() for route /api/articles/search.
     """
     try:
-        # check whether the table exists
-        db_check_error = check_articles_table()
-        if db_check_error:
-            return db_check_error
-
         # search params
         search_params = {
             'general_query': request.args.get('generalQuery', ''),
@@ -34,43 +50,33 @@ def get_search_results():
             'html_query': request.args.get('htmlQuery', '')
         }
 
-        # pagination and sorting params
+        # pagination and sorting params, a cursor continues from where its page ended
         query_params = {
             'page': int(request.args.get('page', 1)),
             'per_page': int(request.args.get('per_page', 10)),
             'sort_by': request.args.get('sort_by', 'time'),
-            'sort_order': request.args.get('sort_order', 'desc')
+            'sort_order': request.args.get('sort_order', 'desc'),
+            'cursor': decode_cursor(request.args.get('cursor'))
         }
 
-        queries, sql_params = build_search_query(search_params, query_params)
-        query, count_query, id_query = queries
-
-        # plenty of pagination here, that sometimes only happen doing many things at once on the app
-        with current_app.db_engine.connect() as connection:
-            total_count = connection.execute(text(count_query), sql_params).scalar()
-
-            total_pages = (total_count + query_params['per_page'] - 1) // query_params['per_page']
-            query_params['page'] = min(query_params['page'], max(1, total_pages))
-
-            sql_params['offset'] = (query_params['page'] - 1) * query_params['per_page']
-
-            rows = connection.execute(text(query), sql_params).fetchall()
-            all_ids = [row[0] for row in connection.execute(text(id_query), sql_params)]
-
-        data = [
-            {"time": time, "url": url, "full_text": full_text}
-            for _, time, url, full_text in rows
-        ]
-
-        current_app.last_search_ids = all_ids
-
-        return jsonify({
-            "data": data,
-            "total_count": total_count,
-            "page": query_params['page'],
-            "per_page": query_params['per_page']
-        }), 200
-
+        cache_key = (
+            'search', search_key(search_params), query_params['page'],
+            query_params['per_page'], query_params['sort_by'], query_params['sort_order'],
+            request.args.get('cursor')
+        )
+        response = current_app.search_cache.get(cache_key)
+        if response is None:
+            version = current_app.search_cache.version()
+            # check whether the table exists
+            db_check_error = check_articles_table()
+            if db_check_error:
+                return db_check_error
+            response = run_search(search_params, query_params)
+            current_app.search_cache.put(cache_key, response, version)
+        return jsonify(response), 200
+
+    except CursorError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     except SQLAlchemyError as e:
         current_app.logger.exception("Database error when searching")
         return jsonify({
@@ -81,249 +87,214 @@ def get_search_results():
         current_app.logger.exception("Error when searching")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+def run_search(search_params, query_params):
+    """
+    Runs a search and returns the response of the requested page.
+    Used by get_search_results().
+    """
+    (query, count_query, id_query), sql_params = build_search_query(
+        search_params, query_params
+    )
+
+    # plenty of pagination here, that sometimes only happen doing many things at once on the app
+    with current_app.db_engine.connect() as connection:
+        handle, total_count = search_result_set(
+            connection, (count_query, id_query), sql_params, search_params
+        )
+
+        if query_params['cursor'] is None:
+            last_page = -(-total_count // query_params['per_page'])
+            query_params['page'] = min(query_params['page'], max(1, last_page))
+            sql_params['offset'] = (query_params['page'] - 1) * query_params['per_page']
+
+        rows = connection.execute(text(query), sql_params).fetchall()
+
+    rows, cursors = paginate(rows, query_params)
+    data = [
+        {"time": row.time, "url": row.url, "full_text": row.full_text}
+        for row in rows
+    ]
+
+    return {
+        "data": data,
+        "result": handle,
+        "total_count": total_count,
+        "page": query_params['page'],
+        "per_page": query_params['per_page'],
+        **cursors
+    }
+
+def search_result_set(connection, queries, sql_params, search_params):
+    """
+    Returns the handle of the search's result set and the number of results. These
+    are cached for the search, the set the client passed the handle of is reused for
+    the same search, and otherwise a new one is stored. A search without conditions
+    matches all articles and gets no set. Used by run_search().
+    """
+    count_query, id_query = queries
+    key = search_key(search_params)
+    cached = current_app.search_cache.get(('results', key))
+    if cached is not None:
+        return cached
+    version = current_app.search_cache.version()
+
+    handle = request.args.get('result')
+    result_set = find_result_set(connection, handle, key) if handle else None
+    if not any(search_params.values()):
+        results = None, connection.execute(text(count_query), sql_params).scalar()
+    elif result_set is not None:
+        results = handle, result_set.size
+    else:
+        results = create_result_set(
+            connection, id_query, sql_params, key, current_app.config['SEARCH_RESULT_SECONDS']
+        )
+    current_app.search_cache.put(('results', key), results, version)
+    return results
+
 # this is the start of the query build, with pagination, seems to work fine
 def build_search_query(search_params, query_params):
     """
     Builds the SQLite query based on the params. Used by get_search_results().
     """
-    base_query, count_query, sql_params = build_base_query(search_params)
+    base_query, count_query, id_query, sql_params = build_base_query(search_params)
 
-    id_query = f"SELECT id FROM articles WHERE {base_query.split('WHERE', 1)[1]}"
+    cursor = query_params.get('cursor')
+    if cursor:
+        # the cursor's page was sorted this way
+        query_params['sort_by'], query_params['sort_order'] = cursor['sort']
+    if query_params['sort_by'] not in SORT_KEYS:
+        query_params['sort_by'] = 'time'
+    if query_params['sort_order'] not in ['asc', 'desc']:
+        query_params['sort_order'] = 'desc'
 
     final_query = apply_sorting_and_pagination(
         base_query, query_params['sort_by'],
-        query_params['sort_order']
+        query_params['sort_order'], cursor
     )
 
+    # one row more than a page tells whether there is another page
     sql_params.update(
-        {'per_page': query_params['per_page'],
+        {'limit': query_params['per_page'] + 1,
          'offset': (query_params['page'] - 1) * query_params['per_page']}
     )
+    if cursor:
+        sql_params.update({'cursor_key': cursor['key'], 'cursor_id': cursor['id']})
 
     return (final_query, count_query, id_query), sql_params
 
-# this base query separates general query from advanced query
-# could be more succint perhaps
+# this base query puts the time range before the compiled queries
+# the general query and the advanced queries all have to match
 def build_base_query(search_params):
     """
-    Builds base query with all search conditions. Used by build_search_query().
-    """
-    base_query = """
-        SELECT id, DATETIME(time) as time, url, full_text
-        FROM articles 
-        WHERE 1=1
+    Builds the base, count and id queries with all search conditions.
+    Used by build_search_query().
     """
-    count_query = "SELECT COUNT(*) FROM articles WHERE 1=1"
-    sql_params = {}
-
-    advanced_params = ['text_query', 'url_query', 'html_query', 'start_time', 'end_time']
-    has_advanced_search = any(search_params.get(param) for param in advanced_params)
-
-    if has_advanced_search:
-        for param, column in [
-            ('text_query', 'full_text'),
-            ('url_query', 'url'),
-            ('html_query', 'html')
-        ]:
-            if search_params[param]:
-                parsed_query, query_params = parse_operators(
-                    search_params[param], column
-                )
-                base_query += f" AND ({parsed_query})"
-                count_query += f" AND ({parsed_query})"
-                sql_params.update(query_params)
-
-        base_query, count_query, sql_params = add_time_constraints(
-            search_params, base_query, count_query, sql_params
-        )
-    elif search_params.get('general_query'):
-        base_query, count_query, sql_params = add_general_query(
-            search_params, base_query, count_query, sql_params
-        )
-
-    return base_query, count_query, sql_params
-
-# this is more specific sorting and pagination, seems to work fine
-def apply_sorting_and_pagination(base_query, sort_by, sort_order):
-    """
-    Sorts and paginates base query.
-    """
-    if sort_by not in ['time', 'url']:
-        sort_by = 'time'
-    if sort_order not in ['asc', 'desc']:
-        sort_order = 'desc'
-
-    if sort_by == 'time':
-        base_query += f" ORDER BY time {sort_order.upper()}"
-    else:
-        base_query += f" ORDER BY url {sort_order.upper()}"
-
-    base_query += " LIMIT :per_page OFFSET :offset"
-
-    return base_query
-
-# parse_operators and create_term_sql_condition are part of the same package for advanced search
-# they aren't perfect but they seem to work ok for advanced search alone
-
-def parse_operators(query, column):
-    """
-    Parses operators AND, OR and NOT in full text, URL
-    and HTML queries. Used by build_base_query() and add_general_query().
+    condition, sql_params = compile_search(
+        {column: search_params.get(param) for param, column in QUERY_FIELDS.items()},
+        current_app.config['SEARCH_SUBSTRINGS']
+    )
+    conditions = add_time_constraints(search_params, sql_params)
+    if condition != "1=1" or not conditions:
+        conditions.append(condition)
+    where = ' AND '.join(conditions)
+
+    base_query = f"""
+        SELECT id, DATETIME(time) as time, url, full_text,
+            {SORT_KEYS['time']} AS sort_time, {SORT_KEYS['url']} AS sort_url
+        FROM {ARTICLE_VIEW}
+        WHERE {where}
     """
-    or_groups = []
-    current_group = []
-    search_params = {}
-    negate_next = False
-
-    parts = re.findall(r'"[^"]*"|\S+', query)
-
-    for i, part in enumerate(parts):
-        if part == "AND":
-            continue
-        elif part == "OR":
-            if current_group:
-                or_groups.append(current_group)
-                current_group = []
-        elif part == "NOT":
-            negate_next = True
-        else:
-            condition, param = create_term_sql_condition(part, column, i, negate_next)
-            current_group.append(condition)
-            if param:
-                search_params.update(param)
-            negate_next = False
+    count_query = f"SELECT COUNT(*) FROM {ARTICLE_VIEW} WHERE {where}"
+    id_query = f"SELECT id FROM {ARTICLE_VIEW} WHERE {where}"
+    return base_query, count_query, id_query, sql_params
 
-    if current_group:
-        or_groups.append(current_group)
-
-    sql_parts = ['(' + ' AND '.join(group) + ')' for group in or_groups]
-    return ' OR '.join(sql_parts) if sql_parts else "1=1", search_params
-
-def create_term_sql_condition(term, column, index, negate=False):
+# this is more specific sorting and pagination
+# pages are read in (key, id) order from the matching index, the id breaking ties
+def apply_sorting_and_pagination(base_query, sort_by, sort_order, cursor=None):
     """
-    Creates detailed SQL condition for term. Used by parse_operators().
+    Sorts and paginates base query. Without a cursor the page is found by offset,
+    which is fine for the first pages. With one, the page is sought in the index
+    right after or before the cursor's row, so any page costs as much as the first.
     """
-    term = term.strip('"')
-    if not term:
-        return None, None
-
-    if term == "NOTEXT":
-        condition = f"({column} IS NULL OR {column} = '')"
-        param = None
-    else:
-        param_name = f'{column}_query_{index}'
-        if 'ESC' in term:
-            condition = f"{column} LIKE :{param_name} ESCAPE '\\'"
-            esc_part = term.replace('ESC%', r'\%').replace('ESC_', r'\_')
-        else:
-            condition = f"{column} LIKE :{param_name}"
-            esc_part = term if term.startswith('"') and term.endswith('"') else f'%{term}%'
-
-        param = {param_name: esc_part}
-
-    if negate:
-        condition = f"NOT ({condition})"
-
-    return condition, param
-
-# the two next are for the general query
-# general query required very unique handling different from the others
-# may seem to replicate the same things but needed to do them in a unique way
-# these were created last
+    key = SORT_KEYS[sort_by]
+    if cursor is None:
+        order = sort_order.upper()
+        return base_query + f" ORDER BY {key} {order}, id {order} LIMIT :limit OFFSET :offset"
+
+    # a previous page is read backwards from the cursor
+    descending = (sort_order == 'desc') != (cursor['direction'] == 'prev')
+    operator, order = ('<', 'DESC') if descending else ('>', 'ASC')
+    base_query += (
+        f" AND {key} {operator}= :cursor_key"
+        f" AND ({key} {operator} :cursor_key OR id {operator} :cursor_id)"
+    )
+    return base_query + f" ORDER BY {key} {order}, id {order} LIMIT :limit"
 
-def process_query_part(part, param_index, sql_params):
+def paginate(rows, query_params):
     """
-    Part of add_general_query that parses more complicated operators and paths.
-    Pylint wanted to split the large function.
+    Returns a page's rows in order without the extra row fetched past the page,
+    and a dict of the next_cursor and prev_cursor of the pages around it, None where
+    there is no page. Used by get_search_results().
     """
-    param_name = f'general_query_{param_index}'
-    part = part.strip('"')
-    if part == 'NOTEXT':
-        return "(full_text IS NULL OR full_text = '' OR url IS NULL OR url = '')", sql_params
-    elif 'ESC' in part:
-        escaped_part = part.replace('ESC%', r'\%').replace('ESC_', r'\_')
-        condition = (
-            f"(full_text LIKE :{param_name} ESCAPE '\\' OR "
-            f"url LIKE :{param_name} ESCAPE '\\' OR "
-            f"CAST(time AS TEXT) LIKE :{param_name} ESCAPE '\\')"
-        )
-        sql_params[param_name] = escaped_part
+    cursor = query_params.get('cursor')
+    per_page = query_params['per_page']
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if cursor and cursor['direction'] == 'prev':
+        rows.reverse()
+        has_next, has_prev = True, more
     else:
-        condition = (
-            f"(full_text LIKE :{param_name} OR "
-            f"url LIKE :{param_name} OR "
-            f"CAST(time AS TEXT) LIKE :{param_name})"
+        has_next, has_prev = more, bool(cursor) or query_params['page'] > 1
+    return rows, {
+        'next_cursor': encode_cursor(rows[-1], query_params, 'next') if rows and has_next else None,
+        'prev_cursor': encode_cursor(rows[0], query_params, 'prev') if rows and has_prev else None
+    }
+
+def encode_cursor(row, query_params, direction):
+    """Opaque cursor of the page after or before a row, in the sort order of its page."""
+    sort = [query_params['sort_by'], query_params['sort_order']]
+    data = [sort, getattr(row, f"sort_{query_params['sort_by']}"), row.id, direction]
+    encoded = base64.urlsafe_b64encode(json.dumps(data).encode('utf-8'))
+    return encoded.decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Returns the dict of a cursor from encode_cursor(), None for no cursor."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort, key, article_id, direction = json.loads(base64.urlsafe_b64decode(padded))
+        valid = (
+            sort[0] in SORT_KEYS and sort[1] in ('asc', 'desc') and isinstance(key, str)
+            and isinstance(article_id, int) and direction in ('next', 'prev')
         )
-        sql_params[param_name] = f'%{part}%'
-    return condition, sql_params
-
-def add_general_query(search_params, base_query, count_query, sql_params):
-    """
-    Parses the general query alone. Used by build_base_query().
-    Needed special customization.
-    """
-    general_query = search_params.get('general_query', '').strip()
-    if not general_query:
-        return base_query, count_query, sql_params
-
-    parts = re.findall(r'"[^"]*"|\S+', general_query)
-    conditions = []
-    current_group = []
-    param_index = 0
-    negate_next = False
-    and_next = False
-
-    for part in parts:
-        if part == 'OR':
-            if current_group:
-                conditions.append('(' + ' AND '.join(current_group) + ')')
-                current_group = []
-            and_next = False
-        elif part == 'AND':
-            and_next = True
-        elif part == 'NOT':
-            negate_next = True
-        else:
-            param_index += 1
-            term_condition, sql_params = process_query_part(part, param_index, sql_params)
-
-            if negate_next:
-                term_condition = f"NOT {term_condition}"
-                negate_next = False
-            if and_next and current_group:
-                current_group[-1] += f" AND {term_condition}"
-            else:
-                current_group.append(term_condition)
-            and_next = False
-
-    if current_group:
-        conditions.append('(' + ' AND '.join(current_group) + ')')
-    final_condition = ' OR '.join(conditions)
-    base_query += f" AND ({final_condition})"
-    count_query += f" AND ({final_condition})"
-    return base_query, count_query, sql_params
+    except (ValueError, TypeError, IndexError) as e:
+        raise CursorError("Invalid cursor") from e
+    if not valid:
+        raise CursorError("Invalid cursor")
+    return {'sort': tuple(sort), 'key': key, 'id': article_id, 'direction': direction}
 
 # the bottom two manage start_time and end_time
 # they seem fairly stable and succint for their purpose
 
-def add_time_constraints(search_params, base_query, count_query, sql_params):
+def add_time_constraints(search_params, sql_params):
     """
-    Time constraints to base query. Used by build_base_query().
+    Returns the time range conditions, adding their params to sql_params.
+    Used by build_base_query().
     """
+    conditions = []
     for param, operator in [('start_time', '>='), ('end_time', '<=')]:
         if search_params[param]:
             parsed_time = parse_input_date(
                 search_params[param], is_end_date=(param == 'end_time')
             )
             if parsed_time:
-                base_query += f" AND time {operator} :{param}"
-                count_query += f" AND time {operator} :{param}"
+                conditions.append(f"time {operator} :{param}")
                 sql_params[param] = parsed_time
             else:
-                base_query += " AND 1=0"
-                count_query += " AND 1=0"
+                conditions.append("1=0")
 
-    return base_query, count_query, sql_params
+    return conditions
 
 def parse_input_date(date_string, is_end_date=False):
     """
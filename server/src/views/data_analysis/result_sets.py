@@ -0,0 +1,108 @@
+"""
+This keeps search results as named result sets in the database. Searches used to
+load every matching id into one list on the app, shared by all users and threads,
+which statistics and exports then inlined into their queries. Now a search stores
+its matching ids with a single INSERT ... SELECT and returns the set's handle, and
+the client passes the handle with later pages, statistics, full texts and exports,
+which read the set with a subquery. Sets unused for a while are deleted. The sets
+are kept in a database of their own, which db_coordination.py attaches to the app's
+connections, so searches don't write to the articles' database or lock it while the
+collector writes there. Used by query_processor.py, stats_analyzer.py and
+export_manager.py.
+"""
+import json
+import secrets
+import time
+from sqlalchemy import text
+
+from src.utils.db_schema import RESULT_SET_DATABASE as RESULTS, ensure_result_set_tables
+
+# how often reading a set marks it used, each time a write to the sets' database
+USE_MARK_SECONDS = 60
+
+class ResultSetError(LookupError):
+    """A result set handle that doesn't exist or expired."""
+
+def search_key(search_params):
+    """Identifies the search a set is for, so a handle isn't reused for another search."""
+    return json.dumps(search_params, sort_keys=True)
+
+def create_result_set(connection, id_query, sql_params, key, max_age):
+    """
+    Stores the ids id_query selects as a new result set for the search of the key,
+    and deletes the sets unused for max_age seconds. Returns the set's handle and
+    size. Commits.
+    """
+    ensure_result_set_tables(connection)
+    now = time.time()
+    expire_result_sets(connection, now - max_age)
+    handle = secrets.token_urlsafe(16)
+    set_id = connection.execute(text(f"""
+        INSERT INTO {RESULTS}.search_results (handle, search_key, created_at, used_at)
+        VALUES (:handle, :key, :now, :now)
+        RETURNING id
+    """), {'handle': handle, 'key': key, 'now': now}).scalar()
+    size = connection.execute(
+        text(
+            f"INSERT INTO {RESULTS}.search_result_ids SELECT :result_set_id, id FROM ({id_query})"
+        ),
+        {**sql_params, 'result_set_id': set_id}
+    ).rowcount
+    connection.execute(
+        text(f"UPDATE {RESULTS}.search_results SET size = :size WHERE id = :id"),
+        {'size': size, 'id': set_id}
+    )
+    connection.commit()
+    return handle, size
+
+def find_result_set(connection, handle, key=None):
+    """
+    Returns the id and size of the set of the handle, None if there is no such set
+    or it is for another search than the key. Marks the set used, committing, if it
+    wasn't in the last USE_MARK_SECONDS, so most reads don't write.
+    """
+    ensure_result_set_tables(connection)
+    result_set = connection.execute(text(f"""
+        SELECT id, size, search_key, used_at FROM {RESULTS}.search_results
+        WHERE handle = :handle
+    """), {'handle': handle}).one_or_none()
+    if result_set is None or (key is not None and result_set.search_key != key):
+        return None
+    now = time.time()
+    if now - result_set.used_at >= USE_MARK_SECONDS:
+        connection.execute(
+            text(f"UPDATE {RESULTS}.search_results SET used_at = :now WHERE id = :id"),
+            {'now': now, 'id': result_set.id}
+        )
+        connection.commit()
+    return result_set
+
+def result_set_condition(connection, handle):
+    """
+    Returns the SQL condition that selects the articles of the set of the handle,
+    and its params. Raises ResultSetError if there is no such set.
+    """
+    result_set = find_result_set(connection, handle)
+    if result_set is None:
+        raise ResultSetError("Search results expired, please search again")
+    return (
+        f"id IN (SELECT article_id FROM {RESULTS}.search_result_ids "
+        "WHERE result_id = :result_set_id)",
+        {'result_set_id': result_set.id}
+    )
+
+def expire_result_sets(connection, unused_since):
+    """Deletes the sets last used before unused_since, a time.time() value."""
+    expired = connection.execute(
+        text(f"SELECT id FROM {RESULTS}.search_results WHERE used_at < :since"),
+        {'since': unused_since}
+    ).scalars().all()
+    if expired:
+        connection.execute(
+            text(f"DELETE FROM {RESULTS}.search_result_ids WHERE result_id = :id"),
+            [{'id': set_id} for set_id in expired]
+        )
+        connection.execute(
+            text(f"DELETE FROM {RESULTS}.search_results WHERE id = :id"),
+            [{'id': set_id} for set_id in expired]
+        )
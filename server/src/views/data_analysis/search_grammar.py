@@ -0,0 +1,368 @@
+"""
+This is the grammar of the general, full text, URL and HTML queries. A query is split
+into tokens and parsed into a tree of AND, OR and NOT over terms, which is normalized:
+NOTs are pushed down to the terms, index terms are case folded, the same term or group
+isn't checked twice and each group's conditions are ordered so the cheapest and most
+selective go first. The fields of a search are joined into one tree, compiled to a
+condition with as much of it as possible in a single match of each index. With the
+trigram index of SEARCH_SUBSTRINGS, terms long enough for it are substrings matched
+anywhere in it, and it narrows down the articles wildcard patterns are checked on.
+Without it URL terms and terms with characters other than letters, digits and spaces,
+such as URL fragments, are substrings matched by LIKE conditions. The rest are words
+matched from their starts in the word index. Compiled trees are cached, so a query
+seen before isn't compiled again.
+Used by query_processor.py.
+"""
+import re
+from dataclasses import dataclass, replace
+from functools import lru_cache
+
+from src.utils.db_schema import SEARCH_INDEX, SUBSTRING_INDEX
+
+# columns searched through an SQL expression, html is stored compressed by html_storage.py
+COLUMN_EXPRESSIONS = {'html': 'html_text(html)'}
+# the columns of the indexes of db_schema.py each query matches, HTML isn't indexed
+INDEX_COLUMNS = {
+    'general': '{title full_text url time}',
+    'full_text': 'full_text',
+    'url': 'url'
+}
+# the order LIKE conditions are checked in, after the index matches
+LIKE_COSTS = {'url': 1, 'full_text': 2, 'general': 3, 'html': 4}
+OPERATORS = ('AND', 'OR', 'NOT')
+# the shortest substring the trigram index can find
+TRIGRAM = 3
+# compiled trees kept, each a short SQL string and its params
+COMPILED_QUERIES = 512
+
+@dataclass(frozen=True)
+class Term:
+    """
+    A word or a quoted phrase searched in a column, or NOTEXT for an empty one, and the
+    index normalize() routes it to, None for a LIKE condition.
+    """
+    column: str
+    text: str
+    negated: bool = False
+    index: str = None
+
+@dataclass(frozen=True)
+class AllOf:
+    """Terms and groups that must all match. Without any it matches everything."""
+    children: tuple
+
+@dataclass(frozen=True)
+class AnyOf:
+    """Terms and groups of which one must match. Without any it matches nothing."""
+    children: tuple
+
+def tokenize(query):
+    """
+    Splits a query into ('term', text), ('op', operator), ('(', None) and (')', None)
+    tokens. Quotes keep a phrase together, and a quoted operator is a term. Parentheses
+    open and close groups at the start and end of words, elsewhere they're part of a term.
+    """
+    tokens = []
+    for part in re.findall(r'"[^"]*"|\S+', query):
+        if part.startswith('"'):
+            if part.strip('"'):
+                tokens.append(('term', part.strip('"')))
+            continue
+        word = part.lstrip('(')
+        tokens += [('(', None)] * (len(part) - len(word))
+        closing = len(word) - len(word.rstrip(')'))
+        word = word.rstrip(')').strip('"')
+        if word in OPERATORS:
+            tokens.append(('op', word))
+        elif word:
+            tokens.append(('term', word))
+        tokens += [(')', None)] * closing
+    return tokens
+
+def parse(query, column):
+    """
+    Parses a query on a column into a tree, None if it has no terms. NOT binds to the
+    next term or group, terms next to each other or joined by AND form a group and OR
+    separates groups. Operators without operands and unmatched parentheses are skipped.
+    """
+    tokens = tokenize(query)
+    tokens.reverse()
+    return parse_any(tokens, column, 0)
+
+def parse_any(tokens, column, depth):
+    """Parses the OR groups of the tokens up to the group's closing parenthesis."""
+    groups = []
+    while tokens:
+        group = parse_all(tokens, column, depth)
+        if group:
+            groups.append(group)
+        if not tokens or tokens[-1] != ('op', 'OR'):
+            break
+        tokens.pop()
+    return AnyOf(tuple(groups)) if groups else None
+
+def parse_all(tokens, column, depth):
+    """Parses the terms and groups of an OR group. Used by parse_any()."""
+    children = []
+    negate = False
+    while tokens and tokens[-1] != ('op', 'OR') and not (depth and tokens[-1][0] == ')'):
+        kind, value = tokens.pop()
+        if kind == 'op':
+            negate = not negate if value == 'NOT' else negate
+            continue
+        if kind == ')':
+            continue
+        node = Term(column, value) if kind == 'term' else parse_any(tokens, column, depth + 1)
+        if kind == '(' and tokens:
+            tokens.pop()
+        if node:
+            children.append(negated(node) if negate else node)
+        negate = False
+    return AllOf(tuple(children)) if children else None
+
+def negated(node):
+    """The negation of a tree, with the NOT pushed down to its terms."""
+    if isinstance(node, Term):
+        return replace(node, negated=not node.negated)
+    group = AnyOf if isinstance(node, AllOf) else AllOf
+    return group(tuple(negated(child) for child in node.children))
+
+def is_pattern(term):
+    """Whether the term is a LIKE pattern, with wildcards or ESC."""
+    return any(char in term.text for char in '%_') or 'ESC' in term.text
+
+def term_index(term, substrings=False):
+    """
+    Returns the index a term is matched in alone, None if it needs a LIKE condition:
+    NOTEXT, HTML, patterns and terms without any words that the trigram index, if there
+    is one, can't find. Terms long enough for it are substrings, matched anywhere in
+    it, and the rest are words, matched from their starts in the word index. Without
+    it URL terms and terms that aren't just words stay substrings, checked by LIKE.
+    """
+    if term.column not in INDEX_COLUMNS or term.text == "NOTEXT" or is_pattern(term):
+        return None
+    if substrings and len(term.text) >= TRIGRAM:
+        return SUBSTRING_INDEX
+    if not substrings and (term.column == 'url' or re.search(r'[^\w\s]', term.text)):
+        return None
+    return SEARCH_INDEX if re.search(r'[^\W_]', term.text) else None
+
+def fts_string(value):
+    """The value as an FTS5 string, the quotes in it doubled."""
+    return '"' + value.replace('"', '""') + '"'
+
+def index_phrase(term):
+    """
+    Returns the term as an FTS5 phrase: a substring, or words whose last one is a prefix.
+    """
+    phrase = fts_string(term.text)
+    return phrase if term.index == SUBSTRING_INDEX else phrase + '*'
+
+def pattern_prefilter(term):
+    """
+    Returns the trigram index expression of the literal parts of a LIKE pattern that
+    are long enough for it, which all the articles the pattern matches have, or None.
+    """
+    if term.column not in INDEX_COLUMNS or term.text == "NOTEXT":
+        return None
+    literal, parts = '', []
+    for piece in re.split(r'(ESC[%_]|[%_])', term.text) + ['%']:
+        if piece in ('%', '_'):
+            parts.append(literal)
+            literal = ''
+        else:
+            literal += piece[-1] if piece in ('ESC%', 'ESC_') else piece
+    phrases = [
+        f"{INDEX_COLUMNS[term.column]} : {fts_string(part)}"
+        for part in dict.fromkeys(parts) if len(part) >= TRIGRAM
+    ]
+    return ' AND '.join(phrases) or None
+
+def normalize(node, substrings=False):
+    """
+    Returns the tree in its normal form: terms routed to their indexes, with or without
+    the trigram index, nested groups of the same kind flattened, index terms case folded
+    like the index folds them, repeated terms and groups dropped and each group's
+    children in order_key() order. A group that has a term and its negation matches nothing.
+    """
+    if isinstance(node, Term):
+        index = term_index(node, substrings)
+        if index == SEARCH_INDEX:
+            return replace(node, text=' '.join(node.text.lower().split()), index=index)
+        return replace(node, text=node.text.lower(), index=index) if index else node
+
+    children = []
+    for child in (normalize(child, substrings) for child in node.children):
+        children.extend(child.children if type(child) is type(node) else [child])
+    if isinstance(node, AllOf):
+        if AnyOf(()) in children or any(
+                negated(child) in children for child in children if isinstance(child, Term)):
+            return AnyOf(())
+    elif AllOf(()) in children:
+        return AllOf(())
+    children = sorted(set(children), key=order_key)
+    return children[0] if len(children) == 1 else type(node)(tuple(children))
+
+def cost(node):
+    """How expensive a condition is to check, 0 for those in an index match."""
+    if isinstance(node, Term):
+        return 0 if node.index else LIKE_COSTS[node.column]
+    return max((cost(child) for child in node.children), default=0)
+
+def order_key(node):
+    """
+    Sort key of conditions, the cheapest first. Of equal ones terms go before groups
+    and longer terms, which fewer articles have, before shorter ones.
+    """
+    if isinstance(node, Term):
+        return (cost(node), 0, node.negated, -len(node.text), repr(node))
+    return (cost(node), 1, False, -len(node.children), repr(node))
+
+def compile_search(queries, substrings=False):
+    """
+    Returns the SQL condition of the articles matching all the queries of a search,
+    a dict of columns to queries, and its params. An empty search is '1=1'.
+    substrings tells whether the trigram index is there to match in.
+    """
+    trees = [parse(query, column) for column, query in queries.items() if query]
+    tree = normalize(AllOf(tuple(tree for tree in trees if tree)), substrings)
+    condition, params = compile_tree(tree, substrings)
+    return condition, dict(params)
+
+@lru_cache(maxsize=COMPILED_QUERIES)
+def compile_tree(tree, substrings):
+    """Compiles a normalized tree to its condition and its params as pairs, kept as is."""
+    params = {}
+    return sql_condition(tree, params, substrings), tuple(params.items())
+
+def sql_condition(node, params, substrings):
+    """SQL condition of a tree, adding its params to params. Used by compile_tree()."""
+    match = match_expression(node)
+    if match:
+        return match_condition(*match, params)
+    if isinstance(node, Term):
+        if node.negated and node.index:
+            return match_condition(node.index, term_expression(node), params, negate=True)
+        return like_condition(node, params, substrings)
+    if not node.children:
+        return "1=1" if isinstance(node, AllOf) else "1=0"
+
+    conditions, matches = [], {}
+    if isinstance(node, AllOf):
+        matches, excluded, rest = split_all(node)
+        conditions = [match_condition(*match, params) for match in matches.items()]
+        # FTS5 can't match everything but some terms
+        conditions += [
+            match_condition(index, ' OR '.join(expressions), params, negate=True)
+            for index, expressions in excluded.items()
+        ]
+        conditions += [sql_condition(child, params, substrings) for child in rest]
+        return '(' + ' AND '.join(conditions) + ')'
+
+    for child in node.children:
+        match = match_expression(child)
+        if match:
+            matches.setdefault(match[0], []).append(match[1])
+        else:
+            conditions.append(sql_condition(child, params, substrings))
+    # one lookup in each index for all the groups it can match
+    conditions[:0] = [
+        match_condition(index, any_expression(expressions), params)
+        for index, expressions in matches.items()
+    ]
+    return '(' + ' OR '.join(conditions) + ')'
+
+def split_all(node):
+    """
+    Splits the children of an AllOf into a dict of each index to the expression of
+    those it matches, with the negated terms of the index excluded, a dict of the
+    other indexes to the expressions of their negated terms, and the rest.
+    """
+    included, excluded, rest = {}, {}, []
+    for child in node.children:
+        match = match_expression(child)
+        if match:
+            included.setdefault(match[0], []).append(match[1])
+        elif isinstance(child, Term) and child.negated and child.index:
+            excluded.setdefault(child.index, []).append(term_expression(child))
+        else:
+            rest.append(child)
+    matches = {
+        index: all_expression(expressions, excluded.pop(index, []))
+        for index, expressions in included.items()
+    }
+    return matches, excluded, rest
+
+def all_expression(included, excluded):
+    """FTS5 expression of all the included expressions and none of the excluded."""
+    if len(included) == 1:
+        expression = included[0]
+    else:
+        expression = ' AND '.join(f"({match})" for match in included)
+    if excluded:
+        expression = f"({expression}) NOT ({' OR '.join(excluded)})"
+    return expression
+
+def any_expression(expressions):
+    """FTS5 expression of any of the expressions."""
+    if len(expressions) == 1:
+        return expressions[0]
+    return ' OR '.join(f"({expression})" for expression in expressions)
+
+def term_expression(term):
+    """FTS5 expression of a term in its column's index columns."""
+    return f"{INDEX_COLUMNS[term.column]} : {index_phrase(term)}"
+
+def match_expression(node):
+    """
+    The index and FTS5 expression of a tree one index can match alone, None otherwise.
+    """
+    if isinstance(node, Term):
+        return None if node.negated or not node.index else (node.index, term_expression(node))
+    if not node.children:
+        return None
+    if isinstance(node, AllOf):
+        matches, excluded, rest = split_all(node)
+        return next(iter(matches.items())) if len(matches) == 1 and not (
+            excluded or rest) else None
+    matches = [match_expression(child) for child in node.children]
+    if not all(matches) or len({index for index, _ in matches}) > 1:
+        return None
+    return matches[0][0], any_expression([expression for _, expression in matches])
+
+def match_condition(index, expression, params, negate=False):
+    """SQL condition of the articles matching an FTS5 expression, added to params."""
+    name = f'search_match_{len(params)}'
+    params[name] = expression
+    operator = "NOT IN" if negate else "IN"
+    return f"id {operator} (SELECT rowid FROM {index} WHERE {index} MATCH :{name})"
+
+def like_condition(term, params, substrings):
+    """
+    SQL LIKE condition of a term the indexes can't match alone, or the empty check of
+    NOTEXT. General terms are searched in the full text, URL and time. With the trigram
+    index a pattern is only checked on the articles it finds its literal parts in.
+    """
+    if term.column == 'general':
+        expressions = ['full_text', 'url', 'CAST(time AS TEXT)']
+    else:
+        expressions = [COLUMN_EXPRESSIONS.get(term.column, term.column)]
+
+    if term.text == "NOTEXT":
+        checked = expressions[:2]
+        sql = ' OR '.join(f"{expression} IS NULL OR {expression} = ''" for expression in checked)
+    else:
+        name = f'search_like_{len(params)}'
+        if 'ESC' in term.text:
+            params[name] = term.text.replace('ESC%', r'\%').replace('ESC_', r'\_')
+            escape = " ESCAPE '\\'"
+        else:
+            params[name] = f'%{term.text}%'
+            escape = ""
+        sql = ' OR '.join(f"{expression} LIKE :{name}{escape}" for expression in expressions)
+    if term.negated:
+        return f"NOT ({sql})"
+    prefilter = pattern_prefilter(term) if substrings else None
+    if prefilter:
+        return f"({match_condition(SUBSTRING_INDEX, prefilter, params)} AND ({sql}))"
+    return f"({sql})"
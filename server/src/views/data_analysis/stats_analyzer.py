@@ -1,12 +1,32 @@
 """
-This handles db articles statistics get route. Called by routes.py.
+This handles db articles statistics get route. Statistics are kept in the search
+cache until the articles change. Called by routes.py.
 """
 import os
 from flask import jsonify, request, current_app
-from sqlalchemy import text, bindparam
+from sqlalchemy import text, inspect
 from sqlalchemy.exc import SQLAlchemyError
 
 from src.utils.resource_management import check_articles_table
+from src.utils.html_storage import dedup_savings
+from src.views.data_analysis.result_sets import ResultSetError, result_set_condition
+
+def filter_handle():
+    """The request's search result handle if it asks for filtered articles, otherwise None."""
+    # denotes whether or not the query should be done on filtered articles.
+    filtered = request.args.get('filtered', 'false').lower() == 'true'
+    return request.args.get('result') if filtered else None
+
+def filter_condition(connection):
+    """
+    Returns the SQL condition and params that limit a query to the search result set
+    of filter_handle(), a condition of all articles without one.
+    Used by get_text() and get_stats().
+    """
+    handle = filter_handle()
+    if not handle:
+        return "1=1", {}
+    return result_set_condition(connection, handle)
 
 def get_text():
     """
@@ -19,33 +39,20 @@ def get_text():
         if db_check_error:
             return db_check_error
 
-        # initialize for later execution in db_engine
-        where_params = {}
-
-        # denotes whether or not the query should be done on filtered articles.
-        filtered = request.args.get('filtered', 'false').lower() == 'true'
-        last_search_ids = (
-            current_app.last_search_ids
-            if hasattr(current_app, 'last_search_ids')
-            else None
-        )
-
-        whole_query = text("SELECT full_text FROM articles")
-
-        if filtered and last_search_ids:
-            where_clause = "WHERE id IN :ids"
-            where_params = {'ids': tuple(last_search_ids)}
-            whole_query = (
-                text(f"SELECT full_text FROM articles {where_clause}")
-                .bindparams(bindparam('ids', expanding=True))
-            )
+        whole_query = "SELECT full_text FROM articles WHERE {condition}"
 
+        # if filtered and searched, only the texts of the search's result set
         with current_app.db_engine.connect() as connection:
-            text_query = connection.execute(whole_query, where_params).fetchall()
+            condition, where_params = filter_condition(connection)
+            text_query = connection.execute(
+                text(whole_query.format(condition=condition)), where_params
+            ).fetchall()
 
         text_data = [{"full_text": full_text[0]} for full_text in text_query]
         return jsonify(text_data), 200
 
+    except ResultSetError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
     except SQLAlchemyError as e:
         current_app.logger.exception("Database error when getting text fields")
         return jsonify({
@@ -62,23 +69,18 @@ def get_stats():
     Called by routes.init_routes() for route /api/articles/statistics.
     """
     try:
+        cache_key = ('statistics', filter_handle())
+        stats = current_app.search_cache.get(cache_key)
+        if stats is not None:
+            return jsonify(*stats), 200
+        version = current_app.search_cache.version()
+
         db_check_error = check_articles_table()
         if db_check_error:
             return db_check_error
 
-        # denotes whether or not the query should be done on filtered articles.
-        filtered = request.args.get('filtered', 'false').lower() == 'true'
-        last_search_ids = (
-            current_app.last_search_ids
-            if hasattr(current_app, 'last_search_ids')
-            else None
-        )
-
-         # initialize for later execution in db_engine
-        where_params = {}
-
         # Queries URLs of the form www.url.com
-        domain_query = text("""
+        domain_query = """
                 SELECT 
                     SUBSTRING(
                         REPLACE(REPLACE(URL, 'https://', ''), 'http://', ''), 
@@ -87,11 +89,12 @@ def get_stats():
                     ) as domain,
                     COUNT(*) as count
                 FROM articles
+                WHERE {condition}
                 GROUP BY domain
-            """)
+            """
 
         # Queries URLs of the form www.url.com/subdirectory/
-        subdir_query = text("""
+        subdir_query = """
                 SELECT
                     SUBSTRING(
                         REPLACE(REPLACE(URL, 'https://', ''), 'http://', ''), 
@@ -101,70 +104,39 @@ def get_stats():
                     ) as domain,
                     COUNT(*) as count
                 FROM articles
+                WHERE {condition}
                 GROUP BY domain
-            """)
+            """
 
         # Queries dates for time series
-        dates_query = text("""
+        dates_query = """
                 SELECT time, COUNT(*) as count
                 FROM articles
-                WHERE time IS NOT NULL AND time != ''
+                WHERE time IS NOT NULL AND time != '' AND {condition}
                 GROUP BY strftime('%d-%m-%Y', time)
                 ORDER BY time ASC
-            """)
-
-        # if filtered and searched, use searched ids
-        if filtered and last_search_ids:
-            where_clause = "WHERE id IN :ids"
-            where_params = {'ids': tuple(last_search_ids)}
-
-            domain_query = text(f"""
-                                SELECT 
-                                    SUBSTRING(
-                                        REPLACE(REPLACE(URL, 'https://', ''), 'http://', ''), 
-                                        1, 
-                                        INSTR(REPLACE(REPLACE(URL, 'https://', ''), 'http://', ''), "/") - 1
-                                    ) as domain,
-                                    COUNT(*) as count
-                                FROM articles
-                                {where_clause}
-                                GROUP BY domain
-                            """).bindparams(bindparam('ids', expanding=True))
-
-            subdir_query = text(f"""
-                                SELECT
-                                    SUBSTRING(
-                                        REPLACE(REPLACE(URL, 'https://', ''), 'http://', ''), 
-                                        1,  
-                                        LENGTH(SUBSTRING(REPLACE(REPLACE(URL, 'https://', ''), 'http://', ''), 1, INSTR(REPLACE(REPLACE(URL, 'https://', ''), 'http://', ''), "/") - 1))  
-                                        + INSTR(SUBSTRING(REPLACE(REPLACE(URL, 'https://', ''), 'http://', ''), INSTR(REPLACE(REPLACE(URL, 'https://', ''), 'http://', ''), '/') + 1), '/') + 1
-                                    ) as domain,
-                                    COUNT(*) as count
-                                FROM articles
-                                {where_clause}
-                                GROUP BY domain
-                            """).bindparams(bindparam('ids', expanding=True))
-
-            dates_query = text(f"""
-                                SELECT time, COUNT(*) as count
-                                FROM articles
-                                WHERE time IS NOT NULL AND time != ''
-                                {"AND " + where_clause[6:] if where_clause else ""}
-                                GROUP BY strftime('%d-%m-%Y', time)
-                                ORDER BY time ASC
-                            """).bindparams(bindparam('ids', expanding=True))
+            """
 
+        # if filtered and searched, only the articles of the search's result set
         with current_app.db_engine.connect() as connection:
-            domain_rows = connection.execute(domain_query, where_params).fetchall()
-            subdir_rows = connection.execute(subdir_query, where_params).fetchall()
-            dates_row = connection.execute(dates_query, where_params).fetchall()
-
-        return jsonify(
+            condition, where_params = filter_condition(connection)
+            domain_rows, subdir_rows, dates_row = [
+                connection.execute(
+                    text(query.format(condition=condition)), where_params
+                ).fetchall()
+                for query in (domain_query, subdir_query, dates_query)
+            ]
+
+        stats = [
             [{"name": domain, "count": count} for domain, count in domain_rows],
             [{"name": domain, "count": count} for domain, count in subdir_rows],
             [{"name": time, "count": count} for time, count in dates_row]
-        ), 200
+        ]
+        current_app.search_cache.put(cache_key, stats, version)
+        return jsonify(*stats), 200
 
+    except ResultSetError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
     except SQLAlchemyError as e:
         current_app.logger.exception("Database error when getting statistics")
         return jsonify({
@@ -177,7 +149,8 @@ def get_stats():
 
 def get_data_size():
     """
-    Returns the size of the data.db file.
+    Returns the size of the data.db file, and how many articles share a page
+    stored once in the body store along with the space that saves.
     Called by routes.init_routes() for route /api/data_size.
     """
     try:
@@ -186,19 +159,27 @@ def get_data_size():
         if not os.path.exists(db_path):
             return jsonify({"size": "0 bytes"}), 200
 
-        size_bytes = os.path.getsize(db_path)
+        duplicates, saved = 0, 0
+        if inspect(current_app.db_engine).has_table('article_bodies'):
+            with current_app.db_engine.connect() as connection:
+                duplicates, saved = dedup_savings(connection)
 
-        if size_bytes < 1024:
-            size_str = f"{size_bytes} bytes"
-        elif size_bytes < 1024 * 1024:
-            size_str = f"{size_bytes / 1024:.2f} KB"
-        elif size_bytes < 1024 * 1024 * 1024:
-            size_str = f"{size_bytes / (1024 * 1024):.2f} MB"
-        else:
-            size_str = f"{size_bytes / (1024 * 1024 * 1024):.2f} GB"
-
-        return jsonify({"size": size_str}), 200
+        return jsonify({
+            "size": format_size(os.path.getsize(db_path)),
+            "duplicate_articles": duplicates,
+            "dedup_saved": format_size(saved)
+        }), 200
 
     except Exception as e:
         current_app.logger.exception("Error when getting data size")
         return jsonify({"status": "error", "message": str(e)}), 500
+
+def format_size(size_bytes):
+    """Formats a byte count for display. Used by get_data_size()."""
+    if size_bytes < 1024:
+        return f"{size_bytes} bytes"
+    if size_bytes < 1024 * 1024:
+        return f"{size_bytes / 1024:.2f} KB"
+    if size_bytes < 1024 * 1024 * 1024:
+        return f"{size_bytes / (1024 * 1024):.2f} MB"
+    return f"{size_bytes / (1024 * 1024 * 1024):.2f} GB"
@@ -1,14 +1,16 @@
 """
-This handles db file export routes. Called by routes.py.
+This handles db file export routes. Exports hold a read lease of the database
+coordinator while they run. Called by routes.py.
 """
 import os
-import time
 from flask import jsonify, request, current_app, stream_with_context
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import text
 
 from src.utils.resource_management import check_articles_table
-from src.utils.processing_status import ProcessingStatus
+from src.utils.db_schema import ARTICLE_VIEW
+from src.utils.db_coordination import LeaseTimeout
+from src.views.data_analysis.result_sets import ResultSetError, result_set_condition
 from src.views.data_export.format_converter import (
     convert_db_to_json,
     convert_db_to_csv,
@@ -20,43 +22,47 @@ def get_all_export():
     Returns an export file of all of db articles via export_articles().
     Called by routes.init_routes() for route /api/articles/export.
     """
-    # wait for processing to finish
-    while ProcessingStatus.get_status():
-        time.sleep(1)
-
-    query = text("SELECT * FROM articles")
+    query = text(f"SELECT * FROM {ARTICLE_VIEW}")
     return export_articles(query, request.args.get('format'))
 
 def get_query_export():
     """
-    Returns an export file of queried db articles via export_articles().
+    Returns an export file of queried db articles via export_articles(), those of
+    the search result set of the result handle, all of them without a handle.
     Called by routes.init_routes() for route /api/articles/export_query.
     """
-    # wait for processing to finish if it were to coincide
-    while ProcessingStatus.get_status():
-        time.sleep(1)
-
-    # check searched ids
-    last_search_ids = (
-        current_app.last_search_ids
-        if hasattr(current_app, 'last_search_ids')
-        else None
-    )
-
-    if last_search_ids:
-        query = text(f"SELECT * FROM articles WHERE id IN ({','.join(map(str, last_search_ids))})")
-    else:
-        query = text("SELECT * FROM articles")
+    handle = request.args.get('result')
+    query = text(f"SELECT * FROM {ARTICLE_VIEW}")
+    if handle:
+        try:
+            with current_app.db_engine.connect() as connection:
+                condition, params = result_set_condition(connection, handle)
+        except ResultSetError as e:
+            return jsonify({"status": "error", "message": str(e)}), 404
+        except SQLAlchemyError as e:
+            current_app.logger.exception("Database error when downloading")
+            return jsonify({
+                "status": "error",
+                "message": f"Database error when downloading: {str(e)}"
+            }), 500
+        query = text(f"SELECT * FROM {ARTICLE_VIEW} WHERE {condition}").bindparams(**params)
 
     return export_articles(query, request.args.get('format'), "articles_query")
 
 def export_articles(query, file_format, base_filename="articles"):
     """
     Queries database for either all or a specified query to export.
-    Passes it to convert_and_send().
-    Called by get_all_export() and get_query_export().
+    Passes it to convert_and_send(). Waits for a read lease first, which is
+    immediate unless a collection cycle writes to a database not in WAL mode, and
+    keeps it until the file is sent. Called by get_all_export() and get_query_export().
     """
+    coordinator = current_app.db_coordinator
+    lease = None
+    released_on_close = False
     try:
+        lease = coordinator.acquire_read(
+            f"{base_filename} export", current_app.config['EXPORT_WAIT_TIMEOUT']
+        )
         db_check_error = check_articles_table()
         if db_check_error:
             return db_check_error
@@ -69,7 +75,13 @@ def export_articles(query, file_format, base_filename="articles"):
         )
 
         with current_app.db_engine.connect() as conn:
-            return convert_and_send(conn, query, file_format, output_file_path)
+            response = convert_and_send(conn, query, file_format, output_file_path)
+        if not isinstance(response, tuple):
+            response.call_on_close(lambda: coordinator.release(lease))
+            released_on_close = True
+        return response
+    except LeaseTimeout as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
     except SQLAlchemyError as e:
         current_app.logger.exception("Database error when downloading")
         return jsonify({
@@ -79,6 +91,9 @@ def export_articles(query, file_format, base_filename="articles"):
     except Exception as e:
         current_app.logger.exception("Downloading articles resulted in failure")
         return jsonify({"status": "error", "message": str(e)}), 400
+    finally:
+        if lease is not None and not released_on_close:
+            coordinator.release(lease)
 
 def convert_and_send(conn, query, file_format, output_file_path):
     """
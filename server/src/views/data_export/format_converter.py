@@ -2,7 +2,8 @@
 This service converts db to json, csv and parquet. Used by export_manager.py.
 This is optimized for lowering peak memory usage, since memory is so tight on Rahti.
 Going row by row ended up lowering peak memory usage massively. Pandas also seemed
-to be a bit heavy on memory.
+to be a bit heavy on memory. HTML is stored compressed, so each row's HTML is
+decompressed as it's converted.
 """
 import io
 import json
@@ -10,6 +11,12 @@ import csv
 import pyarrow as pa
 import pyarrow.parquet as pq
 
+from src.utils.html_storage import decode_html
+
+def decoded_row(row):
+    """Returns the row as a dict, with compressed values such as the HTML as text."""
+    return {key: decode_html(value) for key, value in row._asdict().items()}
+
 def convert_db_to_json(result):
     """
     Convert db to .json. Called by convert_db_to_format().
@@ -22,7 +29,7 @@ def convert_db_to_json(result):
             yield ','
         else:
             first = False
-        yield json.dumps(row._asdict(), ensure_ascii=False, default=str)
+        yield json.dumps(decoded_row(row), ensure_ascii=False, default=str)
     yield ']'
 
 def convert_db_to_csv(result):
@@ -41,7 +48,7 @@ def convert_db_to_csv(result):
 
     # rows
     for row in result:
-        writer.writerow(row)
+        writer.writerow(decoded_row(row).values())
         yield output.getvalue()
         output.seek(0)
         output.truncate(0)
@@ -60,6 +67,7 @@ def convert_db_to_parquet(result, output_file_path):
 
     with pq.ParquetWriter(output_file_path, schema) as writer:
         for row in result:
-            arrays = [pa.array([str(getattr(row, col, ''))]) for col in columns]
+            values = decoded_row(row)
+            arrays = [pa.array([str(values.get(col, ''))]) for col in columns]
             batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
             writer.write_batch(batch)
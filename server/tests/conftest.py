@@ -4,9 +4,11 @@ This sets configurations for test functions.
 import os
 import shutil
 import pytest
+from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 
 from src.app import create_app
+from src.utils.db_schema import ensure_articles_table, ensure_collection_tables
 from tests.database_filler import fill_test_database
 
 @pytest.fixture(scope='module', name='app')
@@ -45,12 +47,10 @@ def setup_and_teardown(engine, app_config):
     with open(os.path.join(data_dir, 'feeds.txt'), 'w', encoding='utf-8') as f:
         f.write('')
 
-    with open(os.path.join(base_dir, 'collect.py'), 'w', encoding='utf-8') as f:
-        f.write('print("Bla bla bla collect script")')
-
-    with open(os.path.join(base_dir, 'process.py'), 'w', encoding='utf-8') as f:
-        f.write('print("Bla bla bla process script")')
-
+    # committed like the schema the app sets up at start
+    with engine.begin() as connection:
+        ensure_articles_table(connection, app_config['SEARCH_SUBSTRINGS'])
+        ensure_collection_tables(connection)
     conn = engine.connect()
     trans = conn.begin()
     fill_test_database(conn)
@@ -67,3 +67,31 @@ def setup_and_teardown(engine, app_config):
     engine.dispose()
 
     shutil.rmtree(base_dir)
+
+@pytest.fixture(name='committed_articles')
+def committed_articles_fixture(engine, app_config):
+    """
+    Commits 25 articles that requests can see, some with the same time and some
+    without one, and returns their URLs newest first. Drops them afterwards.
+    Used as a parameter.
+    """
+    articles = [
+        {'url': f'https://blabla.com/paged{i:02}', 'full_text': f'Paged text {i}',
+         'time': None if i % 10 == 0 else f'2016-06-{1 + i // 3:02} 09:09:09'}
+        for i in range(25)
+    ]
+    with engine.begin() as connection:
+        ensure_articles_table(connection, app_config['SEARCH_SUBSTRINGS'])
+        connection.execute(
+            text("INSERT INTO articles (url, full_text, time) VALUES (:url, :full_text, :time)"),
+            articles
+        )
+    yield [article['url'] for article in sorted(
+        articles, key=lambda article: (article['time'] or '', article['url']), reverse=True
+    )]
+    with engine.begin() as connection:
+        connection.execute(text("DROP VIEW article_contents"))
+        connection.execute(text("DROP TABLE article_bodies"))
+        connection.execute(text("DROP TABLE articles"))
+        connection.execute(text("DROP TABLE article_search"))
+        connection.execute(text("DROP TABLE article_substrings"))
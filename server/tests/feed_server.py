@@ -0,0 +1,109 @@
+"""
+This is a local stand-in HTTP server for feeds and article pages.
+It keeps connections alive and answers conditional GETs like real news sites,
+and counts requests, new connections and peak concurrency so the tests can check
+the fetching behaviour.
+"""
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+def rss_feed(links, title="Bla bla feed", dates=None):
+    """Builds an RSS 2.0 feed body listing the links, with the given pubDates if any."""
+    dates = dates or [f"Mon, 06 Jun 2016 09:09:0{i % 10} GMT" for i in range(len(links))]
+    items = ''.join(
+        f"<item><title>Article {i}</title><link>{link}</link>"
+        f"<pubDate>{date}</pubDate></item>"
+        for i, (link, date) in enumerate(zip(links, dates))
+    )
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+        f'<title>{title}</title>{items}</channel></rss>'
+    ).encode('utf-8')
+
+def article_page(title, text="Full text of the article."):
+    """Builds a small article HTML page."""
+    return (
+        f'<!DOCTYPE html><html lang="fi"><head><title>{title}</title></head>'
+        f'<body><nav><p>Menu</p></nav><article><p>{text}</p></article></body></html>'
+    ).encode('utf-8')
+
+class FeedServer:
+    """Serves registered paths on a random local port in a background thread."""
+    def __init__(self):
+        self.routes = {}
+        self.requests = {}
+        self.connections = 0
+        self.active = 0
+        self.peak_active = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def add(self, path, body, status=200, headers=None, delay=0.0):
+        """Registers a response for the path."""
+        self.routes[path] = {
+            'body': body,
+            'status': status,
+            'headers': headers or {},
+            'delay': delay
+        }
+
+    def url(self, path, host='127.0.0.1'):
+        """Full URL of the path, localhost can be used as a second domain."""
+        return f"http://{host}:{self._server.server_port}{path}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Keep-alive handler serving server.routes."""
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                """Serves a registered route or 404."""
+                path = self.path
+                with server._lock:
+                    server.requests[path] = server.requests.get(path, 0) + 1
+                    server.active += 1
+                    server.peak_active = max(server.peak_active, server.active)
+                try:
+                    route = server.routes.get(path)
+                    if route is None:
+                        route = {'body': b'Not found', 'status': 404, 'headers': {}, 'delay': 0}
+                    time.sleep(route['delay'])
+                    etag = route['headers'].get('ETag')
+                    if etag and self.headers.get('If-None-Match') == etag:
+                        self.send_response(304)
+                        self.send_header('ETag', etag)
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    self.send_response(route['status'])
+                    for name, value in route['headers'].items():
+                        self.send_header(name, value)
+                    self.send_header('Content-Length', str(len(route['body'])))
+                    self.end_headers()
+                    self.wfile.write(route['body'])
+                finally:
+                    with server._lock:
+                        server.active -= 1
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                pass
+
+        return Handler
@@ -0,0 +1,151 @@
+"""
+Tests collector_worker.py with cycle targets defined in this module.
+"""
+# pylint: disable=redefined-outer-name
+import os
+import time
+import threading
+import multiprocessing
+import pytest
+
+from src.utils.collector_worker import (
+    CollectorWorker,
+    CollectorWorkerError,
+    CycleInterrupted,
+    resolve_target,
+    report_progress
+)
+
+CALLS = []
+
+def count_calls(label):
+    """Cycle target whose module state survives between cycles in a warm worker."""
+    CALLS.append(label)
+    return {'calls': len(CALLS), 'pid': os.getpid(), 'label': label}
+
+def report_steps(steps):
+    """Cycle target that reports progress, throttled apart from the forced last step."""
+    for step in range(steps):
+        report_progress('counting', force=step == steps - 1, done=step + 1, total=steps)
+    return steps
+
+def fail_cycle():
+    """Cycle target that raises."""
+    raise ValueError("broken cycle")
+
+def hang(seconds):
+    """Cycle target that hangs with a child process of its own."""
+    child = multiprocessing.get_context('spawn').Process(target=time.sleep, args=(seconds,))
+    child.start()
+    report_progress('hanging', force=True, child_pid=child.pid)
+    time.sleep(seconds)
+
+def exit_worker():
+    """Cycle target that kills the worker process."""
+    os._exit(3)
+
+@pytest.fixture
+def worker():
+    """Worker that is always stopped afterwards."""
+    collector = CollectorWorker()
+    yield collector
+    collector.stop()
+
+def test_run_cycle_keeps_worker_warm(worker):
+    """Tests that consecutive cycles run in the same process with imports kept."""
+    first = worker.run_cycle('tests.test_collector_worker:count_calls', label='first')
+    second = worker.run_cycle('tests.test_collector_worker:count_calls', label='second')
+
+    assert first['calls'] == 1
+    assert second['calls'] == 2
+    assert second['label'] == 'second'
+    assert first['pid'] == second['pid'] == worker.pid
+    assert first['pid'] != os.getpid()
+
+def test_run_cycle_error(worker):
+    """Tests that an exception in the cycle is reported and the worker survives."""
+    with pytest.raises(CollectorWorkerError, match="broken cycle"):
+        worker.run_cycle('tests.test_collector_worker:fail_cycle')
+    assert worker.is_alive()
+
+def test_worker_death_and_restart(worker):
+    """Tests that a dying worker is reported and started again by the next cycle."""
+    with pytest.raises(CollectorWorkerError, match="exited unexpectedly"):
+        worker.run_cycle('tests.test_collector_worker:exit_worker')
+    assert not worker.is_alive()
+
+    result = worker.run_cycle('tests.test_collector_worker:count_calls', label='again')
+    assert result['calls'] == 1
+
+def test_resolve_target():
+    """Tests resolving module:function paths."""
+    assert resolve_target('os.path:join') is os.path.join
+
+def test_run_cycle_progress(worker):
+    """Tests that progress reported in the worker reaches on_progress before the result."""
+    progress = []
+    result = worker.run_cycle(
+        'tests.test_collector_worker:report_steps', on_progress=progress.append, steps=100
+    )
+
+    assert result == 100
+    assert progress[0] == {'phase': 'counting', 'done': 1, 'total': 100}
+    assert progress[-1] == {'phase': 'counting', 'done': 100, 'total': 100}
+    assert len(progress) == 2
+
+def test_report_progress_outside_worker():
+    """Tests that reporting progress outside the worker does nothing."""
+    report_progress('counting', force=True, done=1)
+
+def pid_exists(pid):
+    """Whether a process, not a zombie, with the pid is running."""
+    try:
+        with open(f'/proc/{pid}/stat', encoding='utf-8') as f:
+            return f.read().split(') ')[1][0] != 'Z'
+    except OSError:
+        return False
+
+def test_run_cycle_time_limit(worker):
+    """Tests that the watchdog kills an overrunning cycle with its child processes."""
+    progress = []
+    started = time.monotonic()
+    with pytest.raises(CycleInterrupted, match="time limit"):
+        worker.run_cycle(
+            'tests.test_collector_worker:hang',
+            on_progress=progress.append,
+            time_limit=2,
+            seconds=60
+        )
+
+    assert time.monotonic() - started < 10
+    assert not worker.is_alive()
+    time.sleep(0.5)
+    assert not pid_exists(progress[0]['child_pid'])
+
+def test_cancel(worker):
+    """Tests cancelling a running cycle from another thread, and the next cycle after."""
+    threading.Timer(2, worker.cancel).start()
+    with pytest.raises(CycleInterrupted, match="cancelled"):
+        worker.run_cycle('tests.test_collector_worker:hang', seconds=60)
+
+    result = worker.run_cycle('tests.test_collector_worker:count_calls', label='after')
+    assert result['label'] == 'after'
+
+def test_stop_during_and_between_cycles(worker):
+    """
+    Tests that stopping from another thread interrupts the running cycle and kills
+    the worker, and that cancelling between cycles stops the idle worker too.
+    """
+    stopping = threading.Timer(2, worker.stop)
+    stopping.start()
+    with pytest.raises(CycleInterrupted, match="cancelled"):
+        worker.run_cycle('tests.test_collector_worker:hang', seconds=60)
+    stopping.join()
+    assert not worker.is_alive()
+
+    worker.run_cycle('tests.test_collector_worker:count_calls', label='idle')
+    assert worker.is_alive()
+    worker.cancel()
+    assert not worker.is_alive()
+    result = worker.run_cycle('tests.test_collector_worker:count_calls', label='after')
+    assert result['label'] == 'after'
@@ -0,0 +1,62 @@
+"""
+Tests container_limits.py against fake cgroup files.
+"""
+import os
+
+from src.utils.container_limits import (
+    cpu_quota,
+    cpu_limit,
+    worker_count,
+    memory_limit,
+    memory_usage
+)
+
+def test_cpu_quota_cgroup_v2(tmp_path):
+    """Tests reading a cgroup v2 quota and an unlimited one."""
+    (tmp_path / 'cpu.max').write_text('150000 100000\n', encoding='utf-8')
+    assert cpu_quota(str(tmp_path)) == 1.5
+
+    (tmp_path / 'cpu.max').write_text('max 100000\n', encoding='utf-8')
+    assert cpu_quota(str(tmp_path)) is None
+
+def test_cpu_quota_cgroup_v1(tmp_path):
+    """Tests reading a cgroup v1 quota."""
+    os.makedirs(tmp_path / 'cpu')
+    (tmp_path / 'cpu' / 'cpu.cfs_quota_us').write_text('200000', encoding='utf-8')
+    (tmp_path / 'cpu' / 'cpu.cfs_period_us').write_text('100000', encoding='utf-8')
+    assert cpu_quota(str(tmp_path)) == 2
+
+def test_worker_count_capped_by_quota(tmp_path):
+    """Tests that the configured count can't exceed the quota and 0 means the quota."""
+    (tmp_path / 'cpu.max').write_text('100000 100000\n', encoding='utf-8')
+    assert cpu_limit(str(tmp_path)) == 1
+    assert worker_count(8, str(tmp_path)) == 1
+    assert worker_count(0, str(tmp_path)) == 1
+    assert worker_count(0, str(tmp_path / 'missing')) >= 1
+
+def test_memory_limit_and_usage_cgroup_v2(tmp_path):
+    """Tests reading the memory limit and the working set without inactive page cache."""
+    (tmp_path / 'memory.max').write_text('1073741824\n', encoding='utf-8')
+    (tmp_path / 'memory.current').write_text('600000000\n', encoding='utf-8')
+    (tmp_path / 'memory.stat').write_text(
+        'anon 400000000\ninactive_file 100000000\nactive_file 100000000\n', encoding='utf-8'
+    )
+    assert memory_limit(str(tmp_path)) == 1073741824
+    assert memory_usage(str(tmp_path)) == 500000000
+
+    (tmp_path / 'memory.max').write_text('max\n', encoding='utf-8')
+    assert memory_limit(str(tmp_path)) is None
+
+def test_memory_limit_cgroup_v1(tmp_path):
+    """Tests reading a cgroup v1 memory limit and treating the huge default as none."""
+    os.makedirs(tmp_path / 'memory')
+    (tmp_path / 'memory' / 'memory.limit_in_bytes').write_text('536870912', encoding='utf-8')
+    (tmp_path / 'memory' / 'memory.usage_in_bytes').write_text('300000000', encoding='utf-8')
+    assert memory_limit(str(tmp_path)) == 536870912
+    assert memory_usage(str(tmp_path)) == 300000000
+
+    (tmp_path / 'memory' / 'memory.limit_in_bytes').write_text(
+        '9223372036854771712', encoding='utf-8'
+    )
+    assert memory_limit(str(tmp_path)) is None
+    assert memory_usage(str(tmp_path / 'missing')) is None
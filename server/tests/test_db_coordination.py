@@ -0,0 +1,107 @@
+"""
+Tests db_coordination.py with file databases in and out of WAL mode.
+"""
+import time
+import threading
+import pytest
+from sqlalchemy import create_engine, text
+
+from src.utils.db_coordination import DbCoordinator, LeaseTimeout, enable_wal
+
+def make_coordinator(tmp_path, wal, **kwargs):
+    """Coordinator of a new database file, in WAL mode or the default rollback journal."""
+    engine = create_engine(f"sqlite:///{tmp_path}/data.db")
+    if wal:
+        enable_wal(engine)
+    return DbCoordinator(engine, **kwargs)
+
+def test_reads_during_write_with_wal(tmp_path):
+    """Tests that under WAL exports start right away while a cycle writes."""
+    coordinator = make_coordinator(tmp_path, wal=True)
+    assert coordinator.concurrent_reads()
+
+    writer = coordinator.acquire_write('collection cycle a')
+    assert writer is not None and coordinator.holds_write()
+    assert coordinator.acquire_write('collection cycle a') is None
+    # collector instances each have their own
+    other = coordinator.acquire_write('collection cycle b')
+    reader = coordinator.acquire_read('articles export', timeout=0)
+    assert coordinator.status() == {
+        'writing': True,
+        'writers': ['collection cycle a', 'collection cycle b'],
+        'readers': 1,
+        'waiting': 0
+    }
+
+    coordinator.release(reader)
+    coordinator.release(writer)
+    coordinator.release(other)
+    assert not coordinator.is_writing() and not coordinator.holds_write()
+
+def test_queued_reads_without_wal(tmp_path):
+    """
+    Tests that without WAL exports queue until the cycle releases the write lease
+    and are woken by it, and that no cycle starts while exports are queued.
+    """
+    coordinator = make_coordinator(tmp_path, wal=False)
+    assert not coordinator.concurrent_reads()
+    writer = coordinator.acquire_write('collection cycle')
+
+    with pytest.raises(LeaseTimeout):
+        coordinator.acquire_read('articles export', timeout=0.1)
+    assert coordinator.status()['waiting'] == 0
+
+    granted = {}
+    def export():
+        granted['lease'] = coordinator.acquire_read('articles export', timeout=10)
+        granted['at'] = time.monotonic()
+    thread = threading.Thread(target=export)
+    thread.start()
+    while not coordinator.status()['waiting']:
+        time.sleep(0.01)
+    assert coordinator.status()['waiting'] == 1
+
+    released_at = time.monotonic()
+    coordinator.release(writer)
+    thread.join(5)
+    assert granted['lease'].mode == 'read'
+    # woken by the release rather than by rechecking
+    assert granted['at'] - released_at < 1
+
+    assert coordinator.acquire_write('collection cycle') is None
+    coordinator.release(granted['lease'])
+    assert coordinator.acquire_write('collection cycle') is not None
+
+def test_expired_leases(tmp_path):
+    """Tests that leases of crashed processes stop blocking once they expire."""
+    coordinator = make_coordinator(tmp_path, wal=False, write_seconds=0.1, recheck_seconds=0.05)
+    coordinator.acquire_write('collection cycle')
+    with coordinator.engine.begin() as connection:
+        # as if taken by another process
+        connection.execute(text("UPDATE db_leases SET pid = -1"))
+
+    lease = coordinator.acquire_read('articles export', timeout=5)
+    assert lease.mode == 'read'
+    assert not coordinator.is_writing()
+
+def test_status_only_reads(tmp_path):
+    """
+    Tests that the status leaves out expired leases without deleting them, and that
+    acquiring a lease deletes them.
+    """
+    coordinator = make_coordinator(tmp_path, wal=True, write_seconds=0.05)
+    coordinator.acquire_write('collection cycle')
+    time.sleep(0.1)
+    with coordinator.engine.connect() as connection:
+        version = connection.execute(text("PRAGMA data_version")).scalar()
+        assert coordinator.status() == {
+            'writing': False, 'writers': [], 'readers': 0, 'waiting': 0
+        }
+        # nothing was committed by the status
+        assert connection.execute(text("PRAGMA data_version")).scalar() == version
+        assert connection.execute(text("SELECT COUNT(*) FROM db_leases")).scalar() == 1
+
+    # the expired lease of the same holder doesn't block a new one
+    assert coordinator.acquire_write('collection cycle') is not None
+    with coordinator.engine.connect() as connection:
+        assert connection.execute(text("SELECT COUNT(*) FROM db_leases")).scalar() == 1
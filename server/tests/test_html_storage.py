@@ -0,0 +1,105 @@
+"""
+Tests html_storage.py compression, the body store, the html_text() SQL function
+and moving HTML out of the articles table.
+"""
+import time
+from sqlalchemy import create_engine, text
+
+from src.utils.db_schema import (
+    ensure_articles_table,
+    ensure_collection_tables,
+    get_state,
+    ARTICLE_VIEW
+)
+from src.utils.html_storage import (
+    compress_html,
+    decode_html,
+    register_sql_functions,
+    content_hash,
+    store_body,
+    dedup_savings,
+    move_stored_html,
+    WATERMARK_KEY
+)
+
+PAGE = '<!DOCTYPE html><html lang="fi"><body><p>Bla bla ääkköset.</p></body></html>' * 20
+
+def make_engine(tmp_path):
+    """Engine of a fresh database with the collection tables."""
+    engine = create_engine(f"sqlite:///{tmp_path}/data.db")
+    register_sql_functions(engine)
+    with engine.connect() as connection:
+        ensure_articles_table(connection)
+        ensure_collection_tables(connection)
+        connection.commit()
+    return engine
+
+def insert_pages(connection, count):
+    """Inserts plain text HTML rows like the original collector."""
+    connection.execute(
+        text("INSERT INTO articles (url, html) VALUES (:url, :html)"),
+        [{'url': f"https://blabla.com/{i}", 'html': PAGE} for i in range(count)]
+    )
+    connection.commit()
+
+def test_compress_and_decode_html():
+    """Tests the round trip, and that plain text and None pass through."""
+    compressed = compress_html(PAGE)
+    assert isinstance(compressed, bytes) and len(compressed) < len(PAGE) / 5
+    assert decode_html(compressed) == PAGE
+    assert decode_html(PAGE) == PAGE
+    assert compress_html(None) is None and decode_html(None) is None
+
+def test_store_body(tmp_path):
+    """Tests that a page is stored once and duplicates are only counted."""
+    engine = make_engine(tmp_path)
+    with engine.connect() as connection:
+        first_hash, first_duplicate = store_body(connection, PAGE)
+        second_hash, second_duplicate = store_body(connection, PAGE)
+        assert first_hash == second_hash == content_hash(PAGE)
+        assert (first_duplicate, second_duplicate) == (False, True)
+        assert store_body(connection, PAGE + ' ')[1] is False
+
+        stored = connection.execute(text(
+            "SELECT html, refs FROM article_bodies WHERE content_hash = :hash"
+        ), {'hash': first_hash}).one()
+        assert decode_html(stored.html) == PAGE and stored.refs == 2
+        duplicates, saved = dedup_savings(connection)
+        assert duplicates == 1 and saved == len(stored.html)
+
+def test_move_stored_html(tmp_path):
+    """
+    Tests moving plain text and compressed rows to the body store in batches,
+    picking up rows added later, and reading either kind through the view.
+    """
+    engine = make_engine(tmp_path)
+    with engine.connect() as connection:
+        insert_pages(connection, 4)
+        connection.execute(text(
+            "INSERT INTO articles (url, html) VALUES ('https://blabla.com/z', :html)"
+        ), {'html': compress_html(PAGE)})
+        connection.execute(text("INSERT INTO articles (url, html) VALUES ('https://blabla.com/x', NULL)"))
+        assert move_stored_html(connection, batch_size=2) == 5
+        assert int(get_state(connection, WATERMARK_KEY)) == 6
+        assert connection.execute(text("SELECT refs FROM article_bodies")).scalars().all() == [5]
+        assert connection.execute(text(
+            "SELECT COUNT(*) FROM articles WHERE html IS NULL AND body_hash IS NOT NULL"
+        )).scalar() == 5
+
+        insert_pages(connection, 1)
+        assert move_stored_html(connection) == 1
+        assert move_stored_html(connection) == 0
+
+        insert_pages(connection, 1)
+        found = connection.execute(text(
+            f"SELECT COUNT(*) FROM {ARTICLE_VIEW} WHERE html_text(html) LIKE '%ääkköset%'"
+        )).scalar()
+        assert found == 7
+
+def test_move_stored_html_deadline(tmp_path):
+    """Tests that a passed deadline leaves the rows for the next call."""
+    engine = make_engine(tmp_path)
+    with engine.connect() as connection:
+        insert_pages(connection, 3)
+        assert move_stored_html(connection, deadline=time.monotonic()) == 0
+        assert move_stored_html(connection) == 3
@@ -0,0 +1,171 @@
+"""
+Tests acquisition_engine.py against the local stand-in feed server.
+"""
+import time
+import pytest
+
+from tests.feed_server import FeedServer, rss_feed, article_page
+from src.views.data_acquisition.acquisition_engine import (
+    AcquisitionEngine,
+    ArticleResult,
+    FeedResult,
+    HttpClient,
+    HttpError,
+    parse_feed
+)
+
+ATOM_FEED = b"""<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <title>Bla bla atom</title>
+  <entry>
+    <title>Atom article</title>
+    <link rel="alternate" href="/atom/article1"/>
+    <published>2016-06-06T09:09:09+03:00</published>
+  </entry>
+</feed>"""
+
+def test_parse_feed_rss():
+    """Tests parsing links, titles and dates of an RSS feed."""
+    entries = parse_feed(rss_feed(['https://blabla.com/article1']), 'https://blabla.com/feed')
+    assert len(entries) == 1
+    assert entries[0].link == 'https://blabla.com/article1'
+    assert entries[0].title == 'Article 0'
+    assert entries[0].published.year == 2016
+
+def test_parse_feed_atom():
+    """Tests parsing an Atom feed with relative links and offset times."""
+    entries = parse_feed(ATOM_FEED, 'https://blabla.com/feed')
+    assert entries[0].link == 'https://blabla.com/atom/article1'
+    assert entries[0].published.hour == 6
+
+def test_parse_feed_invalid():
+    """Tests that a non-feed body is rejected."""
+    with pytest.raises(ValueError):
+        parse_feed(b'<html><body>Bla bla</body></html>', 'https://blabla.com/feed')
+
+def test_parse_feed_malformed_with_entries():
+    """Tests that a feed with broken markup is still read if it has entries."""
+    body = (b'<rss version="2.0"><channel><item><title>Bla &amp bla</title>'
+            b'<link>/article1</link></item></channel>')
+    entries = parse_feed(body, 'https://blabla.com/feed')
+    assert [entry.link for entry in entries] == ['https://blabla.com/article1']
+    assert entries[0].title == 'Bla & bla'
+
+def test_http_client_keep_alive_and_errors():
+    """Tests that requests to one host reuse a connection and that 404 raises."""
+    with FeedServer() as server:
+        server.add('/page', b'Bla bla')
+        client = HttpClient(timeout=5)
+        for _ in range(3):
+            assert client.get(server.url('/page')).body == b'Bla bla'
+        with pytest.raises(HttpError, match="404"):
+            client.get(server.url('/missing'))
+        client.close()
+
+    assert server.connections == 1
+
+def test_collect_feeds_concurrently():
+    """Tests that slow feeds are fetched at the same time rather than one after another."""
+    with FeedServer() as server:
+        feed_urls = []
+        for i in range(4):
+            host = '127.0.0.1' if i % 2 else 'localhost'
+            link = server.url(f'/article{i}', host)
+            server.add(f'/feed{i}', rss_feed([link]), delay=0.5)
+            server.add(f'/article{i}', article_page(f'Article {i}'))
+            feed_urls.append(server.url(f'/feed{i}', host))
+
+        engine = AcquisitionEngine(max_workers=8, per_host_limit=2, timeout=5)
+        started = time.monotonic()
+        results = list(engine.collect(feed_urls))
+        elapsed = time.monotonic() - started
+        engine.close()
+
+    feeds = [result for result in results if isinstance(result, FeedResult)]
+    articles = [result for result in results if isinstance(result, ArticleResult)]
+    assert len(feeds) == 4 and not any(feed.error for feed in feeds)
+    assert len(articles) == 4 and all('<article>' in article.html for article in articles)
+    assert elapsed < 1.9
+
+def test_collect_per_host_limit_and_selection():
+    """Tests the per domain cap and that only selected entries are downloaded."""
+    with FeedServer() as server:
+        links = [server.url(f'/article{i}') for i in range(8)]
+        server.add('/feed', rss_feed(links))
+        for i in range(8):
+            server.add(f'/article{i}', article_page(f'Article {i}'), delay=0.1)
+        server.add('/broken', b'not a feed')
+
+        engine = AcquisitionEngine(max_workers=8, per_host_limit=2, timeout=5)
+        results = list(engine.collect(
+            [server.url('/feed'), server.url('/broken')],
+            lambda entries: entries[:6]
+        ))
+        engine.close()
+
+    articles = [result for result in results if isinstance(result, ArticleResult)]
+    broken = [result for result in results if isinstance(result, FeedResult) and result.error]
+    assert len(articles) == 6
+    assert '/article7' not in server.requests
+    assert server.peak_active <= 2
+    assert len(broken) == 1 and broken[0].error.startswith('ValueError')
+
+def test_collect_busy_host_leaves_workers_free():
+    """
+    Tests that the queued articles of a host at its limit don't take the pool's
+    workers from the articles of other hosts.
+    """
+    with FeedServer() as server:
+        links = [server.url(f'/slow{i}', 'localhost') for i in range(4)]
+        server.add('/feed', rss_feed(links))
+        for i in range(4):
+            server.add(f'/slow{i}', article_page(f'Slow {i}'), delay=0.5)
+        server.add('/other_feed', rss_feed([server.url('/fast')]), delay=0.1)
+        server.add('/fast', article_page('Fast'))
+
+        engine = AcquisitionEngine(max_workers=2, per_host_limit=1, timeout=5)
+        started = time.monotonic()
+        finished = {}
+        for result in engine.collect(
+                [server.url('/feed', 'localhost'), server.url('/other_feed')]):
+            if isinstance(result, ArticleResult):
+                finished[result.entry.link] = time.monotonic() - started
+        engine.close()
+
+    assert len(finished) == 5
+    assert finished[server.url('/fast')] < 0.45
+    assert server.peak_active <= 2
+
+def test_collect_feed_budget():
+    """Tests that a feed's slow articles are given up when the feed's budget runs out."""
+    with FeedServer() as server:
+        server.add('/feed', rss_feed([server.url('/fast'), server.url('/slow')]))
+        server.add('/fast', article_page('Fast'))
+        server.add('/slow', article_page('Slow'), delay=1.5)
+        engine = AcquisitionEngine(max_workers=4, timeout=5, feed_budget=0.5)
+        started = time.monotonic()
+        results = list(engine.collect([server.url('/feed')]))
+        elapsed = time.monotonic() - started
+        engine.close()
+
+    articles = {result.entry.link: result for result in results
+                if isinstance(result, ArticleResult)}
+    assert articles[server.url('/fast')].error is None
+    assert 'Feed time budget' in articles[server.url('/slow')].error
+    assert elapsed < 1.2
+
+def test_collect_cycle_deadline():
+    """Tests that fetches still pending at the cycle deadline are yielded as timed out."""
+    with FeedServer() as server:
+        server.add('/slow_feed', rss_feed([]), delay=1.5)
+        server.add('/feed', rss_feed([]))
+        engine = AcquisitionEngine(max_workers=4, timeout=5)
+        results = list(engine.collect(
+            [server.url('/slow_feed'), server.url('/feed')],
+            deadline=time.monotonic() + 0.5
+        ))
+        engine.close()
+
+    errors = {result.url: result.error for result in results}
+    assert errors[server.url('/feed')] is None
+    assert errors[server.url('/slow_feed')].startswith('TimeoutError: Cycle time budget')
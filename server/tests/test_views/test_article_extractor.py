@@ -0,0 +1,115 @@
+"""
+Tests article_extractor.py extraction and the batched process pool stage.
+"""
+from sqlalchemy import create_engine, text
+
+from tests.feed_server import article_page
+from src.utils.db_schema import ensure_articles_table, ensure_collection_tables, get_state
+from src.views.data_acquisition.article_extractor import (
+    extract_article,
+    process_pending,
+    ExtractionPipeline
+)
+
+def test_extract_article():
+    """Tests extracting text and title while leaving out navigation."""
+    extracted = extract_article(article_page('Bla bla', 'Article text.').decode('utf-8'))
+    assert extracted['full_text'] == 'Article text.'
+    assert extracted['title'] == 'Bla bla'
+
+def test_process_pending_with_pool(tmp_path):
+    """Tests that a backlog split across processes is written back completely."""
+    engine = create_engine(f"sqlite:///{tmp_path}/data.db")
+    with engine.connect() as connection:
+        ensure_articles_table(connection)
+        ensure_collection_tables(connection)
+        connection.execute(
+            text("INSERT INTO articles (url, html) VALUES (:url, :html)"),
+            [
+                {'url': f'https://blabla.com/article{i}',
+                 'html': article_page(f'Article {i}', f'Text {i}.').decode('utf-8')}
+                for i in range(25)
+            ]
+        )
+        connection.execute(text(
+            "INSERT INTO articles (url, html, full_text) VALUES ('done', '<p>x</p>', 'x')"
+        ))
+        connection.commit()
+
+        counts = process_pending(connection, workers=2, batch_size=4)
+        rows = connection.execute(text(
+            "SELECT url, full_text FROM articles WHERE url != 'done' ORDER BY id"
+        )).fetchall()
+
+    assert counts['processed'] == 25 and counts['failed'] == 0
+    assert counts['watermark'] == 25
+    assert [row.full_text for row in rows] == [f'Text {i}.' for i in range(25)]
+
+def test_process_pending_resumes_from_watermark(tmp_path):
+    """Tests that rows before the watermark aren't looked at again."""
+    engine = create_engine(f"sqlite:///{tmp_path}/data.db")
+    with engine.connect() as connection:
+        ensure_articles_table(connection)
+        ensure_collection_tables(connection)
+        insert = text("INSERT INTO articles (url, html) VALUES (:url, :html)")
+        html = article_page('Bla bla').decode('utf-8')
+        connection.execute(insert, [{'url': f'old{i}', 'html': html} for i in range(3)])
+        connection.commit()
+
+        first = process_pending(connection)
+        # a row below the watermark that still lacks text is no longer scanned
+        connection.execute(text("UPDATE articles SET full_text = NULL WHERE id = 1"))
+        connection.execute(insert, {'url': 'new', 'html': html})
+        connection.commit()
+        second = process_pending(connection)
+
+        assert (first['watermark_from'], first['watermark']) == (0, 3)
+        assert (second['watermark_from'], second['watermark']) == (3, 4)
+        assert second['processed'] == 1
+        assert get_state(connection, 'extract_watermark') == '4'
+
+def test_process_pending_watermark_stops_before_unextracted(tmp_path):
+    """
+    Tests that with nothing to extract the watermark only moves up to the first
+    article still without text, so it is extracted once its page is stored.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path}/data.db")
+    with engine.connect() as connection:
+        ensure_articles_table(connection)
+        ensure_collection_tables(connection)
+        connection.execute(text("INSERT INTO articles (url, full_text) VALUES ('done', 'x')"))
+        connection.execute(text("INSERT INTO articles (url) VALUES ('storing')"))
+        connection.execute(text("INSERT INTO articles (url, full_text) VALUES ('later', 'y')"))
+        connection.commit()
+
+        assert process_pending(connection)['watermark'] == 1
+        connection.execute(text(
+            "UPDATE articles SET html = :html WHERE url = 'storing'"
+        ), {'html': article_page('Bla bla', 'Stored text.').decode('utf-8')})
+        connection.commit()
+        counts = process_pending(connection)
+        assert counts['processed'] == 1
+        assert process_pending(connection)['watermark'] == 3
+
+def test_extraction_pipeline(tmp_path):
+    """Tests extracting articles as they are stored, then advancing the watermark past them."""
+    engine = create_engine(f"sqlite:///{tmp_path}/data.db")
+    with engine.connect() as connection:
+        ensure_articles_table(connection)
+        ensure_collection_tables(connection)
+        pipeline = ExtractionPipeline(connection, workers=2, batch_size=3)
+        for i in range(10):
+            html = article_page(f'Article {i}', f'Text {i}.').decode('utf-8')
+            article_id = connection.execute(
+                text("INSERT INTO articles (url, html) VALUES (:url, :html)"),
+                {'url': f'https://blabla.com/article{i}', 'html': html}
+            ).lastrowid
+            connection.commit()
+            pipeline.put(article_id, f'https://blabla.com/article{i}', html)
+        pipeline.close()
+        counts = process_pending(connection)
+        texts = connection.execute(text("SELECT full_text FROM articles ORDER BY id")).scalars()
+
+        assert pipeline.counts == {'processed': 10, 'failed': 0}
+        assert list(texts) == [f'Text {i}.' for i in range(10)]
+        assert counts['processed'] == 0 and counts['watermark'] == 10
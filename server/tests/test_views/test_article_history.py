@@ -0,0 +1,50 @@
+"""
+Tests article_history.py route responses.
+"""
+from unittest.mock import patch
+from sqlalchemy import inspect, text
+
+from src import config
+from src.app import create_app
+from src.utils.db_schema import ensure_articles_table, ensure_collection_tables
+
+def test_get_article_revisions(client, engine):
+    """Tests listing an article's revisions with the diffs between them."""
+    with engine.begin() as connection:
+        ensure_articles_table(connection)
+        ensure_collection_tables(connection)
+        article_id = connection.execute(text("""
+            INSERT INTO articles (url, full_text, title)
+            VALUES ('https://www.blabla.com/article', 'Bla bla.\nBla bla bla, corrected.', 'Bla')
+        """)).lastrowid
+        connection.execute(text("""
+            INSERT INTO article_revisions (article_id, revision, full_text, title)
+            VALUES (:id, 1, 'Bla bla.\nBla bla bla.', 'Bla')
+        """), {'id': article_id})
+    try:
+        response = client.get(f'/api/articles/{article_id}/revisions')
+        missing = client.get(f'/api/articles/{article_id + 1}/revisions')
+        without_text = client.get(f'/api/articles/{article_id}/revisions?text=false')
+    finally:
+        with engine.begin() as connection:
+            connection.execute(text("DROP VIEW article_contents"))
+            connection.execute(text("DROP TABLE article_bodies"))
+            connection.execute(text("DROP TABLE articles"))
+            connection.execute(text("DROP TABLE article_search"))
+            connection.execute(text("DELETE FROM article_revisions"))
+
+    assert response.status_code == 200
+    revisions = response.json['revisions']
+    assert [revision['revision'] for revision in revisions] == [1, 2]
+    assert revisions[0]['diff'] is None and not revisions[0]['current']
+    assert '-Bla bla bla.\n+Bla bla bla, corrected.' in revisions[1]['diff']
+    assert missing.status_code == 404
+    assert 'full_text' not in without_text.json['revisions'][0]
+
+def test_revision_tables_created_at_start(tmp_path):
+    """Tests that the app creates the revision tables at start for the route to read."""
+    database_url = f"sqlite:///{tmp_path}/data.db"
+    with patch.object(config.TestConfig, 'DATABASE_URL', database_url):
+        app = create_app(testing=True)
+    assert inspect(app.db_engine).has_table('article_revisions')
+    app.db_engine.dispose()
@@ -0,0 +1,409 @@
+"""
+Tests collection_cycle.py end to end with the local stand-in feed server.
+"""
+# pylint: disable=redefined-outer-name
+import os
+import multiprocessing
+from datetime import datetime
+from unittest.mock import patch
+import pytest
+from sqlalchemy import create_engine, text
+
+from tests.feed_server import FeedServer, rss_feed, article_page
+from src.utils.collector_worker import CollectorWorker
+from src.utils.db_schema import ensure_articles_table, ensure_collection_tables
+from src.utils.html_storage import decode_html
+from src.views.data_acquisition.collection_cycle import get_db_engine, run_cycle
+from src.views.data_acquisition.fetch_history import get_history
+from src.views.data_acquisition.url_index import url_key
+from src.views.data_acquisition.feed_registry import list_feeds, update_feed
+from src.views.data_acquisition.feed_validator import probe_disabled_feeds
+from src.views.data_acquisition.acquisition_engine import FeedEntry
+from src.views.data_acquisition.article_revisions import (
+    RECHECK_AFTER, get_revisions, revision_diff, save_source, select_rechecks
+)
+
+@pytest.fixture
+def fetcher_folder(tmp_path):
+    """Fetcher folder with an empty data directory."""
+    os.makedirs(tmp_path / 'data')
+    return str(tmp_path)
+
+def write_feeds(fetcher_folder, feed_urls):
+    """Writes feeds.txt, which the first cycle imports into the feed registry."""
+    with open(os.path.join(fetcher_folder, 'data', 'feeds.txt'), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(feed_urls))
+
+def test_run_cycle(fetcher_folder):
+    """Tests that a cycle stores and extracts new articles and skips known ones after."""
+    database_url = f"sqlite:///{fetcher_folder}/data/data.db"
+    with FeedServer() as server:
+        links = [server.url('/article1'), server.url('/article2')]
+        server.add('/feed', rss_feed(links))
+        server.add('/article1', article_page('Article 1', 'Bla bla one.'))
+        server.add('/article2', article_page('Article 2', 'Bla bla two.'))
+        write_feeds(fetcher_folder, [server.url('/feed'), server.url('/missing')])
+
+        first = run_cycle(database_url, fetcher_folder, {'fetch': {'timeout': 5}}, force=True)
+        second = run_cycle(database_url, fetcher_folder, {'fetch': {'timeout': 5}}, force=True)
+
+    assert first['feeds'] == 2
+    assert len(first['feed_errors']) == 1 and 'HTTP 404' in first['feed_errors'][0]
+    assert first['new_articles'] == 2
+    assert first['processed'] == 2
+    assert first['pipelined'] == 2
+    assert second['new_articles'] == 0
+    assert server.requests['/article1'] == 1
+
+    with get_db_engine(database_url).connect() as connection:
+        rows = connection.execute(
+            text("SELECT url, html, full_text, title, time FROM article_contents ORDER BY url")
+        ).fetchall()
+    assert [row.full_text for row in rows] == ['Bla bla one.', 'Bla bla two.']
+    assert decode_html(rows[0].html) == article_page('Article 1', 'Bla bla one.').decode('utf-8')
+    assert rows[0].title == 'Article 1'
+    assert rows[0].time.startswith('2016-06-06')
+
+def test_run_cycle_conditional_get(fetcher_folder):
+    """Tests that unmodified and identical feeds are counted as cache hits and not parsed."""
+    database_url = f"sqlite:///{fetcher_folder}/data/data.db"
+    with FeedServer() as server:
+        server.add('/etag_feed', rss_feed([]), headers={'ETag': '"v1"'})
+        server.add('/plain_feed', rss_feed([]))
+        write_feeds(fetcher_folder, [server.url('/etag_feed'), server.url('/plain_feed')])
+
+        first = run_cycle(database_url, fetcher_folder, {'fetch': {'timeout': 5}}, force=True)
+        second = run_cycle(database_url, fetcher_folder, {'fetch': {'timeout': 5}}, force=True)
+        server.add('/plain_feed', rss_feed([server.url('/article1')]))
+        server.add('/article1', article_page('Article 1'))
+        third = run_cycle(database_url, fetcher_folder, {'fetch': {'timeout': 5}}, force=True)
+
+    assert first['feed_cache'] == {'not_modified': 0, 'unchanged': 0, 'changed': 2}
+    assert second['feed_cache'] == {'not_modified': 1, 'unchanged': 1, 'changed': 0}
+    assert third['feed_cache'] == {'not_modified': 1, 'unchanged': 0, 'changed': 1}
+    assert third['new_articles'] == 1
+
+    with get_db_engine(database_url).connect() as connection:
+        hits, misses = connection.execute(
+            text("SELECT SUM(cache_hits), SUM(cache_misses) FROM feed_state")
+        ).one()
+    assert (hits, misses) == (3, 3)
+
+def test_run_cycle_polls_only_due_feeds(fetcher_folder):
+    """Tests that an unforced cycle right after a poll leaves the feeds alone until due."""
+    database_url = f"sqlite:///{fetcher_folder}/data/data.db"
+    with FeedServer() as server:
+        server.add('/feed', rss_feed([]))
+        write_feeds(fetcher_folder, [server.url('/feed')])
+
+        first = run_cycle(database_url, fetcher_folder, {'fetch': {'timeout': 5}})
+        second = run_cycle(database_url, fetcher_folder, {'fetch': {'timeout': 5}})
+
+    assert first['polled'] == 1
+    assert second['polled'] == 0
+    assert 250 < second['next_poll_in'] <= 330
+    assert server.requests['/feed'] == 1
+
+def test_run_cycle_fetch_history(fetcher_folder):
+    """Tests that a cycle records its run and per-feed timing, yield and errors."""
+    database_url = f"sqlite:///{fetcher_folder}/data/data.db"
+    with FeedServer() as server:
+        links = [server.url('/article1'), server.url('/article2')]
+        server.add('/feed', rss_feed(links))
+        server.add('/article1', article_page('Article 1'), delay=0.2)
+        server.add('/article2', article_page('Article 2'))
+        write_feeds(fetcher_folder, [server.url('/feed'), server.url('/missing')])
+
+        run_cycle(database_url, fetcher_folder, {'fetch': {'timeout': 5}}, force=True)
+        server.add('/feed', rss_feed(links + [server.url('/article1?utm_source=bla')]))
+        run_cycle(database_url, fetcher_folder, {'fetch': {'timeout': 5}}, force=True)
+        # nothing due, nothing processed, so no run is recorded
+        run_cycle(database_url, fetcher_folder, {'fetch': {'timeout': 5}})
+
+    history = get_history(get_db_engine(database_url))
+    assert [run['new_articles'] for run in history['runs']] == [0, 2]
+    assert history['runs'][0]['duplicates'] == 3
+    assert history['runs'][1]['feed_errors'] == 1
+    assert history['totals']['runs'] == 2
+
+    slowest, missing = history['feeds']
+    assert slowest['feed_url'] == server.url('/feed')
+    assert slowest['polls'] == 2 and slowest['new_articles'] == 2
+    assert slowest['duplicates'] == 3
+    assert slowest['http_time'] >= 0.2
+    assert slowest['bytes'] > 0
+    assert missing['errors'] == 2
+    assert slowest['time_share'] + missing['time_share'] == pytest.approx(1, abs=0.01)
+
+    with get_db_engine(database_url).connect() as connection:
+        error_classes = connection.execute(text(
+            "SELECT DISTINCT error_class FROM fetch_run_feeds WHERE error_class IS NOT NULL"
+        )).scalars().all()
+    assert error_classes == ['HttpError']
+
+def test_run_cycle_in_worker(fetcher_folder):
+    """Tests a cycle in the collector worker, which has to be able to start the extraction pool."""
+    database_url = f"sqlite:///{fetcher_folder}/data/data.db"
+    worker = CollectorWorker()
+    with FeedServer() as server:
+        links = [server.url(f'/article{i}') for i in range(6)]
+        server.add('/feed', rss_feed(links))
+        for i in range(6):
+            server.add(f'/article{i}', article_page(f'Article {i}', f'Bla bla {i}.'))
+        write_feeds(fetcher_folder, [server.url('/feed')])
+
+        try:
+            summary = worker.run_cycle(
+                'src.views.data_acquisition.collection_cycle:run_cycle',
+                database_url=database_url,
+                fetcher_folder=fetcher_folder,
+                options={'fetch': {'timeout': 5}, 'extraction': {'workers': 2, 'batch_size': 2}},
+                force=True
+            )
+        finally:
+            worker.stop()
+
+    assert summary['new_articles'] == 6
+    assert summary['processed'] == 6
+
+def test_run_cycle_feed_budget_retries_articles(fetcher_folder):
+    """Tests that articles given up for the feed budget are fetched by the next cycle."""
+    database_url = f"sqlite:///{fetcher_folder}/data/data.db"
+    options = {'fetch': {'timeout': 5, 'feed_budget': 0.5}}
+    with FeedServer() as server:
+        server.add('/feed', rss_feed([server.url('/slow')]), headers={'ETag': '"v1"'})
+        server.add('/slow', article_page('Slow'), delay=1)
+        write_feeds(fetcher_folder, [server.url('/feed')])
+
+        first = run_cycle(database_url, fetcher_folder, options, force=True)
+        server.add('/slow', article_page('Slow'))
+        second = run_cycle(database_url, fetcher_folder, options, force=True)
+
+    assert first['article_errors'] == 1
+    assert second['feed_cache']['changed'] == 1
+    assert second['new_articles'] == 1
+
+def test_run_cycle_resource_guard(fetcher_folder):
+    """Tests storing articles without HTML when disk runs short, and pausing when out of it."""
+    database_url = f"sqlite:///{fetcher_folder}/data/data.db"
+    # memory thresholds out of reach, so that only the disk thresholds matter here
+    resources = {'memory_throttle': 2, 'memory_pause': 2, 'min_free_disk_mb': 0}
+    with FeedServer() as server:
+        server.add('/feed', rss_feed([server.url('/article1')]))
+        server.add('/article1', article_page('Article 1', 'Bla bla one.'))
+        write_feeds(fetcher_folder, [server.url('/feed')])
+
+        short = run_cycle(database_url, fetcher_folder, {
+            'fetch': {'timeout': 5},
+            'resources': {**resources, 'html_free_disk_mb': 10 ** 12}
+        }, force=True)
+        paused = run_cycle(database_url, fetcher_folder, {
+            'fetch': {'timeout': 5},
+            'resources': {**resources, 'min_free_disk_mb': 10 ** 12}
+        }, force=True)
+
+    assert short['resources']['level'] == 'skip_html'
+    assert short['new_articles'] == 1 and short['processed'] == 1
+    assert paused['resources']['level'] == 'pause'
+    assert paused['polled'] == 0
+    assert server.requests['/feed'] == 1
+
+    with get_db_engine(database_url).connect() as connection:
+        row = connection.execute(text("SELECT html, full_text FROM articles")).one()
+        states = connection.execute(
+            text("SELECT resource_state FROM fetch_runs ORDER BY id")
+        ).scalars().all()
+    assert row.html is None and row.full_text == 'Bla bla one.'
+    assert states[0].startswith('skip_html: ')
+    assert states[1].startswith('pause: ')
+
+def test_run_cycle_duplicate_pages(fetcher_folder):
+    """Tests that a page served under several URLs is stored and extracted once."""
+    database_url = f"sqlite:///{fetcher_folder}/data/data.db"
+    page = article_page('Article 1', 'Bla bla syndicated.')
+    with FeedServer() as server:
+        for path in ('/article1', '/copy1', '/copy2'):
+            server.add(path, page)
+        server.add('/feed', rss_feed([server.url('/article1'), server.url('/copy1')]))
+        write_feeds(fetcher_folder, [server.url('/feed')])
+        first = run_cycle(database_url, fetcher_folder, {'fetch': {'timeout': 5}}, force=True)
+
+        server.add('/feed', rss_feed([server.url('/copy2')]))
+        second = run_cycle(database_url, fetcher_folder, {'fetch': {'timeout': 5}}, force=True)
+
+    assert first['new_articles'] == 2 and first['processed'] == 1
+    assert first['duplicate_bodies'] == 1
+    assert second['new_articles'] == 1 and second['processed'] == 0
+    assert second['duplicate_bodies'] == 1
+
+    with get_db_engine(database_url).connect() as connection:
+        texts = connection.execute(text("SELECT full_text FROM articles")).scalars().all()
+        refs = connection.execute(text("SELECT refs FROM article_bodies")).scalars().all()
+    assert texts == ['Bla bla syndicated.'] * 3
+    assert refs == [3]
+
+def test_run_cycle_feed_registry(fetcher_folder):
+    """
+    Tests that feeds.txt is imported once, that disabled feeds aren't polled,
+    and that polled feeds get their health recorded.
+    """
+    database_url = f"sqlite:///{fetcher_folder}/data/data.db"
+    with FeedServer() as server:
+        server.add('/feed', rss_feed([]))
+        write_feeds(fetcher_folder, [server.url('/feed'), server.url('/missing')])
+        first = run_cycle(database_url, fetcher_folder, {'fetch': {'timeout': 5}}, force=True)
+
+        write_feeds(fetcher_folder, [])
+        with get_db_engine(database_url).connect() as connection:
+            missing = [feed for feed in list_feeds(connection) if feed['url'].endswith('missing')]
+            update_feed(connection, missing[0]['id'], {'enabled': False})
+            connection.commit()
+        second = run_cycle(database_url, fetcher_folder, {'fetch': {'timeout': 5}}, force=True)
+
+    assert first['feeds'] == 2 and first['polled'] == 2
+    assert second['feeds'] == 1 and second['polled'] == 1
+    assert server.requests['/missing'] == 1
+
+    with get_db_engine(database_url).connect() as connection:
+        feeds = {feed['url']: feed for feed in list_feeds(connection)}
+    assert feeds[server.url('/feed')]['last_status'] == 'unchanged'
+    assert feeds[server.url('/feed')]['failures'] == 0
+    assert feeds[server.url('/missing')]['last_status'] == 'HttpError'
+    assert feeds[server.url('/missing')]['failures'] == 1
+
+def test_run_cycle_disables_failing_feeds(fetcher_folder):
+    """
+    Tests that a feed failing disable_after polls in a row is disabled, and that
+    probing re-enables it once it works again.
+    """
+    database_url = f"sqlite:///{fetcher_folder}/data/data.db"
+    options = {'fetch': {'timeout': 5}, 'schedule': {'disable_after': 2}}
+    with FeedServer() as server:
+        server.add('/feed', rss_feed([]))
+        write_feeds(fetcher_folder, [server.url('/feed'), server.url('/missing')])
+        first = run_cycle(database_url, fetcher_folder, options, force=True)
+        second = run_cycle(database_url, fetcher_folder, options, force=True)
+        third = run_cycle(database_url, fetcher_folder, options, force=True)
+
+        server.add('/missing', rss_feed([]))
+        with get_db_engine(database_url).connect() as connection:
+            probed = probe_disabled_feeds(connection, budget=5, disable_after=2, timeout=5)
+            feeds = {feed['url']: feed for feed in list_feeds(connection)}
+
+    assert first['disabled_feeds'] == []
+    assert second['disabled_feeds'] == [server.url('/missing')]
+    assert third['polled'] == 1
+    assert list(probed) == [server.url('/missing')] and probed[server.url('/missing')]['ok']
+    assert feeds[server.url('/missing')]['enabled']
+    assert feeds[server.url('/missing')]['failures'] == 0
+    assert feeds[server.url('/missing')]['last_status'] == 'valid'
+
+def test_run_cycle_sharded_processes(fetcher_folder):
+    """
+    Tests collector instances in separate processes splitting the feeds through
+    leases, each feed polled once and all the articles merged into one store.
+    """
+    database_url = f"sqlite:///{fetcher_folder}/data/data.db"
+    with FeedServer() as server:
+        feed_urls = []
+        for i in range(6):
+            server.add(f'/feed{i}', rss_feed([server.url(f'/article{i}')]))
+            server.add(f'/article{i}', article_page(f'Article {i}', f'Bla bla {i}.'))
+            feed_urls.append(server.url(f'/feed{i}'))
+        write_feeds(fetcher_folder, feed_urls)
+        # the registry is set up before the instances start
+        run_cycle(database_url, fetcher_folder, {'fetch': {'timeout': 5}})
+
+        def options(instance):
+            return {'fetch': {'timeout': 5}, 'shard': {'instance': instance, 'lease_seconds': 60}}
+        with multiprocessing.get_context('spawn').Pool(3) as pool:
+            summaries = pool.starmap(run_cycle, [
+                (database_url, fetcher_folder, options(f'collector-{i}'), True) for i in range(3)
+            ])
+
+    assert sum(summary['polled'] for summary in summaries) == 6
+    assert all(server.requests[f'/feed{i}'] == 2 for i in range(6))
+    assert all(server.requests[f'/article{i}'] == 1 for i in range(6))
+    with get_db_engine(database_url).connect() as connection:
+        assert connection.execute(text("SELECT COUNT(*) FROM articles")).scalar() == 6
+        assert connection.execute(text("SELECT COUNT(*) FROM feed_leases")).scalar() == 6
+
+def test_run_cycle_article_revisions(fetcher_folder):
+    """
+    Tests that a known article listed with a new date is checked again, skipping
+    extraction when it's unchanged and storing a revision when it changed. The hourly
+    limit on checks is lifted.
+    """
+    database_url = f"sqlite:///{fetcher_folder}/data/data.db"
+    options = {'fetch': {'timeout': 5}}
+    link = None
+
+    def publish(server, date):
+        server.add('/feed', rss_feed([link], dates=[f"Mon, 06 Jun 2016 {date} GMT"]))
+
+    with FeedServer() as server, patch(
+            'src.views.data_acquisition.article_revisions.RECHECK_AFTER', 0):
+        link = server.url('/article')
+        publish(server, '09:00:00')
+        server.add('/article', article_page('Article', 'Bla bla.'), headers={'ETag': '"v1"'})
+        write_feeds(fetcher_folder, [server.url('/feed')])
+        first = run_cycle(database_url, fetcher_folder, options, force=True)
+
+        # the same page answers the conditional GET with a 304
+        publish(server, '10:00:00')
+        second = run_cycle(database_url, fetcher_folder, options, force=True)
+        # the same HTML under a new validator
+        publish(server, '11:00:00')
+        server.add('/article', article_page('Article', 'Bla bla.'), headers={'ETag': '"v2"'})
+        third = run_cycle(database_url, fetcher_folder, options, force=True)
+        # an edited article
+        publish(server, '12:00:00')
+        server.add('/article', article_page('Article', 'Bla bla, corrected.'),
+                   headers={'ETag': '"v3"'})
+        fourth = run_cycle(database_url, fetcher_folder, options, force=True)
+        # a feed listing the article the same way doesn't get it checked
+        server.add('/feed', rss_feed([link], title="Bla bla feed, new title",
+                                     dates=["Mon, 06 Jun 2016 12:00:00 GMT"]))
+        fifth = run_cycle(database_url, fetcher_folder, options, force=True)
+
+    assert first['new_articles'] == 1
+    assert second['page_checks']['not_modified'] == 1 and second['new_articles'] == 0
+    assert third['page_checks']['unchanged'] == 1 and third['processed'] == 0
+    assert fourth['page_checks']['revised'] == 1
+    assert not any(fifth['page_checks'].values())
+    assert server.requests['/article'] == 4
+
+    with get_db_engine(database_url).connect() as connection:
+        assert connection.execute(text("SELECT COUNT(*) FROM articles")).scalar() == 1
+        article_id = connection.execute(text("SELECT id FROM articles")).scalar()
+        revisions = get_revisions(connection, article_id)
+    assert [revision['revision'] for revision in revisions] == [1, 2]
+    assert 'Bla bla.' in revisions[0]['full_text'] and not revisions[0]['current']
+    assert 'corrected' in revisions[1]['full_text'] and revisions[1]['current']
+    diff = revision_diff(*revisions)
+    assert '-Bla bla.' in diff and '+Bla bla, corrected.' in diff
+
+def test_select_rechecks_at_most_hourly():
+    """
+    Tests that a known article listed with a new date or under another feed is checked
+    again only once RECHECK_AFTER has passed since its last check.
+    """
+    engine = create_engine('sqlite://')
+    with engine.connect() as connection:
+        ensure_articles_table(connection)
+        ensure_collection_tables(connection)
+        article_id = connection.execute(
+            text("INSERT INTO articles (url, url_key) VALUES (:url, :url_key)"),
+            {'url': 'https://blabla.com/a', 'url_key': url_key('https://blabla.com/a')}
+        ).lastrowid
+        entry = FeedEntry('https://blabla.com/a', 'https://blabla.com/feed',
+                          published=datetime(2016, 6, 6, 9))
+        save_source(connection, article_id, entry, now=1000)
+
+        redated = FeedEntry(entry.link, entry.feed_url, published=datetime(2016, 6, 6, 10))
+        moved = FeedEntry(entry.link, 'https://blabla.com/other', published=entry.published)
+        for listed in (redated, moved):
+            assert not select_rechecks(connection, [listed], now=1000 + RECHECK_AFTER - 1)
+            rechecks = select_rechecks(connection, [listed], now=1000 + RECHECK_AFTER + 1)
+            assert [recheck.article_id for recheck in rechecks] == [article_id]
+        assert not select_rechecks(connection, [entry], now=1000 + RECHECK_AFTER + 1)
@@ -1,9 +1,19 @@
 """
 Tests content_fetcher.py route responses and functions.
 """
+import time
 import unittest.mock
+from sqlalchemy import create_engine, text
 
-from src.views.data_acquisition.content_fetcher import run_collect_and_process, run_subprocess
+from src.utils.collector_worker import CycleInterrupted
+from src.utils.cycle_progress import CycleProgress
+from src.utils.db_coordination import Lease
+from src.utils.db_schema import ensure_articles_table, ensure_collection_tables
+from src.views.data_acquisition.content_fetcher import (
+    has_cycle_work, log_cycle_summary, run_collect_and_process
+)
+
+LEASE = Lease(1, 'write', 'collection cycle')
 
 def test_start_fetch(client):
     """Tests /api/start when not yet fetching."""
@@ -44,6 +54,7 @@ def test_fetch_status(client):
     response = client.get('/api/status')
     assert response.status_code == 200
     assert response.json['status'] == "running"
+    assert 'hit_rate' in response.json['feed_cache']
 
     response = client.post('/api/stop')
     assert response.status_code == 200
@@ -54,92 +65,224 @@ def test_fetch_status(client):
 def test_run_collect_and_process_success(app):
     """Tests run_collect_and_process() succeeding."""
     with app.app_context():
-        with unittest.mock.patch(
-                'src.utils.processing_status.ProcessingStatus.get_status',
-                return_value=False
+        with unittest.mock.patch.object(
+                app.db_coordinator, 'acquire_write', return_value=LEASE
             ), \
+             unittest.mock.patch.object(
+                app.db_coordinator, 'release'
+            ), \
+             unittest.mock.patch(
+                'src.views.data_acquisition.content_fetcher.collector_worker.run_cycle'
+            ) as mock_run_cycle, \
+             unittest.mock.patch(
+                'src.views.data_acquisition.content_fetcher.log_cycle_summary'
+            ) as mock_log_summary, \
              unittest.mock.patch(
-                'src.utils.processing_status.ProcessingStatus.set_status'
+                'src.views.data_acquisition.content_fetcher.count_enabled_feeds',
+                return_value=1
             ), \
              unittest.mock.patch(
-                'src.views.data_acquisition.content_fetcher.run_subprocess'
-            ) as mock_run_subprocess, \
-             unittest.mock.patch('os.path.exists', return_value=True):
+                'src.views.data_acquisition.content_fetcher.has_cycle_work',
+                return_value=True
+            ):
 
             run_collect_and_process()
 
-            assert mock_run_subprocess.call_count == 2
-            mock_run_subprocess.assert_any_call('collect.py')
-            mock_run_subprocess.assert_any_call('process.py')
+            mock_run_cycle.assert_called_once()
+            assert mock_run_cycle.call_args[0][0] == (
+                'src.views.data_acquisition.collection_cycle:run_cycle'
+            )
+            assert mock_run_cycle.call_args[1]['options']['fetch']['max_workers'] > 0
+            mock_log_summary.assert_called_once_with(mock_run_cycle.return_value)
 
 def test_run_collect_and_process_already_active(app):
     """Tests run_collect_and_process() called when already running."""
     with app.app_context():
-        with unittest.mock.patch(
-                'src.utils.processing_status.ProcessingStatus.get_status',
-                return_value=True
+        with unittest.mock.patch.object(
+                app.db_coordinator, 'acquire_write', return_value=None
             ), \
+             unittest.mock.patch.object(
+                app.db_coordinator, 'release'
+            ) as mock_release, \
              unittest.mock.patch(
-                'src.utils.processing_status.ProcessingStatus.set_status'
-            ) as mock_set_status, \
+                'src.views.data_acquisition.content_fetcher.collector_worker.run_cycle'
+            ) as mock_run_cycle, \
              unittest.mock.patch(
-                'src.views.data_acquisition.content_fetcher.run_subprocess'
-            ) as mock_run_subprocess:
+                'src.views.data_acquisition.content_fetcher.count_enabled_feeds',
+                return_value=1
+            ), \
+             unittest.mock.patch(
+                'src.views.data_acquisition.content_fetcher.has_cycle_work',
+                return_value=True
+            ):
 
             run_collect_and_process()
 
-            assert not mock_run_subprocess.called
-            mock_set_status.assert_not_called()
+            assert not mock_run_cycle.called
+            mock_release.assert_not_called()
 
 def test_run_collect_and_process_no_feeds(app):
-    """Tests run_collect_and_process() not finding feeds.txt."""
+    """Tests run_collect_and_process() not finding any enabled feeds."""
     with app.app_context():
-        with unittest.mock.patch(
-                'src.utils.processing_status.ProcessingStatus.get_status',
-                return_value=False
-            ), \
+        with unittest.mock.patch.object(
+                app.db_coordinator, 'acquire_write', return_value=LEASE
+            ) as mock_acquire, \
              unittest.mock.patch(
-                'src.utils.processing_status.ProcessingStatus.set_status'
-            ) as mock_set_status, \
+                'src.views.data_acquisition.content_fetcher.collector_worker.run_cycle'
+            ) as mock_run_cycle, \
              unittest.mock.patch(
-                'src.views.data_acquisition.content_fetcher.run_subprocess'
-            ) as mock_run_subprocess, \
-             unittest.mock.patch('os.path.exists', return_value=False):
+                'src.views.data_acquisition.content_fetcher.count_enabled_feeds',
+                return_value=0
+            ):
 
             run_collect_and_process()
 
-            assert not mock_run_subprocess.called
-            mock_set_status.assert_not_called()
+            assert not mock_run_cycle.called
+            mock_acquire.assert_not_called()
+
+def test_run_collect_and_process_nothing_due(app):
+    """Tests that a tick with nothing to do doesn't take the write lease."""
+    with app.app_context():
+        with unittest.mock.patch.object(
+                app.db_coordinator, 'acquire_write', return_value=LEASE
+            ) as mock_acquire, \
+             unittest.mock.patch(
+                'src.views.data_acquisition.content_fetcher.collector_worker.run_cycle'
+            ) as mock_run_cycle, \
+             unittest.mock.patch(
+                'src.views.data_acquisition.content_fetcher.count_enabled_feeds',
+                return_value=1
+            ), \
+             unittest.mock.patch(
+                'src.views.data_acquisition.content_fetcher.has_cycle_work',
+                return_value=False
+            ):
+
+            run_collect_and_process()
+
+            assert not mock_run_cycle.called
+            mock_acquire.assert_not_called()
+
+def test_has_cycle_work(tmp_path):
+    """Tests finding due feeds and articles left to extract or move."""
+    engine = create_engine(f"sqlite:///{tmp_path}/data.db")
+    with engine.connect() as connection:
+        ensure_articles_table(connection)
+        ensure_collection_tables(connection)
+        connection.execute(text(
+            "INSERT INTO feeds (url, added_at) VALUES ('https://blabla.com/feed', '')"
+        ))
+        # a new feed is due right away
+        assert has_cycle_work(connection)
+        connection.execute(text(
+            "INSERT INTO feed_schedule (feed_url, interval, next_poll_at) "
+            "VALUES ('https://blabla.com/feed', 3600, :later)"
+        ), {'later': time.time() + 3600})
+        assert not has_cycle_work(connection)
+
+        connection.execute(text(
+            "INSERT INTO articles (url, html) VALUES ('https://blabla.com/a', '<p>Bla</p>')"
+        ))
+        assert has_cycle_work(connection)
+        # extracted, but its HTML isn't moved to the body store yet
+        connection.execute(text("UPDATE articles SET full_text = 'Bla'"))
+        assert has_cycle_work(connection)
+        connection.execute(text("UPDATE articles SET html = NULL"))
+        assert not has_cycle_work(connection)
+    engine.dispose()
 
 def test_run_collect_and_process_error(app):
     """Tests error during run_collect_and_process()."""
     with app.app_context():
-        with unittest.mock.patch(
-                'src.utils.processing_status.ProcessingStatus.get_status',
-                return_value=False
+        with unittest.mock.patch.object(
+                app.db_coordinator, 'acquire_write', return_value=LEASE
             ), \
+             unittest.mock.patch.object(
+                app.db_coordinator, 'release'
+            ) as mock_release, \
              unittest.mock.patch(
-                'src.utils.processing_status.ProcessingStatus.set_status'
-            ) as mock_set_status, \
-             unittest.mock.patch(
-                'src.views.data_acquisition.content_fetcher.run_subprocess',
+                'src.views.data_acquisition.content_fetcher.collector_worker.run_cycle',
                 side_effect=Exception("Test error")
             ), \
-             unittest.mock.patch('os.path.exists', return_value=True):
+             unittest.mock.patch(
+                'src.views.data_acquisition.content_fetcher.count_enabled_feeds',
+                return_value=1
+            ), \
+             unittest.mock.patch(
+                'src.views.data_acquisition.content_fetcher.has_cycle_work',
+                return_value=True
+            ):
 
             run_collect_and_process()
 
-            assert mock_set_status.call_count == 2
-            mock_set_status.assert_any_call(True)
-            mock_set_status.assert_any_call(False)
+            mock_release.assert_called_once_with(LEASE)
 
-def test_run_subprocess(app):
-    """Tests run_process()."""
+def test_run_collect_and_process_interrupted(app):
+    """Tests a cycle cancelled or killed by the watchdog releasing the write lease."""
     with app.app_context():
-        with unittest.mock.patch('subprocess.run') as mock_subprocess:
-            mock_subprocess.return_value.stdout = "Test output"
-            mock_subprocess.return_value.stderr = "Test error"
+        with unittest.mock.patch.object(
+                app.db_coordinator, 'acquire_write', return_value=LEASE
+            ), \
+             unittest.mock.patch.object(
+                app.db_coordinator, 'release'
+            ) as mock_release, \
+             unittest.mock.patch(
+                'src.views.data_acquisition.content_fetcher.collector_worker.run_cycle',
+                side_effect=CycleInterrupted("Cycle exceeded its time limit")
+            ) as mock_run_cycle, \
+             unittest.mock.patch(
+                'src.views.data_acquisition.content_fetcher.count_enabled_feeds',
+                return_value=1
+            ), \
+             unittest.mock.patch(
+                'src.views.data_acquisition.content_fetcher.has_cycle_work',
+                return_value=True
+            ):
+
+            run_collect_and_process()
 
-            run_subprocess('test_script.py')
+            assert mock_run_cycle.call_args[1]['time_limit'] > 0
+            mock_release.assert_called_once_with(LEASE)
+            assert CycleProgress.get_summary()['status'] == 'interrupted'
 
-            mock_subprocess.assert_called_once()
+def test_log_cycle_summary(app):
+    """Tests log_cycle_summary() logging counts and feed errors."""
+    with app.app_context():
+        with unittest.mock.patch(
+            'src.views.data_acquisition.content_fetcher.scheduler.app.logger'
+        ) as mock_logger:
+            log_cycle_summary({
+                'feeds': 2,
+                'polled': 2,
+                'feed_errors': ["https://blabla.com/feed: HttpError: HTTP 404"],
+                'disabled_feeds': ["https://blabla.com/feed"],
+                'entries': 5,
+                'known_skipped': 1,
+                'new_articles': 3,
+                'article_errors': 1,
+                'processed': 3,
+                'extract_failed': 0,
+                'pipelined': 2,
+                'watermark_from': 10,
+                'watermark': 13,
+                'duplicate_bodies': 0,
+                'html_moved': 0,
+                'page_checks': {'not_modified': 0, 'unchanged': 0, 'revised': 0, 'failed': 0},
+                'feed_cache': {'not_modified': 1, 'unchanged': 0, 'changed': 0},
+                'collect_duration': 0.4,
+                'duration': 0.5,
+                'budget_exceeded': True,
+                'shard': None,
+                'resources': {'level': 'skip_html', 'reasons': ["800 MB free on the data volume"]}
+            })
+
+            assert mock_logger.info.call_count == 3
+            assert mock_logger.warning.call_count == 3
+            mock_logger.error.assert_called_once()
+            assert "HTTP 404" in mock_logger.error.call_args[0][1]
+
+def test_get_fetch_history(client):
+    """Tests /api/fetch_history before any cycle has been recorded."""
+    response = client.get('/api/fetch_history?runs=5')
+    assert response.status_code == 200
+    assert response.json == {'runs': [], 'totals': None, 'feeds': []}
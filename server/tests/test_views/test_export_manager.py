@@ -1,6 +1,7 @@
 """
 Tests export_manager.py route responses and functions.
 """
+import json
 from unittest.mock import patch
 from sqlalchemy.exc import SQLAlchemyError
 import pytest
@@ -90,7 +91,7 @@ def test_exporting_no_format(client):
 
 @pytest.mark.usefixtures("setup_and_teardown")
 def test_get_query_export_json(client):
-    """Test json query export without last searched ids."""
+    """Test json query export without a search result handle."""
     response = client.get('/api/articles/export_query?format=json')
     assert response.status_code == 200
     assert response.content_type == 'application/json'
@@ -98,7 +99,7 @@ def test_get_query_export_json(client):
 
 @pytest.mark.usefixtures("setup_and_teardown")
 def test_get_query_export_csv(client):
-    """Test csv query export without last searched ids."""
+    """Test csv query export without a search result handle."""
     response = client.get('/api/articles/export_query?format=csv')
     assert response.status_code == 200
     assert response.content_type == 'text/csv'
@@ -106,7 +107,7 @@ def test_get_query_export_csv(client):
 
 @pytest.mark.usefixtures("setup_and_teardown")
 def test_get_query_export_parquet(client):
-    """Test parquet query export without last searched ids."""
+    """Test parquet query export without a search result handle."""
     response = client.get('/api/articles/export_query?format=parquet')
     assert response.status_code == 200
     assert response.content_type == 'application/octet-stream'
@@ -114,3 +115,20 @@ def test_get_query_export_parquet(client):
         'attachment; filename="articles_query.parquet"'
     )
     assert 'Content-Length' in response.headers
+
+def test_get_query_export_result_set(client, committed_articles):
+    """Tests that a query export has the articles of the search result set of the handle."""
+    search = client.get('/api/articles/search', query_string={'urlQuery': 'paged2'}).json
+    response = client.get(
+        '/api/articles/export_query', query_string={'format': 'json', 'result': search['result']}
+    )
+    assert response.status_code == 200
+    exported = json.loads(response.get_data(as_text=True))
+    assert sorted(article['url'] for article in exported) == sorted(
+        url for url in committed_articles if 'paged2' in url
+    )
+    expired = client.get('/api/articles/export_query', query_string={
+        'format': 'json', 'result': 'bla'
+    })
+    assert expired.status_code == 404
+    assert expired.json['message'] == "Search results expired, please search again"
@@ -0,0 +1,56 @@
+"""
+Tests feed_leases.py claiming and rebalancing feeds between collector instances.
+"""
+# pylint: disable=redefined-outer-name
+import pytest
+from sqlalchemy import create_engine
+
+from src.utils.db_schema import ensure_collection_tables
+from src.views.data_acquisition.feed_leases import ShardSettings, claim_feeds, release_feeds
+
+FEEDS = [f"https://www.blabla{i}.com/feed/" for i in range(5)]
+
+@pytest.fixture
+def connection(tmp_path):
+    """Connection to a new database file with the collection tables."""
+    engine = create_engine(f"sqlite:///{tmp_path}/data.db")
+    with engine.connect() as conn:
+        ensure_collection_tables(conn)
+        conn.commit()
+        yield conn
+
+def test_claim_and_rebalance(connection):
+    """Tests that a new instance gets its share as the first one gives up its excess."""
+    first = ShardSettings('collector-a', lease_seconds=60)
+    second = ShardSettings('collector-b', lease_seconds=60)
+
+    shard = claim_feeds(connection, FEEDS, first, now=1000)
+    assert shard.feed_urls == FEEDS and shard.leader
+    # every feed is leased until collector-a gives some up
+    assert claim_feeds(connection, FEEDS, second, now=1010).feed_urls == []
+
+    shard = claim_feeds(connection, FEEDS, first, now=1020)
+    assert shard.feed_urls == FEEDS[:3]
+    assert shard.as_dict() == {
+        'instance': 'collector-a', 'instances': 2, 'claimed': 3, 'leader': True
+    }
+    shard = claim_feeds(connection, FEEDS, second, now=1030)
+    assert shard.feed_urls == FEEDS[3:] and not shard.leader
+
+    # removed feeds lose their leases, and the rest stay where they are
+    assert claim_feeds(connection, FEEDS[1:], first, now=1040).feed_urls == FEEDS[1:3]
+
+def test_dead_instance(connection):
+    """Tests that the feeds of an instance that stops renewing are taken over."""
+    first = ShardSettings('collector-a', lease_seconds=60)
+    second = ShardSettings('collector-b', lease_seconds=60)
+    claim_feeds(connection, FEEDS, first, now=1000)
+    claim_feeds(connection, FEEDS, second, now=1000)
+    claim_feeds(connection, FEEDS, first, now=1000)
+
+    # collector-a died after its last cycle
+    shard = claim_feeds(connection, FEEDS, second, now=1100)
+    assert shard.feed_urls == FEEDS and shard.instances == ['collector-b']
+
+    release_feeds(connection, 'collector-b')
+    assert claim_feeds(connection, FEEDS, first, now=1110).feed_urls == FEEDS
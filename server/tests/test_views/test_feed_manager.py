@@ -1,10 +1,17 @@
 """
 Tests feed_manager.py route responses and functions.
 """
+import os
+from unittest.mock import patch
 import pytest
 
+from tests.feed_server import FeedServer, rss_feed
+from src import config
+from src.app import create_app
+from src.views.data_acquisition.content_fetcher import run_feed_probe
+
 def test_get_feed_urls(client):
-    """Tests getting feed urls, which returns empty list if there is no feeds.txt."""
+    """Tests getting feed urls, which returns empty list if there are no feeds."""
     response = client.get('/api/get_feed_urls')
     assert response.status_code == 200
     assert isinstance(response.json, list)
@@ -12,7 +19,7 @@ def test_get_feed_urls(client):
 @pytest.mark.usefixtures("setup_and_teardown")
 def test_set_feed_urls(client):
     """
-    Tests setting and getting specific feed urls from feeds.txt.
+    Tests setting and getting specific feed urls of the feed registry.
     Note that it uses the setup fixture.
     """
     response = client.post(
@@ -30,3 +37,179 @@ def test_set_feed_urls_invalid_data(client):
     """Tests invalid data entry for setting feed urls."""
     response = client.post('/api/set_feed_urls', data="invalid data")
     assert response.status_code == 415
+
+@pytest.mark.usefixtures("setup_and_teardown")
+def test_feed_registry_routes(client):
+    """Tests adding, listing, changing and removing single feeds."""
+    client.post('/api/set_feed_urls', json={"feedUrls": []})
+    response = client.post('/api/feeds', json={"urls": [
+        "https://www.blabla.com/feed/", "https://www.blabla.fi/feed/", "https://www.blabla.com/feed/"
+    ]})
+    assert response.status_code == 201
+    assert response.json['added'] == 2
+
+    feeds = client.get('/api/feeds').json['feeds']
+    assert [feed['url'] for feed in feeds] == [
+        "https://www.blabla.com/feed/", "https://www.blabla.fi/feed/"
+    ]
+    assert feeds[0]['enabled'] and feeds[0]['settings'] == {} and feeds[0]['failures'] == 0
+
+    response = client.patch(f"/api/feeds/{feeds[0]['id']}", json={
+        "enabled": False, "settings": {"min_interval": 600}
+    })
+    assert response.status_code == 200
+    assert not response.json['enabled']
+    assert response.json['settings'] == {"min_interval": 600}
+    assert client.get('/api/get_feed_urls').json == ["https://www.blabla.fi/feed/"]
+
+    response = client.patch(f"/api/feeds/{feeds[0]['id']}", json={"settings": {"bla": 1}})
+    assert response.status_code == 400
+    response = client.patch(f"/api/feeds/{feeds[0]['id']}", json={"url": feeds[1]['url']})
+    assert response.status_code == 409
+
+    assert client.delete(f"/api/feeds/{feeds[1]['id']}").status_code == 200
+    assert client.delete(f"/api/feeds/{feeds[1]['id']}").status_code == 404
+    assert client.patch(f"/api/feeds/{feeds[1]['id']}", json={}).status_code == 404
+    assert len(client.get('/api/feeds').json['feeds']) == 1
+
+@pytest.mark.usefixtures("setup_and_teardown")
+def test_set_feed_urls_keeps_disabled_feeds(client):
+    """
+    Tests that saving the list of enabled feeds, as the dashboard does, keeps the
+    disabled feeds with their settings and removes only the enabled ones left out.
+    """
+    client.post('/api/set_feed_urls', json={"feedUrls": [
+        "https://www.blabla.com/feed/", "https://www.blabla.fi/feed/", "https://www.blabla.se/feed/"
+    ]})
+    feeds = client.get('/api/feeds').json['feeds']
+    client.patch(f"/api/feeds/{feeds[1]['id']}", json={
+        "enabled": False, "settings": {"min_interval": 600}
+    })
+    listed = client.get('/api/get_feed_urls').json
+    assert listed == ["https://www.blabla.com/feed/", "https://www.blabla.se/feed/"]
+
+    response = client.post('/api/set_feed_urls', json={"feedUrls": listed[:1]})
+    assert response.status_code == 200
+    feeds = client.get('/api/feeds').json['feeds']
+    assert [(feed['url'], feed['enabled']) for feed in feeds] == [
+        ("https://www.blabla.com/feed/", True), ("https://www.blabla.fi/feed/", False)
+    ]
+    assert feeds[1]['settings'] == {"min_interval": 600}
+
+@pytest.mark.usefixtures("setup_and_teardown")
+def test_feed_file_import_and_export(client, app_config):
+    """Tests importing feeds.txt into the registry and exporting the enabled feeds."""
+    client.post('/api/set_feed_urls', json={"feedUrls": ["https://www.blabla.com/feed/"]})
+    feed_file = os.path.join(app_config['FETCHER_FOLDER'], 'data', 'feeds.txt')
+    with open(feed_file, 'w', encoding='utf-8') as f:
+        f.write("https://www.blabla.fi/feed/\n\nhttps://www.blabla.se/feed/\n")
+
+    response = client.post('/api/feeds/import')
+    assert response.json['imported'] == 2 and response.json['feeds'] == 3
+    response = client.post('/api/feeds/import', query_string={'replace': 'true'})
+    assert response.json['feeds'] == 2
+
+    response = client.get('/api/feeds/export')
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == (
+        "https://www.blabla.fi/feed/\nhttps://www.blabla.se/feed/"
+    )
+    with open(feed_file, encoding='utf-8') as f:
+        assert f.read() == response.get_data(as_text=True)
+
+@pytest.mark.usefixtures("setup_and_teardown")
+def test_validate_feeds_route(client):
+    """Tests rejecting malformed URLs on save and validating and adding feeds."""
+    client.post('/api/set_feed_urls', json={"feedUrls": []})
+    response = client.post('/api/feeds', json={"urls": ["ttps://www.blabla.com/feed/"]})
+    assert response.status_code == 400
+    assert "ttps://www.blabla.com/feed/" in response.json['invalid']
+    response = client.post('/api/set_feed_urls', json={"feedUrls": ["blabla"]})
+    assert response.status_code == 400
+
+    with FeedServer() as server:
+        server.add('/feed', rss_feed([]))
+        opml = (
+            f'<opml version="2.0"><body><outline xmlUrl="{server.url("/feed")}"/>'
+            f'<outline xmlUrl="{server.url("/missing")}"/></body></opml>'
+        )
+        response = client.post('/api/feeds/validate', json={"opml": opml, "add": True})
+        assert response.status_code == 200
+        assert response.json['valid'] == 1 and response.json['invalid'] == 1
+        assert response.json['added'] == 1
+
+        response = client.post('/api/feeds', json={
+            "urls": [server.url('/feed'), server.url('/missing')], "validate": True
+        })
+        assert response.status_code == 201
+        assert response.json['added'] == 0
+        assert list(response.json['failed']) == [server.url('/missing')]
+
+    feeds = client.get('/api/feeds').json['feeds']
+    assert [feed['url'] for feed in feeds] == [server.url('/feed')]
+    assert feeds[0]['last_status'] == 'valid'
+    assert client.post('/api/feeds/validate', json={"opml": "<opml>"}).status_code == 400
+
+@pytest.mark.usefixtures("setup_and_teardown")
+def test_disabled_feed_probed_back_after_saving_list(client, app_config):
+    """
+    Tests that a feed disabled for failing survives saving the feed list from the
+    dashboard and that the probe enables it again once it works.
+    """
+    with FeedServer() as server, patch.dict(app_config, {'FEED_DISABLE_AFTER': 2}):
+        server.add('/feed', rss_feed([]))
+        urls = [server.url('/feed'), server.url('/missing')]
+        client.post('/api/set_feed_urls', json={"feedUrls": urls})
+        for _ in range(2):
+            client.post('/api/feeds/validate', json={"urls": [server.url('/missing')]})
+        listed = client.get('/api/get_feed_urls').json
+        assert listed == [server.url('/feed')]
+
+        assert client.post('/api/set_feed_urls', json={"feedUrls": listed}).status_code == 200
+        feeds = {feed['url']: feed for feed in client.get('/api/feeds').json['feeds']}
+        assert feeds[server.url('/missing')]['auto_disabled']
+
+        server.add('/missing', rss_feed([]))
+        run_feed_probe()
+
+    assert client.get('/api/get_feed_urls').json == urls
+    feeds = {feed['url']: feed for feed in client.get('/api/feeds').json['feeds']}
+    assert not feeds[server.url('/missing')]['auto_disabled']
+    assert feeds[server.url('/missing')]['failures'] == 0
+
+@pytest.mark.usefixtures("setup_and_teardown")
+def test_disabled_feed_listed_again_is_enabled(client, app_config):
+    """
+    Tests that a feed disabled for failing and listed again from the dashboard is
+    enabled with a clean health.
+    """
+    with FeedServer() as server, patch.dict(app_config, {'FEED_DISABLE_AFTER': 2}):
+        server.add('/feed', rss_feed([]))
+        urls = [server.url('/feed'), server.url('/missing')]
+        client.post('/api/set_feed_urls', json={"feedUrls": urls})
+        for _ in range(2):
+            client.post('/api/feeds/validate', json={"urls": urls})
+        assert client.get('/api/get_feed_urls').json == [server.url('/feed')]
+
+        assert client.post('/api/set_feed_urls', json={"feedUrls": urls}).status_code == 200
+
+    assert client.get('/api/get_feed_urls').json == urls
+    feeds = {feed['url']: feed for feed in client.get('/api/feeds').json['feeds']}
+    assert feeds[server.url('/missing')]['enabled']
+    assert not feeds[server.url('/missing')]['auto_disabled']
+    assert feeds[server.url('/missing')]['failures'] == 0
+
+def test_feed_registry_set_up_at_start(tmp_path):
+    """Tests that the app imports feeds.txt at start and that the routes don't set it up."""
+    os.makedirs(tmp_path / 'data')
+    with open(tmp_path / 'data' / 'feeds.txt', 'w', encoding='utf-8') as f:
+        f.write("https://www.blabla.fi/feed/\n")
+    with patch.object(config.TestConfig, 'DATABASE_URL', f"sqlite:///{tmp_path}/data.db"), \
+         patch.object(config.TestConfig, 'FETCHER_FOLDER', str(tmp_path)):
+        app = create_app(testing=True)
+
+    with patch('src.views.data_acquisition.feed_registry.ensure_feed_registry') as mock_ensure:
+        response = app.test_client().get('/api/get_feed_urls')
+    assert response.json == ["https://www.blabla.fi/feed/"]
+    mock_ensure.assert_not_called()
+    app.db_engine.dispose()
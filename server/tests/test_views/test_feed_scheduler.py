@@ -0,0 +1,90 @@
+"""
+Tests feed_scheduler.py interval adaptation, backoff and persistence.
+"""
+from sqlalchemy import create_engine
+
+from src.utils.db_schema import ensure_collection_tables
+from src.views.data_acquisition.feed_scheduler import FeedScheduler, ScheduleSettings
+
+SETTINGS = ScheduleSettings(
+    min_interval=60, max_interval=3600, default_interval=300, jitter=0.0
+)
+
+def load_scheduler(feed_urls):
+    """Loads a scheduler for the feeds from an empty database."""
+    engine = create_engine('sqlite:///:memory:')
+    with engine.connect() as connection:
+        ensure_collection_tables(connection)
+        return FeedScheduler.load(connection, feed_urls, SETTINGS)
+
+def test_pop_due_in_poll_order():
+    """Tests that new feeds are due immediately and that the queue pops by due time."""
+    scheduler = load_scheduler(['feed1', 'feed2'])
+
+    assert scheduler.pop_due(now=0) == ['feed1', 'feed2']
+    scheduler.record('feed1', now=100)
+    scheduler.record('feed2', now=0)
+    assert not scheduler.pop_due(now=200)
+    assert scheduler.pop_due(now=300) == ['feed2']
+    assert scheduler.pop_due(now=400) == ['feed1']
+
+def test_busy_feed_polled_more_often_than_quiet_feed():
+    """Tests that the interval follows the observed publication rate within bounds."""
+    scheduler = load_scheduler(['busy', 'quiet'])
+    scheduler.pop_due(now=0)
+
+    now = 0
+    for _ in range(10):
+        scheduler.record('busy', new_entries=10 if now else 50, now=now)
+        scheduler.record('quiet', new_entries=0, now=now)
+        now += 300
+
+    assert scheduler.schedules['busy'].interval == SETTINGS.min_interval
+    assert scheduler.schedules['quiet'].interval == SETTINGS.max_interval
+
+def test_failing_feed_backs_off():
+    """Tests exponential backoff of failures and reset on success."""
+    scheduler = load_scheduler(['broken'])
+    scheduler.pop_due(now=0)
+
+    intervals = []
+    for i in range(4):
+        scheduler.record('broken', failed=True, now=i)
+        intervals.append(scheduler.schedules['broken'].interval)
+    assert intervals == [600, 1200, 2400, 3600]
+
+    scheduler.record('broken', now=10)
+    assert scheduler.schedules['broken'].failures == 0
+
+def test_save_and_load_drops_removed_feeds():
+    """Tests persistence of schedules and deleting schedules of removed feeds."""
+    engine = create_engine('sqlite:///:memory:')
+    with engine.connect() as connection:
+        ensure_collection_tables(connection)
+        scheduler = FeedScheduler.load(connection, ['feed1', 'feed2'], SETTINGS)
+        scheduler.pop_due(now=0)
+        scheduler.record('feed1', now=0)
+        scheduler.record('feed2', now=0)
+        scheduler.save(connection)
+
+        reloaded = FeedScheduler.load(connection, ['feed2'], SETTINGS)
+        assert list(reloaded.schedules) == ['feed2']
+        assert reloaded.next_due_at() == 300
+        assert reloaded.pop_due(now=299) == []
+
+def test_per_feed_settings():
+    """Tests that a feed's own settings override the bounds for that feed only."""
+    engine = create_engine('sqlite:///:memory:')
+    with engine.connect() as connection:
+        ensure_collection_tables(connection)
+        scheduler = FeedScheduler.load(
+            connection, ['slow', 'normal'], SETTINGS, {'slow': {'min_interval': 1800}}
+        )
+    scheduler.pop_due(now=0)
+    scheduler.record('slow', now=0)
+    scheduler.record('normal', now=0)
+    scheduler.record('slow', new_entries=50, now=300)
+    scheduler.record('normal', new_entries=50, now=300)
+
+    assert scheduler.schedules['slow'].interval == 1800
+    assert scheduler.schedules['normal'].interval == 60
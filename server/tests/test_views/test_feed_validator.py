@@ -0,0 +1,65 @@
+"""
+Tests feed_validator.py against the local stand-in feed server.
+"""
+import pytest
+
+from tests.feed_server import FeedServer, rss_feed, article_page
+from src.views.data_acquisition.feed_validator import check_url, parse_opml, validate_feeds
+
+OPML = """<?xml version="1.0" encoding="UTF-8"?>
+<opml version="2.0">
+  <head><title>Bla bla subscriptions</title></head>
+  <body>
+    <outline text="News">
+      <outline text="Bla bla" type="rss" xmlUrl="https://www.blabla.com/feed/"/>
+      <outline text="Bla bla fi" type="rss" xmlUrl=" https://www.blabla.fi/feed/ "/>
+      <outline text="Bla bla again" type="rss" xmlUrl="https://www.blabla.com/feed/"/>
+    </outline>
+    <outline text="No feed"/>
+  </body>
+</opml>"""
+
+@pytest.mark.parametrize('url, error', [
+    ("https://www.blabla.com/feed/", None),
+    ("http://localhost:8080/feed", None),
+    ("", "Empty URL"),
+    ("ttps://www.blabla.com/feed/", "Unsupported scheme: ttps"),
+    ("www.blabla.com/feed/", "Unsupported scheme: none"),
+    ("https://www.blabla.com/my feed/", "URL contains whitespace"),
+    ("https://blabla/feed/", "Invalid host: blabla"),
+    ("https://www.blabla.com:bla/feed/", "Malformed URL")
+])
+def test_check_url(url, error):
+    """Tests that typos and malformed URLs are caught before fetching."""
+    if error is None:
+        assert check_url(url) is None
+    else:
+        assert check_url(url).startswith(error)
+
+def test_parse_opml():
+    """Tests reading the feed URLs of an OPML document once each."""
+    assert parse_opml(OPML) == ["https://www.blabla.com/feed/", "https://www.blabla.fi/feed/"]
+    with pytest.raises(ValueError):
+        parse_opml("<opml><body>")
+
+def test_validate_feeds():
+    """Tests validating working, missing, mistyped, non-feed and slow feeds at once."""
+    with FeedServer() as server:
+        server.add('/feed', rss_feed([server.url('/article1'), server.url('/article2')]))
+        server.add('/page', article_page('Not a feed'))
+        server.add('/slow', rss_feed([]), delay=2)
+        urls = [
+            server.url('/feed'), server.url('/missing'), server.url('/page'),
+            server.url('/slow'), "ttps://www.blabla.com/feed/"
+        ]
+        results = validate_feeds(urls, budget=0.5, timeout=5)
+
+    assert set(results) == set(urls)
+    assert results[server.url('/feed')]['ok']
+    assert results[server.url('/feed')]['entries'] == 2
+    assert 'HTTP 404' in results[server.url('/missing')]['error']
+    assert 'Not a valid feed' in results[server.url('/page')]['error']
+    assert 'validation budget' in results[server.url('/slow')]['error']
+    assert results["ttps://www.blabla.com/feed/"]['error'] == "Unsupported scheme: ttps"
+    # the articles of valid feeds aren't downloaded
+    assert '/article1' not in server.requests
@@ -11,6 +11,7 @@ from src.views.data_export.format_converter import (
     convert_db_to_csv,
     convert_db_to_parquet
 )
+from src.utils.html_storage import compress_html
 
 class MockRow:
     """
@@ -66,6 +67,14 @@ def test_convert_db_to_json():
     json_data = ''.join(list(convert_db_to_json(result)))
     assert json.loads(json_data) == expected_data
 
+def test_convert_db_to_json_compressed_html():
+    """
+    Tests that compressed HTML is exported as text.
+    """
+    result = MockResult([{**row, 'html': compress_html(row['html'])} for row in expected_data])
+    json_data = ''.join(list(convert_db_to_json(result)))
+    assert json.loads(json_data) == expected_data
+
 def test_convert_db_to_csv():
     """
     Tests conversion of db articles to export CSV, when articles exist.
@@ -2,9 +2,28 @@
 Tests query_processor.py route responses and functions.
 """
 from unittest.mock import patch
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.exc import SQLAlchemyError
 import pytest
 
+from src.app import create_app
+from src import config
+from src.utils.db_schema import ensure_articles_table, get_state
+from src.utils.html_storage import store_body
+from src.views.data_analysis.query_processor import build_search_query
+from tests.database_filler import fill_test_database
+
+SEARCH_PARAMS = {
+    'general_query': '', 'text_query': '', 'url_query': '',
+    'start_time': '', 'end_time': '', 'html_query': ''
+}
+QUERY_PARAMS = {'page': 1, 'per_page': 10, 'sort_by': 'url', 'sort_order': 'asc'}
+
+def search_urls(connection, **search_params):
+    """Runs a search on the connection and returns the URLs found."""
+    (query, _, _), sql_params = build_search_query({**SEARCH_PARAMS, **search_params}, QUERY_PARAMS)
+    return [row.url for row in connection.execute(text(query), sql_params)]
+
 @pytest.mark.usefixtures("setup_and_teardown")
 def test_get_search_results(client):
     """
@@ -144,3 +163,243 @@ def test_get_search_results_with_escaped_characters(client):
     assert response.status_code == 200
     assert isinstance(response.json, dict)
     assert 'data' in response.json
+
+def test_build_search_query_with_body_store(setup_and_teardown):
+    """
+    Tests that an HTML query finds both articles with their HTML in the body store
+    and articles with plain HTML from the original collector.
+    """
+    ensure_articles_table(setup_and_teardown)
+    body_hash, _ = store_body(setup_and_teardown, '<p>Bla bla squeezed</p>')
+    setup_and_teardown.execute(
+        text("INSERT INTO articles (url, body_hash, full_text) VALUES (:url, :hash, :full_text)"),
+        {'url': 'https://blabla.com/compressed', 'hash': body_hash, 'full_text': 'Bla bla'}
+    )
+    (query, count_query, _), sql_params = build_search_query(
+        {
+            'general_query': '', 'text_query': '', 'url_query': '',
+            'start_time': '', 'end_time': '', 'html_query': 'squeezed OR "<p>Html 2</p>"'
+        },
+        {'page': 1, 'per_page': 10, 'sort_by': 'url', 'sort_order': 'asc'}
+    )
+    rows = setup_and_teardown.execute(text(query), sql_params).fetchall()
+    assert setup_and_teardown.execute(text(count_query), sql_params).scalar() == 2
+    assert [row.url for row in rows] == [
+        'https://blabla.com/article2', 'https://blabla.com/compressed'
+    ]
+
+def test_search_index_follows_articles(setup_and_teardown):
+    """
+    Tests that the full-text index is built for existing articles and follows
+    inserts, updates and deletes, and that general queries match words, URLs and times.
+    """
+    connection = setup_and_teardown
+    ensure_articles_table(connection, substrings=True)
+    assert search_urls(connection, text_query='text 2') == ['https://blabla.com/article2']
+    assert search_urls(connection, general_query='blabla.com NOT 2016-06') == []
+    assert len(search_urls(connection, general_query='2016-06-06')) == 2
+
+    connection.execute(text("""
+        INSERT INTO articles (url, full_text, title, time)
+        VALUES ('https://news.fi/uutinen', 'Pääkirjoitus: Maailmansota', 'Otsikko',
+            '2020-01-01 10:00:00')
+    """))
+    assert search_urls(connection, general_query='pääkirjoitus OR otsikko') == [
+        'https://news.fi/uutinen'
+    ]
+    assert search_urls(connection, text_query='otsikko') == []
+    # parts of URLs and words are found through the trigram index
+    assert search_urls(connection, url_query='ews.f') == ['https://news.fi/uutinen']
+    assert search_urls(connection, text_query='sota') == ['https://news.fi/uutinen']
+    assert search_urls(connection, general_query='KIRJOITUS') == ['https://news.fi/uutinen']
+    # and words too short for it from their starts
+    assert search_urls(connection, text_query='pa') == ['https://news.fi/uutinen']
+    assert search_urls(connection, text_query='ta') == []
+    assert search_urls(connection, general_query='%KIRJOIT%') == ['https://news.fi/uutinen']
+    assert search_urls(connection, text_query='%kirj_itus') == ['https://news.fi/uutinen']
+
+    connection.execute(text(
+        "UPDATE articles SET full_text = 'Updated text' WHERE url = 'https://news.fi/uutinen'"
+    ))
+    assert search_urls(connection, text_query='pääkirjoitus') == []
+    assert search_urls(connection, text_query='updated', url_query='news.fi') == [
+        'https://news.fi/uutinen'
+    ]
+
+    connection.execute(text("DELETE FROM articles WHERE url = 'https://blabla.com/article1'"))
+    assert search_urls(connection, text_query='full text') == ['https://blabla.com/article2']
+    assert search_urls(connection, text_query='NOT full') == ['https://news.fi/uutinen']
+    # the general query and the advanced ones all have to match
+    assert search_urls(connection, general_query='text', url_query='article2') == [
+        'https://blabla.com/article2'
+    ]
+    assert search_urls(connection, general_query='updated', text_query='full') == []
+
+def test_search_index_built_again_after_interrupted_build(setup_and_teardown):
+    """
+    Tests that a built index is left as it is, and that one without a finished
+    build, like after a failed or killed rebuild, is built again from the articles.
+    """
+    connection = setup_and_teardown
+    connection.execute(text(
+        "INSERT INTO article_substrings (article_substrings) VALUES ('delete-all')"
+    ))
+    ensure_articles_table(connection, substrings=True)
+    assert search_urls(connection, text_query='text') == []
+
+    connection.execute(text("DELETE FROM pipeline_state WHERE key = 'article_substrings_built'"))
+    ensure_articles_table(connection, substrings=True)
+    assert len(search_urls(connection, text_query='text')) == 2
+    assert get_state(connection, 'article_substrings_built') == '1'
+
+def test_get_search_results_cursor_pagination(client, committed_articles):
+    """
+    Tests that following the next cursors goes through the same pages as page numbers,
+    that the previous cursors come back, and that a bad cursor is refused.
+    """
+    query = {'textQuery': 'paged', 'per_page': 10}
+    response = client.get('/api/articles/search', query_string=query).json
+    assert response['prev_cursor'] is None
+    pages = [[item['url'] for item in response['data']]]
+    cursors = [response]
+    while response['next_cursor']:
+        response = client.get('/api/articles/search', query_string={
+            **query, 'cursor': response['next_cursor'], 'page': len(pages) + 1
+        }).json
+        pages.append([item['url'] for item in response['data']])
+        cursors.append(response)
+    assert [url for page in pages for url in page] == committed_articles
+    assert response['page'] == 3
+    page_two = client.get('/api/articles/search', query_string={**query, 'page': 2}).json
+    assert [item['url'] for item in page_two['data']] == pages[1]
+
+    back = client.get('/api/articles/search', query_string={
+        **query, 'cursor': cursors[2]['prev_cursor']
+    }).json
+    assert [item['url'] for item in back['data']] == pages[1]
+    back = client.get('/api/articles/search', query_string={
+        **query, 'cursor': back['prev_cursor']
+    }).json
+    assert [item['url'] for item in back['data']] == pages[0]
+    assert back['prev_cursor'] is None
+
+    # the cursor keeps the sort order of its page
+    ascending = client.get('/api/articles/search', query_string={
+        **query, 'sort_by': 'url', 'sort_order': 'asc'
+    }).json
+    following = client.get('/api/articles/search', query_string={
+        **query, 'cursor': ascending['next_cursor']
+    }).json
+    assert following['data'][0]['url'] == sorted(committed_articles)[10]
+
+    invalid = client.get('/api/articles/search', query_string={'cursor': 'bla'})
+    assert invalid.status_code == 400
+    assert invalid.json['message'] == "Invalid cursor"
+
+def test_get_search_results_result_set(client, committed_articles):
+    """
+    Tests that a search stores its results as a set whose handle is returned, that
+    the set is reused for the same search and that a search of all articles has none.
+    """
+    query = {'urlQuery': 'paged1', 'per_page': 5}
+    first = client.get('/api/articles/search', query_string=query).json
+    assert first['result'] and first['total_count'] == 10
+    following = client.get('/api/articles/search', query_string={
+        **query, 'page': 2, 'result': first['result']
+    }).json
+    assert following['result'] == first['result']
+    assert following['total_count'] == 10
+
+    other = client.get('/api/articles/search', query_string={
+        'urlQuery': 'paged2', 'result': first['result']
+    }).json
+    assert other['result'] != first['result']
+    assert other['total_count'] == 5
+    everything = client.get('/api/articles/search').json
+    assert everything['result'] is None
+    assert everything['total_count'] == len(committed_articles)
+
+def test_result_sets_kept_apart_from_articles(tmp_path):
+    """
+    Tests that result sets are stored in their own database file, not the articles'
+    one, and that reading a set only marks it used once in a while.
+    """
+    database_url = f"sqlite:///{tmp_path}/data.db"
+    engine = create_engine(database_url)
+    with engine.begin() as connection:
+        fill_test_database(connection)
+    with patch.object(config.TestConfig, 'DATABASE_URL', database_url):
+        app = create_app(testing=True)
+    client = app.test_client()
+    query = {'urlQuery': 'article', 'per_page': 1}
+    handle = client.get('/api/articles/search', query_string=query).json['result']
+    results = create_engine(f"sqlite:///{tmp_path}/search_results.db")
+    assert not inspect(engine).has_table('search_results')
+    with results.connect() as connection:
+        assert connection.execute(text("SELECT COUNT(*) FROM search_result_ids")).scalar() == 2
+        used_at = connection.execute(text("SELECT used_at FROM search_results")).scalar()
+
+    app.search_cache.clear()
+    client.get('/api/articles/search', query_string={**query, 'page': 2, 'result': handle})
+    with results.connect() as connection:
+        assert connection.execute(text("SELECT used_at FROM search_results")).scalar() == used_at
+    app.search_cache.clear()
+    with patch('src.views.data_analysis.result_sets.time.time', return_value=used_at + 120):
+        client.get('/api/articles/search', query_string={**query, 'result': handle})
+    with results.connect() as connection:
+        assert connection.execute(text("SELECT used_at FROM search_results")).scalar() == (
+            used_at + 120
+        )
+    app.db_engine.dispose()
+    results.dispose()
+    engine.dispose()
+
+def test_url_fragments_found_without_trigram_index(tmp_path):
+    """
+    Tests that with the default config, without the trigram index, URL fragments
+    are still found anywhere in the URLs and other text.
+    """
+    database_url = f"sqlite:///{tmp_path}/data.db"
+    engine = create_engine(database_url)
+    with engine.begin() as connection:
+        fill_test_database(connection)
+    with patch.object(config.TestConfig, 'DATABASE_URL', database_url), \
+         patch.object(config.TestConfig, 'SEARCH_SUBSTRINGS', False):
+        app = create_app(testing=True)
+    assert not inspect(engine).has_table('article_substrings')
+
+    client = app.test_client()
+    for query, found in (({'urlQuery': 'abla.com/art'}, 2), ({'urlQuery': 'ticle2'}, 1),
+                         ({'generalQuery': 'la.com/article2'}, 1)):
+        response = client.get('/api/articles/search', query_string=query)
+        assert response.status_code == 200
+        assert len(response.json['data']) == found
+    app.db_engine.dispose()
+    engine.dispose()
+
+def test_original_articles_table_upgraded_at_start(tmp_path):
+    """
+    Tests that the app upgrades an original collector's articles table when it starts,
+    with the trigram index only while it's turned on, and that searches only read the schema.
+    """
+    database_url = f"sqlite:///{tmp_path}/data.db"
+    engine = create_engine(database_url)
+    with engine.begin() as connection:
+        fill_test_database(connection)
+    with patch.object(config.TestConfig, 'DATABASE_URL', database_url):
+        app = create_app(testing=True)
+    assert inspect(engine).has_table('article_search')
+    assert inspect(engine).has_table('article_substrings')
+    with patch.object(config.TestConfig, 'DATABASE_URL', database_url), \
+         patch.object(config.TestConfig, 'SEARCH_SUBSTRINGS', False):
+        create_app(testing=True).db_engine.dispose()
+    # turned off, the trigram index is dropped
+    assert not inspect(engine).has_table('article_substrings')
+
+    with engine.begin() as connection:
+        connection.execute(text("DROP VIEW article_contents"))
+    response = app.test_client().get('/api/articles/search', query_string={'textQuery': 'full'})
+    assert response.status_code == 500
+    assert 'article_contents' not in inspect(engine).get_view_names()
+    app.db_engine.dispose()
+    engine.dispose()
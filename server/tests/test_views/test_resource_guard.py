@@ -0,0 +1,50 @@
+"""
+Tests resource_guard.py levels against fake cgroup files and thresholds.
+"""
+from src.views.data_acquisition.resource_guard import ResourceGuard, ResourceLimits
+
+# far more than any test machine has free
+HUGE_MB = 10 ** 12
+
+def write_memory(cgroup_root, usage, limit):
+    """Writes cgroup v2 memory files."""
+    (cgroup_root / 'memory.current').write_text(str(usage), encoding='utf-8')
+    (cgroup_root / 'memory.max').write_text(str(limit), encoding='utf-8')
+
+def test_guard_disk_levels(tmp_path):
+    """Tests that short disk space first skips HTML and then pauses."""
+    limits = ResourceLimits(html_free_disk_mb=0, min_free_disk_mb=0)
+    guard = ResourceGuard(str(tmp_path), limits, cgroup_root=str(tmp_path))
+    assert guard.check().level == 'ok'
+    assert guard.check().as_dict() is None
+
+    limits.html_free_disk_mb = HUGE_MB
+    state = guard.check()
+    assert state.level == 'skip_html'
+    assert state.at_least('throttle') and not state.at_least('pause')
+
+    limits.min_free_disk_mb = HUGE_MB
+    assert guard.check().level == 'pause'
+    assert 'free on the data volume' in guard.worst.reasons[0]
+
+def test_guard_memory_levels(tmp_path):
+    """Tests throttling and pausing by the share of the memory limit in use."""
+    guard = ResourceGuard(None, ResourceLimits(), cgroup_root=str(tmp_path))
+    write_memory(tmp_path, 50, 100)
+    assert guard.check().level == 'ok'
+
+    write_memory(tmp_path, 85, 100)
+    assert guard.check().level == 'throttle'
+
+    write_memory(tmp_path, 97, 100)
+    assert guard.check().level == 'pause'
+
+    write_memory(tmp_path, 50, 100)
+    assert guard.check().level == 'ok'
+    assert guard.worst.level == 'pause'
+
+def test_guard_for_database(tmp_path):
+    """Tests that the guard watches the volume of an SQLite file and nothing for memory DBs."""
+    guard = ResourceGuard.for_database(f"sqlite:///{tmp_path}/data.db")
+    assert guard.data_dir == str(tmp_path)
+    assert ResourceGuard.for_database('sqlite:///:memory:').data_dir is None
@@ -0,0 +1,105 @@
+"""
+Tests search_cache.py and the caching of search responses and statistics.
+"""
+from unittest.mock import patch
+from sqlalchemy import create_engine, text
+
+from src.utils.db_schema import ensure_articles_table
+from src.utils.search_cache import SearchCache
+
+def make_cache(tmp_path, **kwargs):
+    """Cache of a new database file with an articles table, its version already read."""
+    engine = create_engine(f"sqlite:///{tmp_path}/data.db")
+    with engine.begin() as connection:
+        ensure_articles_table(connection)
+    cache = SearchCache(engine, **kwargs)
+    assert cache.get('a') is None
+    return cache
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    """Tests that the cache keeps its size, dropping the entry used longest ago."""
+    cache = make_cache(tmp_path, size=2)
+    cache.put('a', 1, cache.version())
+    cache.put('b', 2, cache.version())
+    assert cache.get('a') == 1
+    cache.put('c', 3, cache.version())
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+
+    off = SearchCache(cache.engine, size=0)
+    off.put('a', 1, off.version())
+    assert off.get('a') is None
+
+def test_cache_entries_expire(tmp_path):
+    """Tests that entries older than max_age aren't returned."""
+    cache = make_cache(tmp_path, max_age=10)
+    with patch('src.utils.search_cache.time.monotonic', return_value=100):
+        cache.put('a', 1, cache.version())
+    with patch('src.utils.search_cache.time.monotonic', return_value=105):
+        assert cache.get('a') == 1
+    with patch('src.utils.search_cache.time.monotonic', return_value=111):
+        assert cache.get('a') is None
+
+def test_searches_cached_until_articles_change(client, engine, committed_articles):
+    """
+    Tests that a repeated search is answered from the cache and that a committed
+    article empties it.
+    """
+    query = {'textQuery': 'paged', 'per_page': 5}
+    first = client.get('/api/articles/search', query_string=query)
+    assert first.status_code == 200
+    assert first.json['total_count'] == len(committed_articles)
+
+    with patch('src.views.data_analysis.query_processor.run_search') as run_search:
+        cached = client.get('/api/articles/search', query_string=query)
+    run_search.assert_not_called()
+    assert cached.json == first.json
+
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO articles (url, full_text) VALUES ('https://blabla.com/new', 'Paged new')"
+        ))
+    changed = client.get('/api/articles/search', query_string=query)
+    assert changed.json['total_count'] == len(committed_articles) + 1
+
+    stats = client.get('/api/articles/statistics')
+    assert stats.status_code == 200
+    with patch('src.views.data_analysis.stats_analyzer.filter_condition') as condition:
+        assert client.get('/api/articles/statistics').json == stats.json
+    condition.assert_not_called()
+
+def test_cache_sees_commits_of_other_connections(tmp_path):
+    """Tests with a database file that changes committed elsewhere empty the cache."""
+    cache = make_cache(tmp_path)
+    engine = cache.engine
+    cache.put('a', 1, cache.version())
+    assert cache.get('a') == 1
+
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO articles (url) VALUES ('https://blabla.com/a')"))
+    assert cache.get('a') is None
+    # a new articles table gets a new version too
+    cache.put('a', 1, cache.version())
+    with engine.begin() as connection:
+        connection.execute(text("DROP VIEW article_contents"))
+        connection.execute(text("DROP TABLE articles"))
+        ensure_articles_table(connection)
+    assert cache.get('a') is None
+    engine.dispose()
+
+def test_value_computed_during_a_change_not_cached(tmp_path):
+    """
+    Tests that a value whose computing started before a change was committed isn't
+    cached, also when another request saw the change before the value was put.
+    """
+    cache = make_cache(tmp_path)
+    version = cache.version()
+    with cache.engine.begin() as connection:
+        connection.execute(text("INSERT INTO articles (url) VALUES ('https://blabla.com/a')"))
+    assert cache.get('b') is None
+    cache.put('a', 1, version)
+    assert cache.get('a') is None
+
+    cache.put('a', 2, cache.version())
+    assert cache.get('a') == 2
+    cache.engine.dispose()
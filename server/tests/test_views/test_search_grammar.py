@@ -0,0 +1,130 @@
+"""
+Tests search_grammar.py parsing, normalization and compiling.
+"""
+from src.views.data_analysis.search_grammar import (
+    AllOf, AnyOf, Term, compile_search, compile_tree, normalize, parse, pattern_prefilter,
+    term_index
+)
+
+def test_parse_grammar():
+    """
+    Tests that NOT binds to the next term or group, AND is implied between terms,
+    OR separates groups and quotes and parentheses group terms.
+    """
+    assert parse('a AND b NOT c OR "d e"', 'url') == AnyOf((
+        AllOf((Term('url', 'a'), Term('url', 'b'), Term('url', 'c', True))),
+        AllOf((Term('url', 'd e'),))
+    ))
+    # NOT is pushed down to the terms of a group
+    assert normalize(parse('a NOT (b OR c)', 'full_text')) == AllOf((
+        Term('full_text', 'a', index='article_search'),
+        Term('full_text', 'b', True, 'article_search'),
+        Term('full_text', 'c', True, 'article_search')
+    ))
+    # dangling operators and unmatched parentheses are skipped, quoted operators are terms
+    assert parse('OR a) AND NOT', 'url') == parse('a', 'url')
+    assert parse('"OR" wiki/Foo_(bar)', 'url') == AnyOf((
+        AllOf((Term('url', 'OR'), Term('url', 'wiki/Foo_(bar'))),
+    ))
+    assert parse(' ', 'url') is None
+
+def test_normalize_folds_and_orders_terms():
+    """
+    Tests that equivalent queries have the same normal form, that index terms are
+    folded and that LIKE conditions come after the match, the cheapest first.
+    """
+    assert normalize(parse('Full  Text full', 'full_text')) == normalize(
+        parse('text AND full', 'full_text')
+    )
+    assert normalize(parse('a NOT a', 'full_text')) == AnyOf(())
+    tree = normalize(AllOf((
+        parse('ESC%x', 'html'), parse('ESC%y', 'url'), parse('word', 'general')
+    )))
+    assert [child.column for child in tree.children] == ['general', 'url', 'html']
+
+def test_compile_search_to_single_match():
+    """
+    Tests that the queries of a search become a single full-text match when the index
+    can handle all of their terms, and that compiled trees are reused.
+    """
+    condition, params = compile_search({
+        'general': 'bla', 'full_text': 'Full AND text NOT 3 OR "other words"', 'url': ''
+    })
+    assert condition == (
+        "id IN (SELECT rowid FROM article_search WHERE article_search MATCH :search_match_0)"
+    )
+    assert params == {'search_match_0': (
+        '({title full_text url time} : "bla"*) AND ((full_text : "other words"*) OR '
+        '(((full_text : "full"*) AND (full_text : "text"*)) NOT (full_text : "3"*)))'
+    )}
+    compile_tree.cache_clear()
+    compile_search({'full_text': 'a b'})
+    compile_search({'full_text': 'b a'})
+    assert compile_tree.cache_info().hits == 1
+
+def test_compile_search_with_like_conditions():
+    """
+    Tests that ESC patterns, NOTEXT and HTML terms become LIKE conditions after the
+    match of their group, and that negated index terms alone are excluded by one match.
+    """
+    condition, params = compile_search({'general': 'Full ESC%text OR NOT NOTEXT'})
+    assert condition.index("MATCH :search_match_0") < condition.index("LIKE :search_like_1 ESCAPE")
+    assert "NOT (full_text IS NULL OR full_text = '' OR url IS NULL OR url = '')" in condition
+    assert params == {
+        'search_match_0': '{title full_text url time} : "full"*', 'search_like_1': r'\%text'
+    }
+
+    condition, params = compile_search({'full_text': 'NOT a NOT b', 'html': '<p>'})
+    assert condition == (
+        "(id NOT IN (SELECT rowid FROM article_search WHERE article_search MATCH "
+        ":search_match_0) AND (html_text(html) LIKE :search_like_1))"
+    )
+    assert params == {
+        'search_match_0': 'full_text : "a"* OR full_text : "b"*', 'search_like_1': '%<p>%'
+    }
+    assert compile_search({}) == ("1=1", {})
+
+def test_terms_routed_to_indexes():
+    """
+    Tests that with the trigram index terms long enough for it go there as substrings
+    and shorter ones to the word index, that without it words go to the word index and
+    URL and other terms to LIKE conditions, and that patterns are narrowed down by the
+    trigram index before their LIKE conditions.
+    """
+    assert term_index(Term('full_text', 'forest fire'), True) == 'article_substrings'
+    assert term_index(Term('general', 'sota'), True) == 'article_substrings'
+    assert term_index(Term('url', 'abla.co'), True) == 'article_substrings'
+    assert term_index(Term('url', 'fi'), True) == 'article_search'
+    assert term_index(Term('full_text', 'forest fire')) == 'article_search'
+    assert term_index(Term('url', '.-')) is None
+    assert term_index(Term('url', 'abla')) is None
+    assert term_index(Term('general', 'abla.co')) is None
+    assert term_index(Term('general', 'forest fire')) == 'article_search'
+    assert term_index(Term('full_text', '%kirjoit'), True) is None
+    assert term_index(Term('html', 'bla'), True) is None
+    assert pattern_prefilter(Term('general', 'kirj%tus_x')) == (
+        '{title full_text url time} : "kirj" AND {title full_text url time} : "tus"'
+    )
+    assert pattern_prefilter(Term('full_text', 'a%b')) is None
+
+    condition, params = compile_search(
+        {'url': 'Blabla.COM/paged1 NOT fi', 'full_text': 'Sota'}, substrings=True
+    )
+    assert condition == (
+        "(id IN (SELECT rowid FROM article_substrings WHERE article_substrings MATCH "
+        ":search_match_0) AND id NOT IN (SELECT rowid FROM article_search WHERE "
+        "article_search MATCH :search_match_1))"
+    )
+    assert params == {
+        'search_match_0': '(url : "blabla.com/paged1") AND (full_text : "sota")',
+        'search_match_1': 'url : "fi"*'
+    }
+    condition, params = compile_search({'full_text': '%kirjoit%'}, substrings=True)
+    assert condition == (
+        "(id IN (SELECT rowid FROM article_substrings WHERE article_substrings MATCH "
+        ":search_match_1) AND (full_text LIKE :search_like_0))"
+    )
+    assert params == {'search_like_0': '%%kirjoit%%', 'search_match_1': 'full_text : "kirjoit"'}
+    assert compile_search({'full_text': '%kirjoit%'}) == (
+        "(full_text LIKE :search_like_0)", {'search_like_0': '%%kirjoit%%'}
+    )
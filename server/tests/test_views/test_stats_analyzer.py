@@ -2,9 +2,13 @@
 Tests stats_analyzer.py route responses and functions.
 """
 from unittest.mock import patch
+from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 import pytest
 
+from src.utils.db_schema import ensure_articles_table
+from src.utils.html_storage import store_body
+
 @pytest.mark.usefixtures("setup_and_teardown")
 def test_get_stats(client):
     """
@@ -85,3 +89,43 @@ def test_get_data_size_error(client):
         assert response.status_code == 500
         assert response.json['status'] == "error"
         assert "Test error" in response.json['message']
+
+def test_get_data_size_dedup(client, engine):
+    """
+    Tests reporting the articles sharing a stored page and the space that saves.
+    """
+    with engine.begin() as connection:
+        ensure_articles_table(connection)
+        for _ in range(3):
+            store_body(connection, '<p>Bla bla syndicated</p>' * 100)
+    try:
+        with patch('os.path.exists', return_value=True), \
+             patch('os.path.getsize', return_value=1024 * 1024):
+            response = client.get('/api/data_size')
+    finally:
+        with engine.begin() as connection:
+            connection.execute(text("DROP VIEW article_contents"))
+            connection.execute(text("DROP TABLE article_bodies"))
+            connection.execute(text("DROP TABLE articles"))
+    assert response.status_code == 200
+    assert response.json['duplicate_articles'] == 2
+    assert response.json['dedup_saved'].endswith(' bytes')
+
+def test_get_stats_result_set(client, committed_articles):
+    """
+    Tests that filtered statistics and full texts are those of the search result set
+    of the handle, and all articles without a handle.
+    """
+    search = client.get('/api/articles/search', query_string={'urlQuery': 'paged2'}).json
+    filtered = {'filtered': 'true', 'result': search['result']}
+    stats = client.get('/api/articles/statistics', query_string=filtered).json
+    assert stats[0] == [{'name': 'blabla.com', 'count': 5}]
+    texts = client.get('/api/articles/full_text', query_string=filtered).json
+    assert sorted(item['full_text'] for item in texts) == [
+        f'Paged text {i}' for i in range(20, 25)
+    ]
+    unfiltered = client.get('/api/articles/statistics', query_string={'filtered': 'true'}).json
+    assert unfiltered[0] == [{'name': 'blabla.com', 'count': len(committed_articles)}]
+
+    expired = client.get('/api/articles/full_text', query_string={**filtered, 'result': 'bla'})
+    assert expired.status_code == 404
@@ -0,0 +1,23 @@
+"""
+Tests status_stream.py events.
+"""
+import json
+
+from src.utils.cycle_progress import CycleProgress
+
+def test_stream_cycle_progress(client):
+    """Tests that /stream sends the processing status and the running cycle's progress."""
+    CycleProgress.set_progress({'phase': 'collecting', 'feeds_done': 1, 'feeds_total': 4})
+    try:
+        response = client.get('/stream', buffered=False)
+        events = response.response
+        status_event = next(events).decode('utf-8')
+        progress_event = next(events).decode('utf-8')
+        response.close()
+    finally:
+        CycleProgress.set_progress(None)
+
+    assert status_event == "event: processing_status\ndata: false\n\n"
+    event, data = progress_event.strip().split('\n')
+    assert event == "event: cycle_progress"
+    assert json.loads(data.removeprefix('data: '))['feeds_done'] == 1
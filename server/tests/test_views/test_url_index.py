@@ -0,0 +1,55 @@
+"""
+Tests url_index.py canonicalization and seen-URL selection.
+"""
+from sqlalchemy import create_engine, text
+
+from src.utils.db_schema import ensure_articles_table
+from src.views.data_acquisition.acquisition_engine import FeedEntry
+from src.views.data_acquisition.url_index import (
+    SeenUrlIndex,
+    canonicalize_url,
+    url_key
+)
+
+def test_canonicalize_url():
+    """Tests stripping tracking parameters, fragments, default ports and host case."""
+    assert canonicalize_url(
+        'HTTPS://Blabla.com:443/article1?id=5&utm_source=rss&fbclid=abc#comments'
+    ) == 'https://blabla.com/article1?id=5'
+    assert canonicalize_url('http://blabla.com') == 'http://blabla.com/'
+    assert canonicalize_url('http://blabla.com:8080/a?b=') == 'http://blabla.com:8080/a?b='
+    assert url_key('https://blabla.com/article1?utm_medium=feed') == (
+        url_key('https://blabla.com/article1')
+    )
+
+def test_seen_url_index_selects_unseen():
+    """Tests backfilling old rows and skipping known and repeated URLs."""
+    engine = create_engine('sqlite:///:memory:')
+    with engine.connect() as connection:
+        connection.execute(text("CREATE TABLE articles (id INTEGER PRIMARY KEY, url TEXT)"))
+        connection.execute(text(
+            "INSERT INTO articles (url) VALUES ('https://blabla.com/article1')"
+        ))
+        ensure_articles_table(connection)
+
+        index = SeenUrlIndex.load(connection)
+        assert connection.execute(text("SELECT url_key FROM articles")).scalar() == (
+            url_key('https://blabla.com/article1')
+        )
+
+        entries = [
+            FeedEntry('https://blabla.com/article1?utm_source=rss', 'feed'),
+            FeedEntry('https://blabla.com/article2', 'feed'),
+            FeedEntry('https://blabla.com/article2#top', 'feed')
+        ]
+        unseen = index.select_unseen(connection, entries)
+        assert [entry.link for entry in unseen] == ['https://blabla.com/article2']
+
+        # more keys than one lookup takes
+        many = [FeedEntry(f'https://blabla.com/many{i}', 'feed') for i in range(1200)]
+        connection.execute(text(
+            "INSERT INTO articles (url, url_key) VALUES ('https://blabla.com/many1100', :key)"
+        ), {'key': url_key('https://blabla.com/many1100')})
+        unseen = index.select_unseen(connection, many)
+        assert len(unseen) == 1199
+        assert 'https://blabla.com/many1100' not in {entry.link for entry in unseen}